@@ -51,25 +51,16 @@ def main():
             if not image_record or image_record.Width == '?':
 
                 # Inject thumb if available
-                img_record_id = None
+                img_primary_key, img_did_upload = None, False
                 if thumb_path is not None:
                     fmp.layout = FMP_IMAGES_LAYOUT
-                    img_record_id = _inject_image(fmp, fmp_thumb_data)
+                    img_primary_key, img_did_upload = _inject_image(fmp, fmp_thumb_data)
                     print(f'Injected image {fmp_thumb_data}')
 
-                # Check to make sure it injected correctly, if not try again
-                if img_record_id is not None:
-                    new_img = fmp.get_record(img_record_id)
-                    if new_img.Width == '?':
-                        img_record_id = _inject_image(fmp, fmp_thumb_data)
-                        print(f'Injected image {fmp_thumb_data}')
-
-                # Run process img script
-                if img_record_id is not None and img_record_id != -1:
-                    img_primary_key = _get_image_primary_key(fmp, img_record_id)
-                    if img_primary_key is not None:
-                        script_res = _run_process_image_script(fmp, img_primary_key)
-                        print(f'Ran process image script for record {img_primary_key}')
+                # Run process img script once the image has uploaded
+                if img_did_upload:
+                    script_res = _run_process_image_script(fmp, img_primary_key)
+                    print(f'Ran process image script for record {img_primary_key}')
 
     # clear out the file
     with open(thumb_json_file, 'w') as file:
@@ -88,25 +79,15 @@ def _check_image_record_exists(fmp, fmp_thumb_data):
 
 
 def _inject_image(fmp, fmp_thumb_data):
-    img_record_id = None
-    try:
-        thumb_file = open(fmp_thumb_data.get('Path'), 'rb')
-        img_record_id = fmp.create_record(fmp_thumb_data)
-        img_did_upload = fmp.upload_container(img_record_id, field_name='Image', file_=thumb_file)
-        thumb_file.close()
-    except:
-        pass
-    return img_record_id
-
-
-def _get_image_primary_key(fmp, img_record_id):
-    img_primary_key = None
+    img_primary_key, img_did_upload = None, False
     try:
-        img_record = fmp.get_record(img_record_id)
-        img_primary_key = img_record.PrimaryKey
+        with open(fmp_thumb_data.get('Path'), 'rb') as thumb_file:
+            img_record_id, img_fields = fmp.create_record_and_fetch(fmp_thumb_data, ['PrimaryKey'])
+            img_primary_key = img_fields['PrimaryKey']
+            img_did_upload = fmp.upload_container(img_record_id, field_name='Image', file_=thumb_file)
     except:
         pass
-    return img_primary_key
+    return img_primary_key, img_did_upload
 
 
 def _run_process_image_script(fmp, img_primary_key):
@@ -1,7 +1,9 @@
 #!/usr/bin/env python3
 
 import argparse
+from python.distant_vfx.filesystem import TransferCostModel
 from python.distant_vfx.jobs import chunk_to_new_packages
+from python.distant_vfx.transfer import LINK_MODES, HASH_ALGORITHMS
 
 
 # A quick entry point for the chunk_to_new_packages job.
@@ -11,21 +13,112 @@ def main():
     parser.add_argument('-o', '--output',
                         action='store',
                         type=str,
-                        required=True,
-                        help='<required> Specify an output directory.')
+                        help='<required> Specify an output directory (not needed with --resume).')
     parser.add_argument('-m', '--move',
                         action='store_true',
                         help='Set chunk operation to move (rather than copy).')
     parser.add_argument('-i', '--input',
                         action='store',
                         nargs='+',
-                        required=True,
-                        help='<required> Specify one or more directory paths whose contents should be chunked.')
+                        help='<required> Specify one or more directory paths whose contents should be chunked (not '
+                             'needed with --resume).')
+    parser.add_argument('-c', '--cache',
+                        action='store',
+                        type=str,
+                        help='Specify a size cache file. Directories unchanged since the last run using the same '
+                             'cache file are not re-scanned.')
+    parser.add_argument('-s', '--split-sequences',
+                        action='store_true',
+                        help='Allow folders larger than the target package size to be split up, and image sequences '
+                             'to be split into frame ranges across packages.')
+    parser.add_argument('-w', '--workers',
+                        action='store',
+                        type=int,
+                        default=8,
+                        help='The number of files to copy concurrently. Defaults to 8.')
+    parser.add_argument('-l', '--link',
+                        action='store',
+                        choices=LINK_MODES,
+                        help='When the output is on the same filesystem as the input, place files by reflink and/or '
+                             'hard link instead of copying them (falls back to a copy if linking fails).')
+    parser.add_argument('-v', '--verify',
+                        action='store',
+                        nargs='?',
+                        const='md5',
+                        choices=HASH_ALGORITHMS,
+                        metavar='ALGORITHM',
+                        help='Hash each file as it is copied (md5 unless another algorithm is given), read the copy '
+                             'back to check it has the same digest, and record the digests in the job journal. '
+                             'Linked files share the source data and are not hashed. Algorithms: {}.'
+                             .format(', '.join(HASH_ALGORITHMS)))
+    parser.add_argument('--stream',
+                        action='store_true',
+                        help='Start copying each package as soon as its bin is full, while the rest of the input is '
+                             'still being scanned. Packing is less even than the default mode.')
+    parser.add_argument('-n', '--num-packages',
+                        action='store',
+                        type=int,
+                        help='Pack into exactly this many packages of roughly equal size (e.g. one per transfer '
+                             'slot), keeping the items of each shot together where possible. Not available with '
+                             '--stream.')
+    parser.add_argument('-b', '--bandwidth',
+                        action='store',
+                        type=float,
+                        help='Balance packages by estimated transfer time rather than size, assuming this transfer '
+                             'rate in MB/s. Use with --file-overhead for packages of many small files.')
+    parser.add_argument('--file-overhead',
+                        action='store',
+                        type=float,
+                        help='The fixed transfer cost of each file in seconds, when balancing by transfer time. '
+                             'Defaults to 0.05.')
+    parser.add_argument('--item-overhead',
+                        action='store_true',
+                        help='Charge the --file-overhead once per packed item (folder or sequence) instead of once '
+                             'per file.')
+    parser.add_argument('-p', '--plan',
+                        action='store_true',
+                        help='Print the package plan (size, file count and predicted transfer time of each package) '
+                             'without copying anything.')
+    parser.add_argument('-j', '--journal',
+                        action='store',
+                        type=str,
+                        help='Specify the path of the job journal. Defaults to a timestamped file in the output '
+                             'directory.')
+    parser.add_argument('-r', '--resume',
+                        action='store',
+                        type=str,
+                        metavar='JOURNAL',
+                        help='Resume an interrupted chunk job from its journal file, reusing its packages and skipping '
+                             'items that were already copied.')
 
     args = parser.parse_args()
+    if args.resume:
+        chunk_to_new_packages.resume(args.resume, max_workers=args.workers)
+        return
+    if not args.input or not (args.output or args.plan):
+        parser.error('the following arguments are required: -o/--output, -i/--input')
+    if args.num_packages is not None and (args.num_packages < 1 or args.stream):
+        parser.error('-n/--num-packages must be at least 1 and cannot be used with --stream')
+    cost_model = None
+    if args.bandwidth or args.file_overhead is not None:
+        cost_model = TransferCostModel(count_files=not args.item_overhead)
+        if args.bandwidth:
+            cost_model.bytes_per_second = args.bandwidth * 1048576
+        if args.file_overhead is not None:
+            cost_model.seconds_per_file = args.file_overhead
     chunk_to_new_packages.main(args.output,
                                args.input,
-                               should_move=args.move)
+                               should_move=args.move,
+                               cache_path=args.cache,
+                               split_sequences=args.split_sequences,
+                               max_workers=args.workers,
+                               link_mode=args.link,
+                               journal_path=args.journal,
+                               streaming=args.stream,
+                               cost_model=cost_model,
+                               plan_only=args.plan,
+                               num_chunks=args.num_packages,
+                               hash_algorithm=args.verify)
 
 
 if __name__ == '__main__':
@@ -3,11 +3,10 @@
 import argparse
 import os
 import re
-import subprocess
-import traceback
 
 from python.distant_vfx.constants import SHOT_TREE_BASE_PATH
 from python.distant_vfx.jobs import new_vendor_package
+from python.distant_vfx.transfer import TransferEngine, LINK_MODES
 
 
 def main():
@@ -39,6 +38,22 @@ def main():
              'either --dir or --pkg.'
     )
 
+    parser.add_argument(
+        '-w', '--workers',
+        action='store',
+        type=int,
+        default=8,
+        help='The number of files to copy concurrently. Defaults to 8.'
+    )
+
+    parser.add_argument(
+        '-l', '--link',
+        action='store',
+        choices=LINK_MODES,
+        help='When the destination is on the same filesystem as the shot tree, place files by reflink and/or hard '
+             'link instead of copying them (falls back to a copy if linking fails).'
+    )
+
     args = parser.parse_args()
     versions = args.versions
 
@@ -55,27 +70,25 @@ def main():
     else:
         dest = args.dir
 
-    for path in paths:
-        try:
-            _copy_version(path, dest)
-            print(f'{os.path.basename(path)} copied to {dest}')
-        except:
-            traceback.print_exc()
+    try:
+        _copy_versions(paths, dest, args.workers, args.link)
+    except OSError as e:
+        print(e)
 
 
-def _copy_version(path, destination):
+def _copy_versions(paths, destination, max_workers=8, link_mode=None):
     if not os.path.isdir(destination):
         raise OSError(f'Destination does not exist: {destination}')
-    cmd = ['cp', path, destination]
-    process = subprocess.Popen(
-        cmd,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        universal_newlines=True,
-        shell=False
-    )
-    stdout, stderr = process.communicate()
-    return stdout, stderr
+    engine = TransferEngine(max_workers=max_workers, link_mode=link_mode)
+    stats = engine.transfer([(path, destination) for path in paths])
+    failed = {path: error for path, error in stats.errors}
+    for path in paths:
+        if path in failed:
+            print(f'Error copying {os.path.basename(path)}: {failed[path]}')
+        else:
+            print(f'{os.path.basename(path)} copied to {destination}')
+    print(stats)
+    return stats
 
 
 def _get_version_path_on_disk(version):
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+import argparse
+from python.distant_vfx.jobs import fmp_benchmark
+
+
+# An entry point for benchmarking FileMaker request patterns against a local Data API stand-in
+def main():
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        '-n', '--num-records',
+        action='store',
+        type=int,
+        default=500,
+        help='The number of records to create and look up in each benchmark. Defaults to 500.'
+    )
+
+    parser.add_argument(
+        '-w', '--workers',
+        action='store',
+        type=int,
+        default=8,
+        help='The number of concurrent requests for the concurrent benchmarks. Defaults to 8.'
+    )
+
+    parser.add_argument(
+        '-l', '--latency',
+        action='store',
+        type=float,
+        default=0.05,
+        help='The latency of each request in seconds. Defaults to 0.05.'
+    )
+
+    parser.add_argument(
+        '--jitter',
+        action='store',
+        type=float,
+        default=0.0,
+        help='The maximum random delay in seconds added to the latency of each request.'
+    )
+
+    parser.add_argument(
+        '--bad-json-rate',
+        action='store',
+        type=float,
+        default=0.0,
+        help='The fraction of requests that fail with a non-JSON response, e.g. 0.02.'
+    )
+
+    parser.add_argument(
+        '--error-rate',
+        action='store',
+        type=float,
+        default=0.0,
+        help='The fraction of requests that fail with a FileMaker error.'
+    )
+
+    parser.add_argument(
+        '--serve',
+        action='store',
+        type=int,
+        nargs='?',
+        const=8443,
+        metavar='PORT',
+        help='Instead of benchmarking, run the stand-in server in the foreground (on port 8443 by default) so jobs '
+             'can be run against it.'
+    )
+
+    args = parser.parse_args()
+
+    if args.serve is not None:
+        fmp_benchmark.serve(port=args.serve,
+                            latency=args.latency,
+                            jitter=args.jitter,
+                            bad_json_rate=args.bad_json_rate,
+                            error_rate=args.error_rate)
+    else:
+        fmp_benchmark.main(num_records=args.num_records,
+                           max_workers=args.workers,
+                           latency=args.latency,
+                           jitter=args.jitter,
+                           bad_json_rate=args.bad_json_rate,
+                           error_rate=args.error_rate)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+
+import argparse
+from python.distant_vfx.jobs import fmp_outbox_flush
+
+
+# An entry point for sending the FileMaker writes queued in the outbox (FMP_OUTBOX_PATH)
+def main():
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        '-p', '--path',
+        action='store',
+        type=str,
+        help='The outbox database. Defaults to FMP_OUTBOX_PATH.'
+    )
+
+    parser.add_argument(
+        '-w', '--workers',
+        action='store',
+        type=int,
+        default=4,
+        help='The number of entities flushed concurrently. Defaults to 4.'
+    )
+
+    parser.add_argument(
+        '-f', '--follow',
+        action='store_true',
+        help='Keep running and flush the outbox every --interval seconds, instead of exiting once nothing is due.'
+    )
+
+    parser.add_argument(
+        '-i', '--interval',
+        action='store',
+        type=float,
+        default=5.0,
+        help='The number of seconds between flushes with --follow. Defaults to 5.'
+    )
+
+    parser.add_argument(
+        '--retry-failed',
+        action='store_true',
+        help='Retry the writes that failed too many times, before flushing.'
+    )
+
+    parser.add_argument(
+        '--status',
+        action='store_true',
+        help='Print the number of pending, done and failed writes and exit.'
+    )
+
+    args = parser.parse_args()
+
+    fmp_outbox_flush.main(outbox_path=args.path,
+                          max_workers=args.workers,
+                          follow=args.follow,
+                          interval=args.interval,
+                          retry_failed=args.retry_failed,
+                          status=args.status)
+
+
+if __name__ == '__main__':
+    main()
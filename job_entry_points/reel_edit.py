@@ -26,20 +26,11 @@ def main():
     else:
         print(f'Found reel QT: {reel_qt}')
 
-    # Find shot records in filemaker
-    print('Searching FileMaker database for shot records...')
-    records = _get_reel_versions_from_filemaker(reel)
-    if not records:
-        print(f'No shot records found for reel {reel}.')
-        sys.exit()
-    else:
-        print(f'Found records in reel {reel}.')
-
-    # Filter records to those with in-cut versions
-    print('Filtering records with in-cut versions...')
-    in_cut_records = _filter_records_with_cut_in_version(records)
+    # Find shot records with in-cut versions in filemaker
+    print('Searching FileMaker database for shot records with in-cut versions...')
+    in_cut_records = _get_reel_versions_from_filemaker(reel)
     if not in_cut_records:
-        print('No records found with in-cut versions.')
+        print(f'No shot records with in-cut versions found for reel {reel}.')
         sys.exit()
     else:
         print(f'Found {len(in_cut_records)} records with in-cut versions.')
@@ -177,9 +168,10 @@ def _get_reel_versions_from_filemaker(reel_num):
                             ) as fmp:
         fmp.login()
 
+        # Page through the reel, keeping only the in-cut version data from each record
         query = {'VFXEditorialShots::Reel': str(reel_num)}
-        records = fmp.find([query], limit=1000)
-        return records
+        records = fmp.find_iter([query], page_size=1000)
+        return _filter_records_with_cut_in_version(records)
 
 
 if __name__ == '__main__':
@@ -26,16 +26,24 @@ def main():
                              'selected, files will be copied directly to the provided output directory. Defaults to '
                              'False (new delivery packages will be created by default).')
 
+    parser.add_argument('-w', '--workers',
+                        action='store',
+                        type=int,
+                        default=8,
+                        help='The number of files to copy concurrently. Defaults to 8.')
+
     args = parser.parse_args()
 
     for item in args.input:
         if args.output:
             send_dnx.main(scan_dir=item,
                           output_dir=args.output,
-                          new_delivery=args.no_delivery)
+                          new_delivery=args.no_delivery,
+                          max_workers=args.workers)
         else:
             send_dnx.main(scan_dir=item,
-                          new_delivery=args.no_delivery)
+                          new_delivery=args.no_delivery,
+                          max_workers=args.workers)
 
 
 if __name__ == '__main__':
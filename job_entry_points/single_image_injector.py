@@ -53,18 +53,12 @@ def main():
         fmp.login()
 
         print('Injecting image...')
-        img_record_id = _inject_image(fmp, fmp_thumb_data=thumb_dict)
-        if img_record_id is not None:
-            new_img = fmp.get_record(img_record_id)
-            if new_img.Width == '?':
-                img_record_id = _inject_image(fmp, thumb_dict)
+        img_primary_key, img_did_upload = _inject_image(fmp, fmp_thumb_data=thumb_dict)
 
         # Run process img script
-        if img_record_id is not None:
-            img_primary_key = _get_image_primary_key(fmp, img_record_id)
-            if img_primary_key is not None:
-                print('Running process image script...')
-                script_res = _run_process_image_script(fmp, img_primary_key)
+        if img_did_upload:
+            print('Running process image script...')
+            script_res = _run_process_image_script(fmp, img_primary_key)
 
     print(f'Injection complete. New image primary key is {img_primary_key}')
 
@@ -81,27 +75,16 @@ def _run_process_image_script(fmp, img_primary_key):
     return script_res
 
 
-def _get_image_primary_key(fmp, img_record_id):
-    img_primary_key = None
-    try:
-        img_record = fmp.get_record(img_record_id)
-        img_primary_key = img_record.PrimaryKey
-    except:
-        print(f'Error running process image script for image {img_primary_key}')
-        traceback.print_exc()
-    return img_primary_key
-
-
 def _inject_image(fmp, fmp_thumb_data):
-    img_record_id = None
+    img_primary_key, img_did_upload = None, False
     try:
-        thumb_file = open(fmp_thumb_data.get('Path'), 'rb')
-        img_record_id = fmp.create_record(fmp_thumb_data)
-        img_did_upload = fmp.upload_container(img_record_id, field_name='Image', file_=thumb_file)
-        thumb_file.close()
+        with open(fmp_thumb_data.get('Path'), 'rb') as thumb_file:
+            img_record_id, img_fields = fmp.create_record_and_fetch(fmp_thumb_data, ['PrimaryKey'])
+            img_primary_key = img_fields['PrimaryKey']
+            img_did_upload = fmp.upload_container(img_record_id, field_name='Image', file_=thumb_file)
     except:
         traceback.print_exc()
-    return img_record_id
+    return img_primary_key, img_did_upload
 
 
 @dict_items_to_str
@@ -12,6 +12,24 @@ PACKAGE_REGEX = r'[A-Za-z]{2,3}_[A-Za-z]{2,3}_\d{6,8}(_[A-Za-z]{1,2})?'
 FMP_URL = environ.get('FMP_URL')
 FMP_USERNAME = environ.get('FMP_USERNAME')
 FMP_PASSWORD = environ.get('FMP_PASSWORD')
+FMP_SERVER_TYPE = environ.get('FMP_SERVER_TYPE', 'cloud')  # 'cloud' for FileMaker Cloud, 'server' for FileMaker Server
+FMP_CA_BUNDLE = environ.get('FMP_CA_BUNDLE')  # certificate to verify the server with, e.g. a local stand-in's
+
+# FMP session token cache (shared by all processes on the host, leave unset to log in and out per connection)
+FMP_TOKEN_CACHE_PATH = environ.get('FMP_TOKEN_CACHE_PATH')
+
+# FMP find result cache lifetime in seconds (leave unset to disable caching)
+FMP_QUERY_CACHE_TTL = environ.get('FMP_QUERY_CACHE_TTL')
+
+# FMP request metrics file (leave unset to disable), its format ('jsonl' or 'prometheus') and the number of seconds
+# between dumps (leave unset to only write at exit)
+FMP_METRICS_PATH = environ.get('FMP_METRICS_PATH')
+FMP_METRICS_FORMAT = environ.get('FMP_METRICS_FORMAT', 'jsonl')
+FMP_METRICS_INTERVAL = environ.get('FMP_METRICS_INTERVAL')
+
+# FMP write-behind outbox database (leave unset for the event plugins to write to FileMaker inline). The outbox is
+# drained by job_entry_points/fmp_outbox_flush.py
+FMP_OUTBOX_PATH = environ.get('FMP_OUTBOX_PATH')
 
 # FMP databases
 FMP_VFX_DB = environ.get('FMP_VFX_DB')
@@ -37,6 +55,13 @@ FMP_PROCESS_IMAGE_SCRIPT = environ.get('FMP_PROCESS_IMAGE_SCRIPT')
 FMP_PROCESS_TRANSFER_DATA_SCRIPT = environ.get('FMP_PROCESS_TRANSFER_DATA_SCRIPT')
 FMP_UNFLAG_OMITS_SCRIPT = environ.get('FMP_UNFLAG_OMITS_SCRIPT')
 FMP_MIDNIGHT_CHECKUP_SCRIPT = environ.get('FMP_MIDNIGHT_CHECKUP_SCRIPT')
+# Returns the current record's fields as a JSON object, given a JSON array of field names as its parameter. Run after
+# a create so the new record's fields come back in the same request (leave unset to read them with a second request)
+FMP_RECORD_FIELDS_SCRIPT = environ.get('FMP_RECORD_FIELDS_SCRIPT')
+# Creates records on a layout, given a JSON object {"layout": ..., "key_field": ..., "records": [field data, ...]} as
+# its parameter, and returns a JSON array of their primary keys (see filemaker_scripts/bulk_create_records.md; leave
+# unset to create records with one request each)
+FMP_BULK_CREATE_SCRIPT = environ.get('FMP_BULK_CREATE_SCRIPT')
 
 # Filesystem path constants
 SHOT_TREE_BASE_PATH = environ.get('SHOT_TREE_BASE_PATH')
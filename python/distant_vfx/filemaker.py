@@ -1,47 +1,212 @@
+import json
+import os
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from functools import wraps
-from time import sleep
-from fmrest import CloudServer
-from fmrest.exceptions import BadJSON, RequestException
+from time import perf_counter, sleep
+from urllib.parse import quote_plus
+from fmrest import CloudServer, Server
+from fmrest.const import FMSErrorCode
+from fmrest.exceptions import BadJSON, FileMakerError, RequestException
+from fmrest.foundset import Foundset
 
+from .constants import FMP_TOKEN_CACHE_PATH, FMP_QUERY_CACHE_TTL, FMP_SERVER_TYPE, FMP_CA_BUNDLE, FMP_METRICS_PATH, \
+    FMP_METRICS_FORMAT, FMP_METRICS_INTERVAL, FMP_RECORD_FIELDS_SCRIPT, FMP_BULK_CREATE_SCRIPT
+from .metrics import RequestMetrics
+from .query_cache import QueryCache
+from .retry import CircuitOpenError, RetryPolicy
+from .token_cache import TokenCache
 
-def _request_with_retry(func):
+
+def _request_with_retry(func, retry_failures=True):
     """
-    Wrapper function that allows for CloudServer requests to be performed up to _tries number of times in the case of
-    a BadJSON response, which happens intermittently. Will raise any other exception, or BadJSON if encountered again
-    after _tries failed attempts.
+    Wrapper function that retries CloudServer requests according to the wrapper's RetryPolicy in the case of a BadJSON
+    response (which happens intermittently) or a failed connection, backing off exponentially with jitter between
+    attempts. Will raise any other exception, or the last BadJSON/RequestException once the policy stops retrying, and
+    CircuitOpenError while the policy's circuit breaker is open. If the session token is rejected (error 952, e.g. an
+    expired cached token), logs in again once and retries.
     """
     @wraps(func)
     def wrapper(self, *args, **kwargs):
-        for i in range(self._tries):
-            try:
-                result = func(self, *args, **kwargs)
-                return result
-            except (BadJSON, RequestException):
-                if i <= self._tries - 1:
-                    sleep(0.5)
+        policy = self.retry_policy
+        can_relogin = True
+        attempt = 0
+        retries = 0
+        error_code = None
+        start = perf_counter()
+        try:
+            while True:
+                policy.before_request()
+                try:
+                    result = func(self, *args, **kwargs)
+                except (BadJSON, RequestException):
+                    policy.record_failure()
+                    delay = policy.get_retry_delay(attempt) if retry_failures else None
+                    if delay is None:
+                        raise
+                    attempt += 1
+                    retries += 1
+                    sleep(delay)
                     continue
-                else:
+                except FileMakerError:
+                    # FileMaker responded, so the server itself is healthy
+                    policy.record_success()
+                    if can_relogin and self.last_error == FMSErrorCode.INVALID_DAPI_TOKEN.value:
+                        can_relogin = False
+                        retries += 1
+                        self._relogin()
+                        continue
                     raise
-            except Exception:
-                raise
-            finally:
-                # make sure Content-Type is set to avoid KeyError when popping Content-Type from header, which can
-                # happen after a failed container upload attempt
-                self._server._set_content_type()
-        return None
+                except BaseException:
+                    # Any other error says nothing about the server, but must not leave a circuit breaker trial open
+                    policy.release_trial()
+                    raise
+                finally:
+                    # make sure Content-Type is set to avoid KeyError when popping Content-Type from header, which can
+                    # happen after a failed container upload attempt
+                    self._current_server()._set_content_type()
+                policy.record_success()
+                if self._pooled_token:
+                    self._touch_token()
+                return result
+        except Exception as e:
+            error_code = _get_error_code(self, e)
+            raise
+        finally:
+            if self.metrics is not None:
+                self.metrics.record(func.__name__.lstrip('_'), self.database, self._current_server().layout,
+                                    perf_counter() - start, retries=retries, error_code=error_code)
     return wrapper
 
 
+def _request_once(func):
+    """
+    Like _request_with_retry, but raises a BadJSON response or failed connection instead of retrying it, for requests
+    that are not safe to repeat because FileMaker may have already carried them out (e.g. a script creating records).
+    """
+    return _request_with_retry(func, retry_failures=False)
+
+
+def _get_error_code(wrapper, error):
+    # The FileMaker error code of a failed request, or the kind of failure if FileMaker did not respond
+    if isinstance(error, FileMakerError):
+        return wrapper.last_error
+    if isinstance(error, BadJSON):
+        return 'bad_json'
+    if isinstance(error, RequestException):
+        return 'request'
+    if isinstance(error, CircuitOpenError):
+        return 'circuit_open'
+    return type(error).__name__
+
+
+def _bulk_create_param(layout, records, key_field=None):
+    return json.dumps({'layout': layout, 'key_field': key_field, 'records': records}, separators=(',', ':'))
+
+
+def _chunk_script_records(layout, records, max_param_size, key_field=None):
+    # Split records into chunks whose URL encoded bulk create parameter is at most max_param_size bytes
+    base_size = len(quote_plus(_bulk_create_param(layout, [], key_field)))
+    separator_size = len(quote_plus(','))
+    chunk, chunk_size = [], base_size
+    for record in records:
+        record_size = len(quote_plus(json.dumps(record, separators=(',', ':')))) + (separator_size if chunk else 0)
+        if chunk and chunk_size + record_size > max_param_size:
+            yield chunk
+            chunk, chunk_size = [], base_size
+            record_size -= separator_size
+        chunk.append(record)
+        chunk_size += record_size
+    if chunk:
+        yield chunk
+
+
+def _escape_find_value(value):
+    # Escape FileMaker find operators so the value is matched literally
+    return ''.join('\\' + char if char in '\\=!<>@#*?"~' else char for char in str(value))
+
+
+# The minimum number of seconds between refreshes of a shared token's last use in the token cache
+_TOKEN_TOUCH_INTERVAL = 60
+
+# Shared by all connections to a server and database in the process, so the retry budget and circuit breaker cover
+# every request to it without one database's failures suspending requests to the others
+_default_retry_policies = {}
+_default_retry_policies_lock = threading.Lock()
+
+
+def _get_default_retry_policy(url, database):
+    with _default_retry_policies_lock:
+        policy = _default_retry_policies.get((url, database))
+        if policy is None:
+            policy = _default_retry_policies[(url, database)] = RetryPolicy()
+        return policy
+
+
+# Find results are cached for the process when FMP_QUERY_CACHE_TTL (seconds) is set, e.g. across the connections an
+# event daemon opens per event
+_default_query_cache = QueryCache(ttl=float(FMP_QUERY_CACHE_TTL)) if FMP_QUERY_CACHE_TTL else None
+
+# Requests are instrumented for the process when FMP_METRICS_PATH is set, with the metrics written there at exit and
+# every FMP_METRICS_INTERVAL seconds, if set
+_default_metrics = None
+if FMP_METRICS_PATH:
+    _default_metrics = RequestMetrics()
+    _default_metrics.dump_periodically(FMP_METRICS_PATH, FMP_METRICS_FORMAT, float(FMP_METRICS_INTERVAL or 0))
+
+
 class CloudServerWrapper:
 
-    def __init__(self, url, user, password, database, layout):
+    def __init__(self, url, user, password, database, layout, token_cache=None, retry_policy=None, query_cache=None,
+                 server_type=None, verify_ssl=None, metrics=None):
+        """
+        :param token_cache: Optional TokenCache used to share session tokens between connections and processes.
+                            Defaults to a cache at FMP_TOKEN_CACHE_PATH, if set. While a cached token is in use the
+                            session is left open on logout, for the next connection to reuse. Pass False to
+                            disable.
+        :param retry_policy: Optional RetryPolicy for failed requests. Defaults to a policy shared by the process's
+                             connections to the same url and database.
+        :param query_cache: Optional QueryCache to read find results through. Defaults to a cache shared by the
+                            process if FMP_QUERY_CACHE_TTL is set. Creating records, uploading to a container or
+                            running a script through the wrapper invalidates the cached results for that layout (or
+                            the whole database, for a script). Pass False to disable.
+        :param server_type: 'cloud' to connect to FileMaker Cloud, or 'server' for FileMaker Server (or a local
+                            FileMakerStandIn). Defaults to FMP_SERVER_TYPE.
+        :param verify_ssl: Whether to verify the server's certificate, or the path of a certificate to verify it with.
+                           Defaults to FMP_CA_BUNDLE if set, otherwise True.
+        :param metrics: Optional RequestMetrics to record each request in. Defaults to metrics shared by the process if
+                        FMP_METRICS_PATH is set. Pass False to disable.
+
+        The find, get_record, create_record, upload_container and perform_script methods take an optional layout,
+        defaulting to the layout attribute. A wrapper can be shared between threads: fmrest servers keep per-request
+        state (layout, headers, last error), so requests are sent from one server per thread and layout, all using
+        this wrapper's session token.
+        """
         self.url = url
         self.user = user
         self.password = password
         self.database = database
         self._layout = layout
-        self._server = self._set_server()
-        self._tries = 3  # try requests up to _tries times to get past BadJSON response
+        self.server_type = server_type or FMP_SERVER_TYPE
+        if verify_ssl is None:
+            verify_ssl = FMP_CA_BUNDLE or True
+        self.verify_ssl = verify_ssl
+        self._server = self._set_server()  # holds the session token
+        self._local = threading.local()
+        self._login_lock = threading.Lock()
+        self.retry_policy = retry_policy or _get_default_retry_policy(url, database)
+        if query_cache is None:
+            query_cache = _default_query_cache
+        self.query_cache = query_cache or None
+        if token_cache is None and FMP_TOKEN_CACHE_PATH:
+            token_cache = TokenCache(FMP_TOKEN_CACHE_PATH)
+        self.token_cache = token_cache or None
+        if metrics is None:
+            metrics = _default_metrics
+        self.metrics = metrics or None
+        self._pooled_token = False
+        self._token_touched_at = 0.0
 
     def __enter__(self):
         return self
@@ -49,12 +214,31 @@ class CloudServerWrapper:
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.logout()
 
-    def _set_server(self):
-        return CloudServer(url=self.url,
-                           user=self.user,
-                           password=self.password,
-                           database=self.database,
-                           layout=self._layout)
+    def _set_server(self, layout=None):
+        server_class = Server if self.server_type == 'server' else CloudServer
+        return server_class(url=self.url,
+                            user=self.user,
+                            password=self.password,
+                            database=self.database,
+                            layout=layout or self._layout,
+                            verify_ssl=self.verify_ssl)
+
+    def _get_server(self, layout=None):
+        # Get the current thread's server for a layout, brought up to date with the session token
+        layout = layout or self._layout
+        servers = getattr(self._local, 'servers', None)
+        if servers is None:
+            servers = self._local.servers = {}
+        server = servers.get(layout)
+        if server is None:
+            server = servers[layout] = self._set_server(layout)
+        server._token = self._server._token
+        self._local.server = server
+        return server
+
+    def _current_server(self):
+        # The server that sent the current thread's last request
+        return getattr(self._local, 'server', self._server)
 
     @property
     def layout(self):
@@ -67,31 +251,290 @@ class CloudServerWrapper:
 
     @property
     def last_error(self):
-        return self._server.last_error
+        return self._current_server().last_error
 
-    def login(self):
-        self._server.login()
+    @property
+    def last_script_result(self):
+        return self._current_server().last_script_result
+
+    @property
+    def _token_key(self):
+        return TokenCache.make_key(self.url, self.user, self.database)
 
     @_request_with_retry
+    def login(self):
+        self._local.server = self._server
+        if self.token_cache is None:
+            self._server.login()
+            return
+        # Hold the cache lock while logging in, so concurrent processes wait for one login rather than each opening
+        # a session
+        with self.token_cache.lock():
+            token = self.token_cache.get(self._token_key)
+            if token is None:
+                token = self._server.login()
+            else:
+                self._server._token = token
+            self.token_cache.set(self._token_key, token)
+        self._token_touched_at = perf_counter()
+        self._pooled_token = True
+
+    def _relogin(self):
+        rejected_token = self._current_server()._token
+        with self._login_lock:
+            if self._server._token != rejected_token:
+                return  # another thread has logged in again already
+            if self.token_cache is None:
+                self._server._token = None
+                self._server.login()
+                return
+            with self.token_cache.lock():
+                self.token_cache.invalidate(self._token_key, rejected_token)
+                # Another process may have logged in again already
+                token = self.token_cache.get(self._token_key)
+                if token is None:
+                    token = self._server.login()
+                else:
+                    self._server._token = token
+                self.token_cache.set(self._token_key, token)
+            self._token_touched_at = perf_counter()
+
+    def _touch_token(self):
+        # Record that the shared token is still in use every so often, so other processes keep reusing it rather
+        # than treating it as idle and logging in again
+        now = perf_counter()
+        if now - self._token_touched_at >= _TOKEN_TOUCH_INTERVAL:
+            self._token_touched_at = now
+            self.token_cache.touch(self._token_key, self._server._token)
+
     def logout(self):
+        if self._pooled_token:
+            # Leave the shared session open, just record that it was used
+            self.token_cache.touch(self._token_key, self._server._token)
+            return True
+        return self._logout()
+
+    @_request_once
+    def _logout(self):
+        # Not retried: fmrest clears the token before sending the logout, so a retry could only send an empty one
+        self._local.server = self._server
+        if not self._server._token:
+            return True  # not logged in, or already logged out
         return self._server.logout()
 
+    def find(self, query, sort=None, limit=100, offset=1, layout=None):
+        if self.query_cache is None:
+            return self._find(query, sort, limit, offset, layout)
+        key = QueryCache.make_key(self.database, layout or self._layout, query, sort, limit, offset)
+        cached = self.query_cache.get(key)
+        if cached is None:
+            # Finds that match no records raise, so are never cached
+            foundset = self._find(query, sort, limit, offset, layout)
+            cached = (list(foundset), foundset.info)
+            self.query_cache.set(key, cached)
+        records, info = cached
+        return Foundset(iter(records), info)
+
     @_request_with_retry
-    def find(self, query, sort=None, limit=100):
-        return self._server.find(query, sort=sort, limit=limit)
+    def _find(self, query, sort, limit, offset, layout):
+        return self._get_server(layout).find(query, sort=sort, limit=limit, offset=offset)
+
+    def find_many(self, field, values, chunk=50, page_size=1000, layout=None):
+        """
+        Look up many values of one field with a few multi-request finds (each request ORs up to chunk exact match
+        queries). Matching is case insensitive, as FileMaker finds are.
+        :param field: The field name to search.
+        :param values: A list of values to look for.
+        :param chunk: The number of values in each find request.
+        :param page_size: The number of records to fetch per request (see find_iter).
+        :return: A dict formatted as {value: [records]}, with an empty list for values that were not found.
+        """
+        results = {value: [] for value in values}
+        lookup = defaultdict(list)
+        for value in results:
+            lookup[str(value).casefold()].append(value)
+
+        unique_values = list(results)
+        for i in range(0, len(unique_values), chunk):
+            query = [{field: '==' + _escape_find_value(value)} for value in unique_values[i:i + chunk]]
+            for record in self.find_iter(query, page_size=page_size, layout=layout):
+                for value in lookup.get(str(record[field]).casefold(), []):
+                    results[value].append(record)
+        return results
+
+    def find_iter(self, query, sort=None, page_size=500, layout=None):
+        """
+        Find all records matching a query, fetching them one page at a time (offset paging) as they are consumed, so
+        large result sets are neither truncated nor held in memory. Records created or deleted while paging can shift
+        later pages, so pass a sort for a stable order.
+        :param query: A list of find request dicts, as for find.
+        :param sort: Optional list of sort dicts, as for find.
+        :param page_size: The number of records to fetch per request.
+        :return: A generator of records. Yields nothing if no records match (error 401).
+        """
+        offset = 1
+        while True:
+            try:
+                records = self.find(query, sort=sort, limit=page_size, offset=offset, layout=layout)
+            except FileMakerError:
+                if self.last_error == 401:  # no records match the request
+                    return
+                raise
+            num_records = 0
+            for record in records:
+                num_records += 1
+                yield record
+            found_count = getattr(records, 'info', {}).get('foundCount')
+            offset += page_size
+            if num_records < page_size or (found_count is not None and offset > found_count):
+                return
 
     @_request_with_retry
-    def get_record(self, record_id):
-        return self._server.get_record(record_id)
+    def get_record(self, record_id, layout=None):
+        return self._get_server(layout).get_record(record_id)
 
     @_request_with_retry
-    def create_record(self, record):
-        return self._server.create_record(record)
+    def create_record(self, record, layout=None, scripts=None):
+        """
+        :param scripts: Optional dict of scripts to run in the same request, as {'prerequest', 'presort' or 'after':
+                        [script name, parameter]}. The results are in last_script_result.
+        """
+        try:
+            return self._get_server(layout).create_record(record, scripts=scripts)
+        finally:
+            self._invalidate_query_cache(layout or self._layout)
+
+    def create_record_and_fetch(self, record, fields, layout=None, scripts=None):
+        """
+        Create a record and read back some of its fields (e.g. a PrimaryKey set by FileMaker). If
+        FMP_RECORD_FIELDS_SCRIPT is set, the fields are returned by running that script after the create, in the same
+        request. Otherwise, or if the script fails or the 'after' script is taken, they are read with get_record.
+        :param record: A field data dict.
+        :param fields: A list of the field names to read back.
+        :param scripts: Optional dict of scripts to run in the same request, as for create_record.
+        :return: A tuple of the new record id and a dict formatted as {field name: value}.
+        """
+        scripts = dict(scripts or {})
+        fetch_with_script = bool(FMP_RECORD_FIELDS_SCRIPT) and 'after' not in scripts
+        if fetch_with_script:
+            scripts['after'] = [FMP_RECORD_FIELDS_SCRIPT, json.dumps(fields)]
+        record_id = self.create_record(record, layout=layout, scripts=scripts or None)
+        if fetch_with_script:
+            script_error = None
+            try:
+                # No 'after' entry if the server did not run or report the script
+                script_error, script_result = self.last_script_result.get('after')
+                if str(script_error or 0) == '0':
+                    values = json.loads(script_result)
+                    return record_id, {field: values[field] for field in fields}
+            except (TypeError, ValueError, KeyError):
+                pass
+            print(f'Could not read fields from script {FMP_RECORD_FIELDS_SCRIPT} (error {script_error}), '
+                  f'fetching record {record_id}')
+        new_record = self.get_record(record_id, layout=layout)
+        return record_id, {field: new_record[field] for field in fields}
+
+    def create_records(self, records, max_workers=8, layout=None):
+        """
+        Create records concurrently on a bounded thread pool, all using this wrapper's session. Each create is
+        retried as with create_record.
+        :param records: A list of field data dicts.
+        :param max_workers: The maximum number of concurrent requests.
+        :param layout: Optional layout to create the records on (defaults to the layout attribute).
+        :return: A list of (record_id, error) tuples in the order of records. record_id is None and error is the
+                 exception raised if the create failed, otherwise error is None.
+        """
+        def create(record):
+            try:
+                return self.create_record(record, layout=layout), None
+            except Exception as e:
+                return None, e
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(create, records))
+
+    def bulk_create_via_script(self, layout, records, key_field=None, script_name=None, max_param_size=6000):
+        """
+        Create records with the bulk create companion script (see filemaker_scripts/bulk_create_records.md), sending
+        many records in each request. The records are serialized into the script parameter as
+        {"layout": layout, "key_field": key_field, "records": [field data, ...]}, in chunks. The Data API sends script
+        parameters in the request URL, so each chunk's URL encoded parameter is kept under max_param_size bytes (a
+        record larger than that is sent on its own). The script creates each chunk in a transaction, so a chunk the
+        script fails on creates none of its records.
+
+        Without a key_field, a request that fails without a response from FileMaker (BadJSON or a failed connection)
+        is not retried, as the script may have run: the records of the failed chunk may or may not have been created.
+        With a key_field, the script returns the primary key of an existing record with the same key instead of
+        creating another, so failed requests are retried and a failed call can be repeated with the same records.
+        :param layout: The layout to create the records on (defaults to the layout attribute if None).
+        :param records: A list of field data dicts.
+        :param key_field: Optional name of a field whose value identifies each record, e.g. a client generated ID.
+        :param script_name: The name of the companion script, FMP_BULK_CREATE_SCRIPT by default.
+        :param max_param_size: The maximum size in bytes of each URL encoded script parameter.
+        :return: A list of the primary keys of the records, in the order of records. If a chunk fails, the exception
+                 raised has a created_primary_keys attribute with the primary keys of the records of the earlier
+                 chunks, and a failed_records attribute with the records of the failed chunk and those after it.
+        """
+        script_name = script_name or FMP_BULK_CREATE_SCRIPT
+        if not script_name:
+            raise ValueError('FMP_BULK_CREATE_SCRIPT is not set')
+        if key_field is not None and any(not record.get(key_field) for record in records):
+            raise ValueError(f'Every record needs a value for the key field {key_field}')
+        layout = layout or self._layout
+        perform_script = self.perform_script if key_field is not None else self._perform_script_once
+        primary_keys = []
+        for chunk in _chunk_script_records(layout, records, max_param_size, key_field):
+            try:
+                script_error, script_result = perform_script(
+                    script_name, param=_bulk_create_param(layout, chunk, key_field), layout=layout)
+                if script_error:
+                    raise FileMakerError(script_error, f'Script {script_name} failed')
+                chunk_keys = json.loads(script_result)
+                if isinstance(chunk_keys, dict):  # the script reverted the chunk
+                    raise FileMakerError(chunk_keys.get('error'), f'Script {script_name} failed: '
+                                                                  f'{chunk_keys.get("message", "")}')
+                if len(chunk_keys) != len(chunk):
+                    raise ValueError(f'Script {script_name} returned {len(chunk_keys)} primary keys for '
+                                     f'{len(chunk)} records')
+            except Exception as e:
+                e.created_primary_keys = primary_keys
+                e.failed_records = records[len(primary_keys):]
+                raise
+            primary_keys.extend(chunk_keys)
+        return primary_keys
+
+    def upload_container(self, record_id, field_name, file_, layout=None):
+        position = file_.tell()
+        size = file_.seek(0, os.SEEK_END) - position
+        result = self._upload_container(record_id, field_name, file_, position, layout)
+        if self.metrics is not None:
+            self.metrics.record_upload('upload_container', self.database, layout or self._layout, size)
+        return result
 
     @_request_with_retry
-    def upload_container(self, record_id, field_name, file_):
-        return self._server.upload_container(record_id, field_name, file_)
+    def _upload_container(self, record_id, field_name, file_, position, layout):
+        # Rewind the file on every attempt, so that a retried upload sends the whole file again
+        file_.seek(position)
+        try:
+            return self._get_server(layout).upload_container(record_id, field_name, file_)
+        finally:
+            self._invalidate_query_cache(layout or self._layout)
 
     @_request_with_retry
-    def perform_script(self, name, param=None):
-        return self._server.perform_script(name, param=param)
+    def perform_script(self, name, param=None, layout=None):
+        try:
+            return self._get_server(layout).perform_script(name, param=param)
+        finally:
+            # A script can change records on any layout
+            self._invalidate_query_cache()
+
+    @_request_once
+    def _perform_script_once(self, name, param=None, layout=None):
+        try:
+            return self._get_server(layout).perform_script(name, param=param)
+        finally:
+            self._invalidate_query_cache()
+
+    def _invalidate_query_cache(self, layout=None):
+        if self.query_cache is not None:
+            self.query_cache.invalidate(self.database, layout)
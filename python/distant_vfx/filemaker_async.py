@@ -0,0 +1,218 @@
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import requests
+from fmrest import CloudServer, Server
+from fmrest.const import FMSErrorCode, TIMEOUT
+from fmrest.exceptions import BadJSON, FileMakerError, RequestException
+
+from .filemaker import CloudServerWrapper
+
+
+class AsyncCloudServerWrapper:
+    """
+    asyncio counterpart to CloudServerWrapper, with its request methods as coroutines. fmrest is synchronous, so
+    requests run on a thread pool through one shared (thread safe) CloudServerWrapper, with retries, token sharing and
+    query caching as for CloudServerWrapper. Connections are pooled in a shared requests session, and a semaphore
+    limits the number of requests in flight to max_concurrency.
+
+    A FileMakerError raised by a coroutine has an error_code attribute with the FileMaker error code (e.g. 401 if a
+    find matched no records), since last_error is not meaningful across threads.
+
+    Usage:
+        async with AsyncCloudServerWrapper(url, user, password, database, layout) as fmp:
+            await fmp.login()
+            records = await asyncio.gather(*[fmp.get_record(record_id) for record_id in record_ids])
+    """
+
+    def __init__(self, url, user, password, database, layout, max_concurrency=32, token_cache=None,
+                 retry_policy=None, query_cache=None, server_type=None, verify_ssl=None, metrics=None):
+        """
+        :param max_concurrency: The maximum number of requests in flight (and pooled connections).
+        See CloudServerWrapper for the other parameters.
+        """
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency)
+        session.mount('https://', adapter)
+        self._session = session
+        self._wrapper = _PooledCloudServerWrapper(url=url,
+                                                  user=user,
+                                                  password=password,
+                                                  database=database,
+                                                  layout=layout,
+                                                  token_cache=token_cache,
+                                                  retry_policy=retry_policy,
+                                                  query_cache=query_cache,
+                                                  server_type=server_type,
+                                                  verify_ssl=verify_ssl,
+                                                  metrics=metrics,
+                                                  session=session)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency)
+        self.max_concurrency = max_concurrency
+        self._semaphore = None
+        self._semaphore_loop = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        try:
+            await self.logout()
+        finally:
+            self._executor.shutdown(wait=False)
+            self._session.close()
+
+    @property
+    def layout(self):
+        return self._wrapper.layout
+
+    @layout.setter
+    def layout(self, value):
+        self._wrapper.layout = value
+
+    async def login(self):
+        return await self._run(self._wrapper.login)
+
+    async def logout(self):
+        return await self._run(self._wrapper.logout)
+
+    async def find(self, query, sort=None, limit=100, offset=1, layout=None):
+        return await self._run(self._wrapper.find, query, sort=sort, limit=limit, offset=offset, layout=layout)
+
+    async def find_iter(self, query, sort=None, page_size=500, layout=None):
+        """
+        Async generator counterpart to CloudServerWrapper.find_iter.
+        """
+        offset = 1
+        while True:
+            try:
+                records = await self.find(query, sort=sort, limit=page_size, offset=offset, layout=layout)
+            except FileMakerError as e:
+                if e.error_code == 401:  # no records match the request
+                    return
+                raise
+            num_records = 0
+            for record in records:
+                num_records += 1
+                yield record
+            found_count = getattr(records, 'info', {}).get('foundCount')
+            offset += page_size
+            if num_records < page_size or (found_count is not None and offset > found_count):
+                return
+
+    async def get_record(self, record_id, layout=None):
+        return await self._run(self._wrapper.get_record, record_id, layout=layout)
+
+    async def create_record(self, record, layout=None, scripts=None):
+        return await self._run(self._wrapper.create_record, record, layout=layout, scripts=scripts)
+
+    async def create_record_and_fetch(self, record, fields, layout=None, scripts=None):
+        return await self._run(self._wrapper.create_record_and_fetch, record, fields, layout=layout, scripts=scripts)
+
+    async def create_records(self, records, layout=None):
+        """
+        :return: A list of (record_id, error) tuples in the order of records, as for CloudServerWrapper.create_records.
+        """
+        results = await asyncio.gather(*[self.create_record(record, layout=layout) for record in records],
+                                       return_exceptions=True)
+        return [(None, result) if isinstance(result, Exception) else (result, None) for result in results]
+
+    async def bulk_create_via_script(self, layout, records, key_field=None, script_name=None, max_param_size=6000):
+        return await self._run(self._wrapper.bulk_create_via_script, layout, records, key_field=key_field,
+                               script_name=script_name, max_param_size=max_param_size)
+
+    async def upload_container(self, record_id, field_name, file_, layout=None):
+        return await self._run(self._wrapper.upload_container, record_id, field_name, file_, layout=layout)
+
+    async def perform_script(self, name, param=None, layout=None):
+        return await self._run(self._wrapper.perform_script, name, param=param, layout=layout)
+
+    async def _run(self, func, *args, **kwargs):
+        # get_event_loop returns the running loop when called from a coroutine (get_running_loop needs Python 3.7)
+        loop = asyncio.get_event_loop()
+        async with self._get_semaphore(loop):
+            return await loop.run_in_executor(self._executor, partial(self._call, func, *args, **kwargs))
+
+    def _get_semaphore(self, loop):
+        # Created in the running loop, as before Python 3.10 a semaphore binds to the loop current when it is created
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphore_loop = loop
+        return self._semaphore
+
+    def _call(self, func, *args, **kwargs):
+        # Runs on a worker thread, where the wrapper's last error belongs to this request
+        try:
+            return func(*args, **kwargs)
+        except FileMakerError as e:
+            e.error_code = self._wrapper.last_error
+            raise
+
+
+class _PooledCloudServerWrapper(CloudServerWrapper):
+    # CloudServerWrapper whose servers share a requests session
+
+    def __init__(self, *args, session, **kwargs):
+        self._session = session  # set before CloudServerWrapper.__init__ creates the first server
+        super().__init__(*args, **kwargs)
+
+    def _set_server(self, layout=None):
+        server_class = _SessionServer if self.server_type == 'server' else _SessionCloudServer
+        return server_class(session=self._session,
+                            url=self.url,
+                            user=self.user,
+                            password=self.password,
+                            database=self.database,
+                            layout=layout or self._layout,
+                            verify_ssl=self.verify_ssl)
+
+
+class _SessionMixin:
+    # Sends a fmrest server's requests through a requests session, so connections are kept open and reused
+
+    def __init__(self, session, **kwargs):
+        self._session = session
+        super().__init__(**kwargs)
+
+    def _call_filemaker(self, method, path, data=None, params=None, **kwargs):
+        # As Server._call_filemaker, with the request sent through the session
+        url = self.url + path
+        request_data = json.dumps(data) if data else None
+        self._update_token_header()
+        try:
+            response = self._session.request(method=method,
+                                             headers=self._headers,
+                                             url=url,
+                                             data=request_data,
+                                             verify=self.verify_ssl,
+                                             params=params,
+                                             timeout=TIMEOUT,
+                                             **kwargs)
+        except Exception as ex:
+            raise RequestException(ex, (method, url), kwargs) from None
+
+        try:
+            response_data = response.json()
+        except json.decoder.JSONDecodeError as ex:
+            raise BadJSON(ex, response) from None
+
+        fms_messages = response_data.get('messages')
+        fms_response = response_data.get('response')
+
+        self._update_script_result(fms_response)
+        self._last_fm_error = fms_messages[0].get('code', -1)
+        if self.last_error != FMSErrorCode.SUCCESS.value:
+            raise FileMakerError(self._last_fm_error, fms_messages[0].get('message', 'Unknown error'))
+
+        self._set_content_type()  # reset content type
+        return fms_response
+
+
+class _SessionServer(_SessionMixin, Server):
+    pass
+
+
+class _SessionCloudServer(_SessionMixin, CloudServer):
+    pass
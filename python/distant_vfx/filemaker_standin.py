@@ -0,0 +1,424 @@
+import base64
+import json
+import os
+import random
+import re
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from fnmatch import fnmatchcase
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, unquote, urlsplit
+
+_DATABASE_PATH = r'^/fmi/data/v1/databases/(?P<database>[^/]+)'
+_LAYOUT_PATH = _DATABASE_PATH + r'/layouts/(?P<layout>[^/]+)'
+_ROUTES = [
+    ('POST', 'login', re.compile(_DATABASE_PATH + r'/sessions/?$')),
+    ('DELETE', 'logout', re.compile(_DATABASE_PATH + r'/sessions/(?P<token>[^/]+)$')),
+    ('POST', 'create', re.compile(_LAYOUT_PATH + r'/records$')),
+    ('GET', 'get', re.compile(_LAYOUT_PATH + r'/records/(?P<record_id>\d+)$')),
+    ('POST', 'upload', re.compile(_LAYOUT_PATH + r'/records/(?P<record_id>\d+)/containers/(?P<field>[^/]+)/\d+$')),
+    ('POST', 'find', re.compile(_LAYOUT_PATH + r'/_find$')),
+    ('GET', 'script', re.compile(_LAYOUT_PATH + r'/script/(?P<script>[^/]+)$')),
+]
+
+
+class StandInError(Exception):
+
+    def __init__(self, code, message, status=400):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.status = status
+
+
+class FileMakerStandIn:
+    """
+    A local stand-in for the FileMaker Data API endpoints used by fmrest (login, logout, find, create, get, container
+    upload and script), for load testing FileMaker jobs offline. Records are kept in memory, one table per
+    (database, layout), and every record is given a PrimaryKey if it is created without one. Finds support exact
+    (==), wildcard (*, @) and word prefix matching, omit requests and sorting. Scripts are no-ops unless registered
+    with register_script.
+
+    Latency and failures can be injected: each request is delayed by latency plus up to jitter seconds, and fails
+    with an HTML response (a BadJSON error in fmrest) with probability bad_json_rate, or with FileMaker error
+    error_code with probability error_rate. Requests are counted by endpoint in stats.
+
+    The Data API requires https, so the server uses a self-signed certificate for localhost (generated with openssl
+    unless cert_path and key_path are given). Connect with CloudServerWrapper(..., server_type='server',
+    verify_ssl=standin.cert_path).
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, jitter=0.0, bad_json_rate=0.0, error_rate=0.0,
+                 error_code=802, session_timeout=900, cert_path=None, key_path=None, seed=None):
+        """
+        :param port: The port to listen on, or 0 for any free port.
+        :param latency: The minimum number of seconds each request takes.
+        :param jitter: The maximum number of seconds randomly added to latency.
+        :param bad_json_rate: The probability of a request failing with a non-JSON response.
+        :param error_rate: The probability of a request failing with FileMaker error error_code.
+        :param session_timeout: The number of seconds a session token stays valid without being used.
+        :param seed: Optional seed for the random failures and jitter.
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.bad_json_rate = bad_json_rate
+        self.error_rate = error_rate
+        self.error_code = error_code
+        self.session_timeout = session_timeout
+        self.stats = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._tables = {}
+        self._next_ids = Counter()
+        self._sessions = {}
+        self._scripts = {}
+        self._temp_dir = None
+        if cert_path is None or key_path is None:
+            self._temp_dir = tempfile.TemporaryDirectory()
+            cert_path = os.path.join(self._temp_dir.name, 'standin.crt')
+            key_path = os.path.join(self._temp_dir.name, 'standin.key')
+            _generate_certificate(cert_path, key_path)
+        self.cert_path = cert_path
+
+        self._httpd = _ThreadingHTTPServer((host, port), _StandInRequestHandler)
+        self._httpd.standin = self
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert_path, key_path)
+        self._httpd.socket = context.wrap_socket(self._httpd.socket, server_side=True)
+        self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    @property
+    def url(self):
+        return 'https://localhost:{}'.format(self._httpd.server_address[1])
+
+    def start(self):
+        """
+        Serve requests on a background thread.
+        :return: self
+        """
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self._httpd.serve_forever()
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._temp_dir is not None:
+            self._temp_dir.cleanup()
+
+    def register_script(self, name, func):
+        """
+        :param name: The script name.
+        :param func: A callable taking (standin, database, layout, param, record_id) and returning the script result
+                     (or None). record_id is the current record (the record just created or fetched), or None.
+        """
+        self._scripts[name] = func
+
+    def reset_stats(self):
+        """
+        :return: The request counts since the last reset.
+        """
+        with self._lock:
+            stats = self.stats
+            self.stats = Counter()
+        return stats
+
+    def get_records(self, database, layout):
+        """
+        :return: A list of the field data dicts in a table, in creation order.
+        """
+        with self._lock:
+            return [dict(fields) for fields in self._tables.get((database, layout), {}).values()]
+
+    def add_record(self, database, layout, field_data):
+        """
+        Create a record directly (e.g. to seed a table before a benchmark).
+        :return: The new record id.
+        """
+        with self._lock:
+            key = (database, layout)
+            self._next_ids[key] += 1
+            record_id = self._next_ids[key]
+            fields = dict(field_data)
+            fields.setdefault('PrimaryKey', uuid.uuid4().hex)
+            self._tables.setdefault(key, OrderedDict())[record_id] = fields
+        return record_id
+
+    def handle(self, method, path, headers, body):
+        """
+        Handle one Data API request.
+        :return: A (status, content type, body bytes) tuple.
+        """
+        self._delay()
+        action, params = self._route(method, path)
+        with self._lock:
+            self.stats[action] += 1
+            self.stats['requests'] += 1
+            if self._random.random() < self.bad_json_rate:
+                self.stats['bad_json'] += 1
+                return 502, 'text/html', b'<html><body>502 Bad Gateway</body></html>'
+            fail = self._random.random() < self.error_rate
+            if fail:
+                self.stats['errors'] += 1
+        try:
+            if fail:
+                raise StandInError(self.error_code, 'Injected error', status=500)
+            if action == 'unknown':
+                raise StandInError(3, 'Unsupported FileMaker Data API request', status=404)
+            if action == 'login':
+                response = self._login(headers)
+            elif action == 'logout':
+                response = self._logout(params, body)  # the token is in the path rather than a header
+            else:
+                self._check_token(headers)
+                response = getattr(self, '_' + action)(params, body)
+            return 200, 'application/json', _encode(response, 0, 'OK')
+        except StandInError as e:
+            return e.status, 'application/json', _encode({}, e.code, e.message)
+
+    def _route(self, method, path):
+        split = urlsplit(path)
+        for route_method, action, pattern in _ROUTES:
+            match = pattern.match(split.path)
+            if match and method == route_method:
+                params = {key: unquote(value) for key, value in match.groupdict().items()}
+                params.update({key: values[0] for key, values in parse_qs(split.query).items()})
+                return action, params
+        return 'unknown', {}
+
+    def _delay(self):
+        delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay:
+            time.sleep(delay)
+
+    def _login(self, headers):
+        authorization = headers.get('Authorization', '')
+        if not authorization.startswith('Basic ') or ':' not in base64.b64decode(authorization[6:]).decode():
+            raise StandInError(212, 'Invalid user account and/or password; please try again', status=401)
+        token = uuid.uuid4().hex
+        with self._lock:
+            self._sessions[token] = time.monotonic()
+        return {'token': token}
+
+    def _check_token(self, headers):
+        token = headers.get('Authorization', '')[len('Bearer '):]
+        with self._lock:
+            last_used = self._sessions.get(token)
+            if last_used is None or time.monotonic() - last_used > self.session_timeout:
+                self._sessions.pop(token, None)
+                raise StandInError(952, 'Invalid FileMaker Data API token (*)', status=401)
+            self._sessions[token] = time.monotonic()
+
+    def _logout(self, params, body):
+        with self._lock:
+            self._sessions.pop(params['token'], None)
+        return {}
+
+    def _create(self, params, body):
+        data = json.loads(body or b'{}')
+        record_id = self.add_record(params['database'], params['layout'], data.get('fieldData', {}))
+        response = {'recordId': str(record_id), 'modId': '0'}
+        response.update(self._run_request_script(params, data, record_id))
+        return response
+
+    def _get(self, params, body):
+        record = self._get_record(params['database'], params['layout'], int(params['record_id']))
+        response = {'data': [record], 'dataInfo': _data_info(params, 1, 1, 1)}
+        response.update(self._run_request_script(params, params, int(params['record_id'])))
+        return response
+
+    def _upload(self, params, body):
+        record_id = int(params['record_id'])
+        self._get_record(params['database'], params['layout'], record_id)
+        with self._lock:
+            fields = self._tables[(params['database'], params['layout'])][record_id]
+            fields[params['field']] = '{}/Streaming_SSL/MainDB/{}.bin'.format(self.url, uuid.uuid4().hex)
+            self.stats['bytes_uploaded'] += len(body)
+        return {'modId': '1'}
+
+    def _find(self, params, body):
+        data = json.loads(body or b'{}')
+        with self._lock:
+            table = self._tables.get((params['database'], params['layout']), {})
+            found = [(record_id, fields) for record_id, fields in table.items() if _match(fields, data['query'])]
+        for sort in reversed(data.get('sort') or []):
+            found.sort(key=lambda item: str(item[1].get(sort['fieldName'], '')),
+                       reverse=sort.get('sortOrder', 'ascend') == 'descend')
+        if not found:
+            raise StandInError(401, 'No records match the request')
+        offset = int(data.get('offset', 1))
+        limit = int(data.get('limit', 100))
+        page = found[offset - 1:offset - 1 + limit]
+        response = {'data': [_record_data(record_id, fields) for record_id, fields in page],
+                    'dataInfo': _data_info(params, len(table), len(found), len(page))}
+        response.update(self._run_request_script(params, data))
+        return response
+
+    def _script(self, params, body):
+        return self._run_script(params['script'], params, params.get('script.param'))
+
+    def _run_request_script(self, params, data, record_id=None):
+        # Run the script requested to run after the action (the 'script' and 'script.param' parameters)
+        if not data.get('script'):
+            return {}
+        return self._run_script(data['script'], params, data.get('script.param'), record_id)
+
+    def _run_script(self, name, params, param, record_id=None):
+        func = self._scripts.get(name)
+        result = func(self, params['database'], params['layout'], param, record_id) if func is not None else None
+        response = {'scriptError': '0'}
+        if result is not None:
+            response['scriptResult'] = str(result)
+        return response
+
+    def _get_record(self, database, layout, record_id):
+        with self._lock:
+            fields = self._tables.get((database, layout), {}).get(record_id)
+            if fields is None:
+                raise StandInError(101, 'Record is missing')
+            return _record_data(record_id, fields)
+
+
+def record_fields_script(standin, database, layout, param, record_id):
+    """
+    A stand-in for the FMP_RECORD_FIELDS_SCRIPT companion script: returns the current record's fields named in the
+    JSON array parameter as a JSON object. Register it with register_script.
+    """
+    fields = standin._get_record(database, layout, record_id)['fieldData']
+    return json.dumps({name: fields.get(name, '') for name in json.loads(param)})
+
+
+def bulk_create_script(standin, database, layout, param, record_id):
+    """
+    A stand-in for the FMP_BULK_CREATE_SCRIPT companion script: creates the records in the JSON parameter's "records"
+    on its "layout", reusing any record with the same "key_field" value, and returns their primary keys as a JSON
+    array. Register it with register_script.
+    """
+    data = json.loads(param)
+    key_field = data.get('key_field')
+    existing = {}
+    if key_field:
+        existing = {fields.get(key_field): fields['PrimaryKey']
+                    for fields in standin.get_records(database, data['layout'])}
+    primary_keys = []
+    for record in data['records']:
+        if key_field and record[key_field] in existing:
+            primary_keys.append(existing[record[key_field]])
+            continue
+        new_record_id = standin.add_record(database, data['layout'], record)
+        primary_keys.append(standin._get_record(database, data['layout'], new_record_id)['fieldData']['PrimaryKey'])
+    return json.dumps(primary_keys)
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    # http.server.ThreadingHTTPServer needs Python 3.7
+    daemon_threads = True
+
+
+class _StandInRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep connections alive, as the Data API does
+
+    def do_GET(self):
+        self._handle()
+
+    def do_POST(self):
+        self._handle()
+
+    def do_DELETE(self):
+        self._handle()
+
+    def _handle(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        status, content_type, content = self.server.standin.handle(self.command, self.path, self.headers, body)
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _generate_certificate(cert_path, key_path):
+    subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '30',
+                    '-keyout', key_path, '-out', cert_path, '-subj', '/CN=localhost',
+                    '-addext', 'subjectAltName=DNS:localhost,IP:127.0.0.1'],
+                   check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def _encode(response, code, message):
+    return json.dumps({'response': response, 'messages': [{'code': str(code), 'message': message}]}).encode()
+
+
+def _data_info(params, total_count, found_count, returned_count):
+    return {'database': params['database'], 'layout': params['layout'], 'table': params['layout'],
+            'totalRecordCount': total_count, 'foundCount': found_count, 'returnedCount': returned_count}
+
+
+def _record_data(record_id, fields):
+    return {'fieldData': dict(fields), 'portalData': {}, 'recordId': str(record_id), 'modId': '0'}
+
+
+def _match(fields, query):
+    # Requests are OR'd together, then records matching any omit request are removed
+    requests = [request for request in query if str(request.get('omit', 'false')).lower() != 'true']
+    omits = [request for request in query if str(request.get('omit', 'false')).lower() == 'true']
+    return (any(_match_request(fields, request) for request in requests)
+            and not any(_match_request(fields, request) for request in omits))
+
+
+def _match_request(fields, request):
+    return all(_match_value(fields.get(field, ''), str(criterion))
+               for field, criterion in request.items() if field != 'omit')
+
+
+def _match_value(value, criterion):
+    value = str(value).casefold()
+    criterion = criterion.casefold()
+    if criterion.startswith('=='):
+        return value == _unescape(criterion[2:])
+    if criterion == '=':
+        return value == ''
+    if re.search(r'(?<!\\)[*@]', criterion):
+        return fnmatchcase(value, _wildcard_pattern(criterion))
+    # Every word of the criterion must start a word of the value
+    words = re.findall(r'\w+', value)
+    return all(any(word.startswith(term) for word in words) for term in re.findall(r'\w+', _unescape(criterion)))
+
+
+def _wildcard_pattern(criterion):
+    # Translate a FileMaker wildcard find (* for any characters, @ for one character) to an fnmatch pattern
+    pattern = ''
+    escaped = False
+    for char in criterion:
+        if escaped or char in '[]?':
+            pattern += '[{}]'.format(char) if char in '[]?*' else char
+            escaped = False
+        elif char == '\\':
+            escaped = True
+        elif char == '@':
+            pattern += '?'
+        else:
+            pattern += char
+    return pattern
+
+
+def _unescape(value):
+    return re.sub(r'\\(.)', r'\1', value)
@@ -1,74 +1,544 @@
+import json
 import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import binpacking
 
+from .frames import iter_directory_sequences
+from .sequences import ImageSequence
+
+CHUNK_STRATEGIES = ('volume', 'balanced')
+
+
+class SizeCache:
+    """
+    An on-disk (SQLite) cache of directory sizes. Each directory is stored with the total size and number of the
+    regular files directly inside it and the names of its subdirectories, keyed by (path, st_ino, st_mtime_ns). A
+    directory's mtime changes whenever an entry is added, removed or renamed in it, so an unchanged directory can be
+    summed without listing it again. Files rewritten in place (same name, new size) do not touch the directory mtime
+    and will not be picked up until the directory itself changes.
+    """
+
+    _COLUMNS = ['path', 'ino', 'mtime_ns', 'file_size', 'file_count', 'subdirs']
+
+    def __init__(self, cache_path):
+        self.cache_path = cache_path
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._connection = sqlite3.connect(cache_path, check_same_thread=False)
+        columns = [row[1] for row in self._connection.execute('PRAGMA table_info(dirs)')]
+        if columns and columns != self._COLUMNS:
+            # Cache written by an older version without file counts, rebuild it
+            self._connection.execute('DROP TABLE dirs')
+        self._connection.execute('CREATE TABLE IF NOT EXISTS dirs ('
+                                 'path TEXT PRIMARY KEY, '
+                                 'ino INTEGER, '
+                                 'mtime_ns INTEGER, '
+                                 'file_size INTEGER, '
+                                 'file_count INTEGER, '
+                                 'subdirs TEXT)')
+        self._entries = {row[0]: row[1:] for row in self._connection.execute('SELECT * FROM dirs')}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def get(self, path, stat):
+        """
+        Look up a directory in the cache.
+        :param path: The directory path.
+        :param stat: The current os.stat_result of the directory.
+        :return: A tuple of (file_size, file_count, subdir_names) if the cached entry is still valid, else None.
+        """
+        entry = self._entries.get(path)
+        if entry is None:
+            return None
+        ino, mtime_ns, file_size, file_count, subdirs = entry
+        if ino != stat.st_ino or mtime_ns != stat.st_mtime_ns:
+            return None
+        return file_size, file_count, json.loads(subdirs)
+
+    def set(self, path, stat, file_size, file_count, subdir_names):
+        entry = (stat.st_ino, stat.st_mtime_ns, file_size, file_count, json.dumps(subdir_names))
+        with self._lock:
+            self._entries[path] = entry
+            self._pending[path] = entry
+
+    def save(self):
+        """
+        Write any new or updated entries to disk.
+        :return: None.
+        """
+        with self._lock:
+            rows = [(path,) + entry for path, entry in self._pending.items()]
+            self._pending = {}
+        with self._connection:
+            self._connection.executemany('INSERT OR REPLACE INTO dirs VALUES (?, ?, ?, ?, ?, ?)', rows)
+
+    def close(self):
+        self.save()
+        self._connection.close()
+
+
+class TransferCostModel:
+    """
+    Estimates how long an item takes to send: its bytes at the link rate, plus a fixed overhead per file (or per item
+    when count_files is False). Per-file setup dominates when sending many small frames, so a package of 200k EXRs
+    takes far longer than a single mov of the same size.
+    """
+
+    def __init__(self, bytes_per_second=104857600, seconds_per_file=0.05, count_files=True):
+        """
+        :param bytes_per_second: The expected sustained transfer rate.
+        :param seconds_per_file: The fixed cost of each file (or each item if count_files is False).
+        :param count_files: Whether the fixed cost scales with the number of files in an item.
+        """
+        self.bytes_per_second = bytes_per_second
+        self.seconds_per_file = seconds_per_file
+        self.count_files = count_files
+
+    def estimate(self, size, file_count):
+        """
+        :param size: The size of the item in bytes.
+        :param file_count: The number of files in the item.
+        :return: The estimated transfer time in seconds.
+        """
+        overhead_count = file_count if self.count_files else min(file_count, 1)
+        return size / self.bytes_per_second + overhead_count * self.seconds_per_file
+
 
 class Chunker:
 
-    def __init__(self):
-        pass
+    def __init__(self, max_workers=8, cache_path=None, cost_model=None):
+        """
+        :param max_workers: The maximum number of top-level items to scan concurrently. Scanning is I/O bound (stat
+                            calls over NFS), so a small thread pool overlaps the network latency of each walk.
+        :param cache_path: Optional path to a SizeCache database. If provided, unchanged directories are not re-listed
+                           on subsequent runs.
+        :param cost_model: Optional TransferCostModel. If provided, items are weighted by estimated transfer time
+                           instead of bytes, and each bin holds up to the time it takes to send chunk_size bytes.
+        """
+        self.max_workers = max_workers
+        self.cache_path = cache_path
+        self.cost_model = cost_model
+        self.size_cache = None
+        self.item_stats = {}  # {item: (size in bytes, file count)} for the items of the last chunk or iter_chunks call
 
-    def chunk(self, root_paths, chunk_size):
+    def chunk(self, root_paths, chunk_size, split_sequences=False, strategy='volume', num_bins=None):
         """
         Public facing method to chunk files in a directory into relatively constant size bins.
         :param root_paths: The directory to scan (items in the root_path directory will be chunked into bins).
         :param chunk_size: The target size (bytes) for each bin.
-        :return: A list of lists, each sublist representing a bin of roughly constant size.
+        :param split_sequences: If True, directories larger than chunk_size are broken up into their contents, and
+                                image sequences larger than chunk_size are split into frame ranges (ImageSequence
+                                items) that can be packed into different bins. Smaller items are kept whole.
+        :param strategy: 'volume' fills as many bins as needed up to chunk_size each. 'balanced' packs into exactly
+                         num_bins bins of roughly equal size, keeping the items of each shot together where possible
+                         (with split_sequences, items larger than an even share are split as well).
+        :param num_bins: The number of bins for the 'balanced' strategy.
+        :return: A list of lists, each sublist representing a bin of roughly constant size. Bins contain paths, or
+                 ImageSequence items when split_sequences is set.
         """
+        if strategy not in CHUNK_STRATEGIES:
+            raise ValueError('Invalid chunk strategy: {} (must be one of {})'.format(strategy, CHUNK_STRATEGIES))
+        if strategy == 'balanced' and not num_bins:
+            raise ValueError('The balanced chunk strategy requires num_bins.')
         print('Chunking paths to size {} (paths {})'.format(chunk_size, root_paths))
-        items = self._get_item_sizes(root_paths)
+        if self.cache_path:
+            with SizeCache(self.cache_path) as self.size_cache:
+                items = self._get_item_stats(root_paths)
+            self.size_cache = None
+        else:
+            items = self._get_item_stats(root_paths)
+        if split_sequences:
+            capacity = self._get_capacity(chunk_size)
+            if strategy == 'balanced':
+                capacity = min(capacity, sum(self._get_weight(stats) for stats in items.values()) / num_bins)
+            items = self._split_oversized_items(items, capacity)
+        self.item_stats = items
+        if strategy == 'balanced':
+            return self._chunk_items_balanced(items, num_bins, root_paths)
         return self._chunk_items(items, chunk_size)
 
-    @staticmethod
-    def _chunk_items(items, chunk_size):
+    def iter_chunks(self, root_paths, chunk_size, split_sequences=False, max_open_bins=4, seal_ratio=0.95,
+                    skip_paths=None, with_planned=False):
+        """
+        Streaming counterpart to chunk. Items are packed online (first fit) as their sizes come in from the scanner,
+        and each bin is yielded as soon as it is sealed, so bins can be processed while scanning continues. A bin is
+        sealed when it reaches seal_ratio of chunk_size, or when a new bin is needed and max_open_bins are already
+        open (the fullest open bin is sealed). Remaining bins are yielded once the scan completes. Packing is less
+        even than chunk, which sees every item before packing.
+        :param root_paths: The directory to scan (items in the root_path directory will be chunked into bins).
+        :param chunk_size: The target size (bytes) for each bin.
+        :param split_sequences: See chunk.
+        :param max_open_bins: The maximum number of bins held open for new items.
+        :param seal_ratio: The fraction of chunk_size at which a bin is considered full.
+        :param skip_paths: Optional collection of top-level item paths to leave out, e.g. those already planned by an
+                           interrupted run.
+        :param with_planned: If True, yield (bin, planned paths) tuples instead, where planned paths is a list of the
+                             top-level item paths whose items have all been yielded once the bin is. A job can record
+                             them to continue an interrupted scan with skip_paths.
+        :return: A generator of lists, each list representing a bin of roughly constant size.
+        """
+        print('Streaming chunks of size {} (paths {})'.format(chunk_size, root_paths))
+        self.item_stats = {}
+        chunks = self._iter_chunks(root_paths, chunk_size, split_sequences, max_open_bins, seal_ratio,
+                                   set(skip_paths or ()))
+        if not with_planned:
+            chunks = (chunk for chunk, _ in chunks)
+        if self.cache_path:
+            with SizeCache(self.cache_path) as self.size_cache:
+                yield from chunks
+            self.size_cache = None
+        else:
+            yield from chunks
+
+    def _iter_chunks(self, root_paths, chunk_size, split_sequences, max_open_bins, seal_ratio, skip_paths):
+        # Yields (bin, planned top-level paths) tuples
+        capacity = self._get_capacity(chunk_size)
+        seal_weight = capacity * seal_ratio
+        open_bins = []  # list of [weight, items]
+        item_paths = {}  # {item: top-level path} of the items not yet yielded
+        num_pending = {}  # {top-level path: number of its items not yet yielded}
+
+        def seal(bin_items):
+            planned = []
+            for bin_item in bin_items:
+                path = item_paths.pop(bin_item)
+                num_pending[path] -= 1
+                if not num_pending[path]:
+                    del num_pending[path]
+                    planned.append(path)
+            return bin_items, planned
+
+        for path, path_stats in self._iter_item_stats(root_paths, skip_paths):
+            items = {path: path_stats}
+            if split_sequences:
+                items = self._split_oversized_items(items, capacity)
+            self.item_stats.update(items)
+            num_pending[path] = len(items)
+            item_paths.update((item, path) for item in items)
+            for item, item_stats in items.items():
+                weight = self._get_weight(item_stats)
+                if weight >= seal_weight:
+                    yield seal([item])
+                    continue
+                target = next((bin_ for bin_ in open_bins if bin_[0] + weight <= capacity), None)
+                if target is None:
+                    if len(open_bins) >= max_open_bins:
+                        fullest = max(open_bins, key=lambda x: x[0])
+                        open_bins.remove(fullest)
+                        yield seal(fullest[1])
+                    target = [0, []]
+                    open_bins.append(target)
+                target[0] += weight
+                target[1].append(item)
+                if target[0] >= seal_weight:
+                    open_bins.remove(target)
+                    yield seal(target[1])
+        for _, items in open_bins:
+            yield seal(items)
+
+    def plan(self, chunks, cost_model=None):
+        """
+        Summarize a list of bins using the item stats gathered by the last chunk or iter_chunks call.
+        :param chunks: A list of lists of items, as returned by chunk.
+        :param cost_model: The TransferCostModel used to predict durations. Defaults to the chunker's cost model, or a
+                           default TransferCostModel if the chunker packs by bytes.
+        :return: A list of dicts (one per bin) with keys 'items', 'size', 'files' and 'duration' (in seconds).
+        """
+        cost_model = cost_model or self.cost_model or TransferCostModel()
+        summary = []
+        for chunk in chunks:
+            size = sum(self.item_stats[item][0] for item in chunk)
+            file_count = sum(self.item_stats[item][1] for item in chunk)
+            summary.append({
+                'items': len(chunk),
+                'size': size,
+                'files': file_count,
+                'duration': cost_model.estimate(size, file_count)
+            })
+        return summary
+
+    def _get_weight(self, item_stats):
+        size, file_count = item_stats
+        if self.cost_model is None:
+            return size
+        return self.cost_model.estimate(size, file_count)
+
+    def _get_capacity(self, chunk_size):
+        if self.cost_model is None:
+            return chunk_size
+        return self.cost_model.estimate(chunk_size, 0)
+
+    def _chunk_items(self, items, chunk_size):
         """
         Use binpacking library to chunk a set of files/directories into relatively constant volume bins.
-        :param items: A dict formatted as {filepath: size in bytes}
+        :param items: A dict formatted as {filepath or ImageSequence: (size in bytes, file count)}
         :param chunk_size: The optimal size (in bytes) to target for each bin.
-        :return: A list of lists, each sublist representing a bin of roughly constant size.
+        :return: A list of lists, each sublist representing a bin of roughly constant size (or roughly constant
+                 transfer time, with a cost model).
         """
-        result = []
         print('Packing bins...')
-        bins = binpacking.to_constant_volume(items, chunk_size)
-        for item in bins:
-            result.append(list(item.keys()))
+        # Pack by index so the original items (not numpy copies of the keys) are returned.
+        keys = list(items.keys())
+        weights = {index: self._get_weight(items[key]) for index, key in enumerate(keys)}
+        bins = binpacking.to_constant_volume(weights, self._get_capacity(chunk_size))
+        return [[keys[index] for index in item] for item in bins]
+
+    def _chunk_items_balanced(self, items, num_bins, root_paths):
+        """
+        Pack items into exactly num_bins bins of roughly equal weight. Items are grouped by shot (the first 7
+        characters of the name of the top-level item they come from) and each group is kept in one bin, unless it is
+        heavier than an even share of the total, in which case it is cut into runs of consecutive items no heavier
+        than that share. Groups are placed largest first into the lightest bin, then moved from the heaviest to the
+        lightest bin while that narrows the spread between them.
+        :param items: A dict formatted as {filepath or ImageSequence: (size in bytes, file count)}
+        :param num_bins: The number of bins to fill.
+        :param root_paths: The scanned directories, used to find the top-level item of any split out items.
+        :return: A list of num_bins lists (some may be empty if there are fewer groups than bins).
+        """
+        print('Packing {} balanced bins...'.format(num_bins))
+        keys = list(items.keys())
+        weights = [self._get_weight(items[key]) for key in keys]
+        target = sum(weights) / num_bins
+
+        shots = {}
+        for index, key in enumerate(keys):
+            shots.setdefault(self._get_shot_name(key, root_paths), []).append(index)
+        groups = []
+        for shot in sorted(shots):
+            indices = sorted(shots[shot], key=lambda x: str(keys[x]))
+            group, group_weight = [], 0
+            for index in indices:
+                if group and group_weight + weights[index] > target:
+                    groups.append(group)
+                    group, group_weight = [], 0
+                group.append(index)
+                group_weight += weights[index]
+            groups.append(group)
+
+        # Pack by group index so the original items are returned
+        group_weights = {index: sum(weights[i] for i in group) for index, group in enumerate(groups)}
+        bins = [list(bin_) for bin_ in binpacking.to_constant_bin_number(group_weights, num_bins)]
+        bin_weights = [sum(group_weights[index] for index in bin_) for bin_ in bins]
+        for _ in range(len(groups)):
+            heaviest = bin_weights.index(max(bin_weights))
+            lightest = bin_weights.index(min(bin_weights))
+            spread = bin_weights[heaviest] - bin_weights[lightest]
+            # Moving a group of weight w between the two bins leaves them |spread - 2w| apart
+            candidates = [index for index in bins[heaviest] if 0 < group_weights[index] < spread]
+            if not candidates:
+                break
+            index = min(candidates, key=lambda x: abs(spread - 2 * group_weights[x]))
+            bins[heaviest].remove(index)
+            bins[lightest].append(index)
+            bin_weights[heaviest] -= group_weights[index]
+            bin_weights[lightest] += group_weights[index]
+        return [[keys[i] for index in bin_ for i in groups[index]] for bin_ in bins]
+
+    @staticmethod
+    def _get_shot_name(item, root_paths):
+        path = item.path if isinstance(item, ImageSequence) else os.path.normpath(item)
+        for root_path in root_paths:
+            rel_path = os.path.relpath(path, root_path)
+            if not rel_path.startswith(os.pardir):
+                return rel_path.split(os.sep)[0][:7]
+        return os.path.basename(path)[:7]
+
+    def _split_oversized_items(self, items, capacity):
+        """
+        Break up any directory that does not fit in a bin into smaller items.
+        :param items: A dict formatted as {filepath: (size in bytes, file count)}
+        :param capacity: The weight limit for each bin (bytes, or seconds with a cost model).
+        :return: A dict formatted as {filepath or ImageSequence: (size in bytes, file count)}
+        """
+        result = {}
+        for item, item_stats in items.items():
+            if self._get_weight(item_stats) > capacity and os.path.isdir(item):
+                print('Splitting oversized item: {}'.format(item))
+                result.update(self._split_dir(item, capacity))
+            else:
+                result[item] = item_stats
         return result
 
-    def _scandir(self, path):
-        for filename in os.listdir(path):
-            yield os.path.join(path, filename)
+    def _split_dir(self, dir_path, capacity):
+        """
+        Replace a directory with its contents. Oversized subdirectories are split recursively, and image sequences
+        directly inside the directory are grouped (and split into frame ranges if they are oversized). Symlinks are
+        items of their own, sized by lstat.
+        :param dir_path: The directory to split.
+        :param capacity: The weight limit for each bin (bytes, or seconds with a cost model).
+        :return: A dict formatted as {filepath or ImageSequence: (size in bytes, file count)}
+        """
+        result = {}
+        file_sizes = {}
+        with os.scandir(dir_path) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    dir_stats = self._get_dir_stats(entry.path)
+                    if self._get_weight(dir_stats) > capacity:
+                        result.update(self._split_dir(entry.path, capacity))
+                    else:
+                        result[entry.path] = dir_stats
+                elif entry.is_file(follow_symlinks=False):
+                    file_sizes[entry.path] = entry.stat(follow_symlinks=False).st_size
+                elif entry.is_symlink():
+                    # Kept as an item of its own (and recreated as a link when copied), never part of a sequence
+                    result[entry.path] = (entry.stat(follow_symlinks=False).st_size, 1)
 
-    def _get_item_sizes(self, root_paths):
+        filenames = [os.path.basename(path) for path in file_sizes]
+        for item in iter_directory_sequences(dir_path, filenames):
+            if isinstance(item, ImageSequence):
+                result.update(self._split_sequence(item, file_sizes, capacity))
+            else:
+                result[item] = (file_sizes[item], 1)
+        return result
+
+    def _split_sequence(self, sequence, file_sizes, capacity):
+        """
+        Split an image sequence into contiguous frame ranges that fit in a bin (a single frame that does not fit gets
+        a range of its own). A sequence that already fits is returned whole.
+        :param sequence: The ImageSequence to split.
+        :param file_sizes: A dict formatted as {frame filepath: size in bytes}
+        :param capacity: The weight limit for each bin (bytes, or seconds with a cost model).
+        :return: A dict formatted as {ImageSequence: (size in bytes, file count)}
         """
-        Get the size of each item in the root path directory.
+        frame_sizes = [file_sizes[os.path.join(sequence.parent_path, sequence.get_frame_name(number))]
+                       for number in sequence.frame_numbers]
+        sequence_stats = (sum(frame_sizes), len(frame_sizes))
+        if self._get_weight(sequence_stats) <= capacity:
+            return {sequence: sequence_stats}
+
+        result = {}
+        numbers, size, weight = [], 0, 0
+        for number, frame_size in zip(sequence.frame_numbers, frame_sizes):
+            frame_weight = self._get_weight((frame_size, 1))
+            if numbers and weight + frame_weight > capacity:
+                result[self._get_sub_sequence(sequence, numbers)] = (size, len(numbers))
+                numbers, size, weight = [], 0, 0
+            numbers.append(number)
+            size += frame_size
+            weight += frame_weight
+        if numbers:
+            result[self._get_sub_sequence(sequence, numbers)] = (size, len(numbers))
+        return result
+
+    @staticmethod
+    def _get_sub_sequence(sequence, frame_numbers):
+        return ImageSequence.from_frame_numbers(frame_numbers, sequence.parent_path, sequence.prefix,
+                                                sequence.extension, sequence.padding)
+
+    @staticmethod
+    def _scandir(path):
+        with os.scandir(path) as entries:
+            return list(entries)
+
+    def _get_item_stats(self, root_paths):
+        """
+        Get the size and file count of each item in the root path directory. Top-level items are sized concurrently on
+        a bounded thread pool, and results are returned in directory listing order.
         :param root_paths: The directory to scan.
-        :return: A dictionary of items in the directory in the format {filepath: size in bytes}
+        :return: A dictionary of items in the directory in the format {filepath: (size in bytes, file count)}
         """
-        size_dict = {}
+        entries = []
         for path in root_paths:
             print('Scanning path: {}'.format(path))
-            items = self._scandir(path)
-            for item in items:
-                item_size = 0
-                print('Getting item size: {} '.format(item))
-                if os.path.isfile(item):
-                    item_size = os.path.getsize(item)
-                elif os.path.isdir(item):
-                    item_size = self._get_dir_size(item)
-                size_dict[item] = item_size
-                print('Item size is {}'.format(item_size))
-        return size_dict
+            entries += self._scandir(path)
 
-    @staticmethod
-    def _get_dir_size(dir_path):
+        stats_dict = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for entry, item_stats in zip(entries, executor.map(self._get_entry_stats, entries)):
+                stats_dict[entry.path] = item_stats
+                print('Item size is {} in {} files ({})'.format(item_stats[0], item_stats[1], entry.path))
+        return stats_dict
+
+    def _iter_item_stats(self, root_paths, skip_paths=()):
         """
-        Recursively walk a directory to get the total directory size.
+        Like _get_item_stats, but yields (filepath, (size in bytes, file count)) tuples in the order they are found.
+        :param root_paths: The directory to scan.
+        :param skip_paths: Top-level item paths not to scan.
+        :return: A generator of (filepath, (size in bytes, file count)) tuples.
+        """
+        entries = []
+        for path in root_paths:
+            print('Scanning path: {}'.format(path))
+            entries += [entry for entry in self._scandir(path) if entry.path not in skip_paths]
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self._get_entry_stats, entry): entry for entry in entries}
+            for future in as_completed(futures):
+                entry, item_stats = futures[future], future.result()
+                print('Item size is {} in {} files ({})'.format(item_stats[0], item_stats[1], entry.path))
+                yield entry.path, item_stats
+
+    def _get_entry_stats(self, entry):
+        """
+        Get the size and file count of a single top-level item. Symlinks are followed at the top level, matching
+        os.path.isfile and os.path.isdir.
+        :param entry: An os.DirEntry for the item.
+        :return: A tuple of (size in bytes, file count).
+        """
+        try:
+            if entry.is_file():
+                return entry.stat().st_size, 1
+            elif entry.is_dir():
+                return self._get_dir_stats(entry.path)
+        except OSError as e:
+            print('Error getting item size: {} ({})'.format(entry.path, e))
+        return 0, 0
+
+    def _get_dir_stats(self, dir_path):
+        """
+        Walk a directory to get the total directory size and file count. Uses os.scandir so the file type and size
+        come from the DirEntry (a single lstat per file at most, none for the type check on most filesystems).
+        Symlinks inside the directory are skipped, as with os.walk. If a size cache is active, directories whose inode
+        and mtime are unchanged are summed from the cache and only their subdirectories are visited.
         :param dir_path: The root directory path to traverse.
-        :return: The total size of the directory in bytes.
+        :return: A tuple of (total size of the directory in bytes, number of files in the directory).
         """
         total_size = 0
-        for root, dirs, files in os.walk(dir_path):
-            for file in files:
-                filepath = os.path.join(root, file)
-                if not os.path.islink(filepath):
-                    total_size += os.path.getsize(filepath)
-        return total_size
+        total_count = 0
+        stack = [dir_path]
+        while stack:
+            path = stack.pop()
+            try:
+                if self.size_cache is None:
+                    file_size, file_count, subdir_names = self._scan_dir(path)
+                else:
+                    stat = os.stat(path)
+                    cached = self.size_cache.get(path, stat)
+                    if cached is not None:
+                        file_size, file_count, subdir_names = cached
+                    else:
+                        file_size, file_count, subdir_names = self._scan_dir(path)
+                        self.size_cache.set(path, stat, file_size, file_count, subdir_names)
+            except OSError:
+                continue
+            total_size += file_size
+            total_count += file_count
+            stack += [os.path.join(path, name) for name in subdir_names]
+        return total_size, total_count
+
+    @staticmethod
+    def _scan_dir(path):
+        """
+        List a single directory.
+        :param path: The directory path.
+        :return: A tuple of (total size of the regular files directly in the directory, number of those files, list of
+                 subdirectory names).
+        """
+        file_size = 0
+        file_count = 0
+        subdir_names = []
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    subdir_names.append(entry.name)
+                elif entry.is_file(follow_symlinks=False):
+                    file_size += entry.stat(follow_symlinks=False).st_size
+                    file_count += 1
+        return file_size, file_count, subdir_names
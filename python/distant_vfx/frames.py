@@ -0,0 +1,115 @@
+import os
+from array import array
+
+import numpy as np
+
+from .constants import LEGAL_FRAME_EXTENSIONS
+from .utilities import iter_sequences_from_frame_groups
+
+
+class FrameAnalysis:
+    """
+    The frame ranges of a set of frame numbers. Runs and gaps are (N, 2) arrays of inclusive (first, last) ranges.
+    """
+
+    def __init__(self, frame_numbers):
+        """
+        :param frame_numbers: A NumPy array (or other sequence) of int frame numbers, in any order.
+        """
+        numbers = np.sort(np.asarray(frame_numbers, dtype=np.int64))
+        repeated = numbers[1:][np.diff(numbers) == 0]
+        self.duplicates = np.unique(repeated)
+        self.frames = np.unique(numbers)
+        self.count = len(self.frames)
+        if not self.count:
+            self.start = self.end = None
+            self.runs = self.gaps = np.empty((0, 2), dtype=np.int64)
+            return
+
+        self.start = int(self.frames[0])
+        self.end = int(self.frames[-1])
+        breaks = np.flatnonzero(np.diff(self.frames) > 1)
+        run_starts = self.frames[np.concatenate(([0], breaks + 1))]
+        run_ends = self.frames[np.concatenate((breaks, [self.count - 1]))]
+        self.runs = np.column_stack((run_starts, run_ends))
+        self.gaps = np.column_stack((run_ends[:-1] + 1, run_starts[1:] - 1))
+
+    @property
+    def missing_count(self):
+        return int((self.gaps[:, 1] - self.gaps[:, 0] + 1).sum())
+
+    def get_range_string(self):
+        """
+        :return: The frame runs as a compact string, e.g. '1001-1050,1052-1100' ('1051' for a single frame).
+        """
+        return ','.join(str(first) if first == last else '{}-{}'.format(first, last)
+                        for first, last in self.runs.tolist())
+
+
+def analyze_sequence(sequence):
+    """
+    :param sequence: An ImageSequence.
+    :return: A FrameAnalysis of the sequence's frames (read straight from its frame number array, without a copy).
+    """
+    return FrameAnalysis(np.frombuffer(sequence.frame_numbers, dtype=np.int32))
+
+
+def split_frame_names(filenames):
+    """
+    Split a directory listing of prefix.frame.extension filenames in bulk.
+    :param filenames: A list of filenames.
+    :return: A tuple of NumPy arrays (prefixes, frame strings, extensions, is_frame), where is_frame is True for names
+             that have a numeric frame and a legal frame extension.
+    """
+    names = np.asarray(filenames, dtype=str)
+    stems, dots, extensions = np.char.rpartition(names, '.').T
+    prefixes, frame_dots, frames = np.char.rpartition(stems, '.').T
+    legal_extensions = [extension.lstrip('.') for extension in LEGAL_FRAME_EXTENSIONS]
+    is_frame = (dots == '.') & (frame_dots == '.') & np.char.isdigit(frames) & np.isin(extensions, legal_extensions)
+    return prefixes, frames, extensions, is_frame
+
+
+def iter_directory_sequences(parent_path, filenames):
+    """
+    Group the numbered frames (prefix.frame.ext, with a legal frame extension) of a directory listing into image
+    sequences. Frame numbers are parsed into a NumPy array and grouped by (prefix, padding, extension) with vectorized
+    operations. Use this when a whole listing is already in memory, and utilities.iter_files_and_sequences to group a
+    stream of paths.
+    :param parent_path: The directory containing the files.
+    :param filenames: A list of filenames in the directory.
+    :return: A generator of file paths and ImageSequence instances. A lone frame is yielded as a file path.
+    """
+    if not len(filenames):
+        return
+    names = np.asarray(filenames, dtype=str)
+    prefixes, frames, extensions, is_frame = split_frame_names(names)
+    for name in names[~is_frame].tolist():
+        yield os.path.join(parent_path, name)
+    if not is_frame.any():
+        return
+
+    prefixes, frames, extensions = prefixes[is_frame], frames[is_frame], extensions[is_frame]
+    paddings = np.char.str_len(frames)
+    numbers = frames.astype(np.int64)
+    is_padded = (paddings > 1) & np.char.startswith(frames, '0')
+
+    # Group on an integer key combining the prefix, extension and padding, keeping frames in listing order within
+    # each group
+    unique_prefixes, prefix_codes = np.unique(prefixes, return_inverse=True)
+    unique_extensions, extension_codes = np.unique(extensions, return_inverse=True)
+    max_padding = int(paddings.max()) + 1
+    keys = (prefix_codes.ravel() * len(unique_extensions) + extension_codes.ravel()) * max_padding + paddings
+    unique_keys, inverse = np.unique(keys, return_inverse=True)
+    order = np.argsort(inverse.ravel(), kind='stable')
+    bounds = np.cumsum(np.bincount(inverse.ravel(), minlength=len(unique_keys)))[:-1]
+
+    groups = {}
+    for key, indices in zip(unique_keys.tolist(), np.split(order, bounds)):
+        key, padding = divmod(key, max_padding)
+        prefix_code, extension_code = divmod(key, len(unique_extensions))
+        group_numbers = array('i')
+        group_numbers.frombytes(numbers[indices].astype(np.int32).tobytes())
+        group_key = (str(unique_prefixes[prefix_code]), padding, str(unique_extensions[extension_code]))
+        groups[group_key] = [group_numbers, bool(is_padded[indices].any())]
+    yield from iter_sequences_from_frame_groups(parent_path, groups)
+
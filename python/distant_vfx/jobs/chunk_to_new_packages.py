@@ -1,33 +1,214 @@
-import subprocess
+import os
+import queue
+import threading
+from datetime import datetime
+from functools import partial
 
-from ..filesystem import Chunker
+from ..filesystem import Chunker, TransferCostModel
+from ..journal import ChunkJournal
+from ..sequences import ImageSequence
+from ..transfer import TransferEngine
 from . import new_package
 
 
 # Chunk out files in the provided paths to roughly equal sized new vendor delivery packages
-def main(dest_dir, paths, should_move=False):
+def main(dest_dir, paths, should_move=False, cache_path=None, split_sequences=False, max_workers=8,
+         link_mode=None, journal_path=None, streaming=False, cost_model=None, plan_only=False, num_chunks=None,
+         hash_algorithm=None):
 
-    # The target size for each new package (will get as close as possible without breaking up subfolders)
+    # The target size for each new package (will get as close as possible without breaking up subfolders, unless
+    # split_sequences is set)
     chunk_size = 16106127360  # 15 GB
     print('Target chunk size is {} bytes.'.format(chunk_size))
+    if cost_model is not None:
+        print('Balancing chunks by estimated transfer time ({:.1f} MB/s, {}s per file).'.format(
+            cost_model.bytes_per_second / 1048576, cost_model.seconds_per_file))
 
-    # Split into relatively constant volume bins (list of lists)
-    chunker = Chunker()
-    chunks = chunker.chunk(paths, chunk_size=chunk_size)
+    chunker = Chunker(cache_path=cache_path, cost_model=cost_model)
+    if num_chunks:
+        # Fill exactly num_chunks packages as evenly as possible, keeping shots together
+        print('Packing into {} balanced chunks.'.format(num_chunks))
+        chunk_options = {'strategy': 'balanced', 'num_bins': num_chunks}
+    else:
+        chunk_options = {}
 
-    # Create a new package for each chunk and copy the files.
-    for index, chunk in enumerate(chunks):
+    if plan_only:
+        chunks = chunker.chunk(paths, chunk_size=chunk_size, split_sequences=split_sequences, **chunk_options)
+        _print_plan(chunker, chunks)
+        return
+
+    if journal_path is None:
+        journal_path = _get_default_journal_path(dest_dir)
+    print('Writing job journal to {} (use it with --resume to continue an interrupted job).'.format(journal_path))
+
+    engine = TransferEngine(max_workers=max_workers, hash_algorithm=hash_algorithm, link_mode=link_mode)
+    if hash_algorithm:
+        print('Verifying copied files with {} and recording their digests in the journal.'.format(hash_algorithm))
+
+    if not streaming:
+        # Split into relatively constant volume bins (list of lists)
+        chunks = chunker.chunk(paths, chunk_size=chunk_size, split_sequences=split_sequences, **chunk_options)
+        _print_plan(chunker, chunks)
+
+        # Record the plan so an interrupted job can be resumed
+        with ChunkJournal.create(journal_path, dest_dir, paths, chunks, should_move=should_move,
+                                 link_mode=link_mode, hash_algorithm=hash_algorithm) as journal:
+            _copy_chunks(journal, engine)
+
+    else:
+        # Copy each bin as soon as it is sealed, while the scan continues in the background. The scan options are
+        # recorded so an interrupted scan can be continued on resume
+        cost_model_options = vars(cost_model) if cost_model is not None else None
+        with ChunkJournal.create(journal_path, dest_dir, paths, [], plan_complete=False, should_move=should_move,
+                                 link_mode=link_mode, hash_algorithm=hash_algorithm, chunk_size=chunk_size,
+                                 split_sequences=split_sequences, cache_path=cache_path,
+                                 cost_model=cost_model_options) as journal:
+            _copy_streamed_chunks(journal, chunker, engine)
+
+
+# Continue an interrupted chunk job, reusing its packages and skipping items that were already copied
+def resume(journal_path, max_workers=8):
+    with ChunkJournal.load(journal_path) as journal:
+        print('Resuming chunk job from journal {} ({} items already complete).'.format(journal_path,
+                                                                                      len(journal.completed)))
+        options = journal.plan['options']
+        engine = TransferEngine(max_workers=max_workers, hash_algorithm=options.get('hash_algorithm'),
+                                link_mode=options.get('link_mode'))
+        _copy_chunks(journal, engine)
+        if journal.plan_complete:
+            return
+        if 'chunk_size' not in options:  # journals from before scan options were recorded
+            print('Warning: this streaming job was interrupted before its scan finished. Only the {} bins planned '
+                  'so far were copied; chunk any remaining items in a new job.'.format(len(journal.plan['bins'])))
+            return
+        print('Continuing the scan, skipping the {} items already planned.'.format(len(journal.planned_paths)))
+        cost_model = options.get('cost_model')
+        chunker = Chunker(cache_path=options.get('cache_path'),
+                          cost_model=TransferCostModel(**cost_model) if cost_model else None)
+        _copy_streamed_chunks(journal, chunker, engine, resuming=True)
+
+
+def _copy_streamed_chunks(journal, chunker, engine, resuming=False):
+    options = journal.plan['options']
+    for chunk, planned_paths in _stream_chunks(chunker, journal.plan['root_paths'], options['chunk_size'],
+                                               options['split_sequences'], journal.planned_paths):
+        if resuming:
+            # Pieces of a split item may have been planned before the interruption, in bins that were recorded
+            chunk = [item for item in chunk if not journal.has_item(item)]
+        index = journal.record_bin(chunk, planned_paths)
         if chunk:
-            new_package_path = new_package.main(dest_dir)
-            print('Copying chunk {} of {} to path {} (chunk {})'.format(index + 1, len(chunks), new_package_path, chunk))
-            for item in chunk:
-                if not should_move:
-                    cmd = ['cp', '-r', item, new_package_path]
-                else:
-                    cmd = ['mv', item, new_package_path]
-                process = subprocess.Popen(cmd,
-                                        stdout=subprocess.PIPE,
-                                        stderr=subprocess.PIPE,
-                                        universal_newlines=True,
-                                        shell=False)
-                _, _ = process.communicate()
+            _print_chunk_plan(index, chunker.plan([chunk])[0])
+            _copy_chunk(journal, engine, index)
+    journal.record_plan_complete()
+
+
+def _stream_chunks(chunker, paths, chunk_size, split_sequences, skip_paths=None):
+    # Run the scan on a background thread, handing over (bin, planned paths) tuples as bins are sealed
+    chunks = queue.Queue()
+    errors = []
+
+    def scan():
+        try:
+            for chunk in chunker.iter_chunks(paths, chunk_size=chunk_size, split_sequences=split_sequences,
+                                             skip_paths=skip_paths, with_planned=True):
+                chunks.put(chunk)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            chunks.put(None)
+
+    thread = threading.Thread(target=scan, daemon=True)
+    thread.start()
+    while True:
+        chunk = chunks.get()
+        if chunk is None:
+            break
+        yield chunk
+    thread.join()
+    if errors:
+        raise errors[0]
+
+
+def _print_plan(chunker, chunks):
+    # Print the size, file count and predicted transfer time of each chunk
+    plan = chunker.plan(chunks)
+    for index, chunk_plan in enumerate(plan):
+        _print_chunk_plan(index, chunk_plan)
+    if plan:
+        durations = [chunk_plan['duration'] for chunk_plan in plan]
+        print('Planned {} chunks, predicted transfer time {} to {} per chunk ({} total).'.format(
+            len(plan), _format_duration(min(durations)), _format_duration(max(durations)),
+            _format_duration(sum(durations))))
+
+
+def _print_chunk_plan(index, chunk_plan):
+    print('Chunk {}: {} items, {} files, {} bytes, predicted transfer time {}'.format(
+        index + 1, chunk_plan['items'], chunk_plan['files'], chunk_plan['size'],
+        _format_duration(chunk_plan['duration'])))
+
+
+def _format_duration(seconds):
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return '{}:{:02d}:{:02d}'.format(hours, minutes, seconds)
+
+
+def _copy_chunks(journal, engine):
+    num_chunks = len(journal.plan['bins'])
+    for index in range(num_chunks):
+        _copy_chunk(journal, engine, index, num_chunks)
+
+
+def _copy_chunk(journal, engine, index, num_chunks=None):
+    # Create a new package for the chunk (unless the journal already has one) and copy any incomplete items
+    dest_dir = journal.plan['dest_dir']
+    paths = journal.plan['root_paths']
+    should_move = journal.plan['options'].get('should_move', False)
+    chunk = journal.get_bin(index)
+    chunk_label = '{} of {}'.format(index + 1, num_chunks) if num_chunks else str(index + 1)
+    if not chunk:
+        return
+
+    pending = [item_index for item_index in range(len(chunk)) if not journal.is_complete(index, item_index)]
+    if not pending:
+        print('Chunk {} is already complete.'.format(chunk_label))
+        return
+
+    new_package_path = journal.package_paths.get(index)
+    if new_package_path is None:
+        new_package_path = new_package.main(dest_dir)
+        journal.record_package(index, new_package_path)
+
+    print('Copying chunk {} to path {} (chunk {})'.format(chunk_label, new_package_path, chunk))
+    transfer_items = []
+    for item_index in pending:
+        item = chunk[item_index]
+        dest_path = _get_item_dest_dir(item, paths, new_package_path)
+        os.makedirs(dest_path, exist_ok=True)
+        transfer_items.append((item, dest_path))
+    stats = engine.transfer(transfer_items,
+                            move=should_move,
+                            on_item_complete=partial(_record_item, journal, index, pending))
+    print(stats)
+    for path, error in stats.errors:
+        print('Error copying {}: {}'.format(path, error))
+
+
+def _record_item(journal, bin_index, item_indices, transfer_index, success, checksums):
+    if success:
+        journal.record_item(bin_index, item_indices[transfer_index], checksums)
+
+
+def _get_default_journal_path(dest_dir):
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    return os.path.join(dest_dir, '.chunk_job_{}.journal'.format(timestamp))
+
+
+def _get_item_dest_dir(item, root_paths, package_path):
+    # Items split out of a larger folder keep their folder structure relative to the chunked root path
+    parent_path = item.parent_path if isinstance(item, ImageSequence) else os.path.dirname(item)
+    for root_path in root_paths:
+        rel_path = os.path.relpath(parent_path, root_path)
+        if not rel_path.startswith(os.pardir):
+            return os.path.normpath(os.path.join(package_path, rel_path))
+    return package_path
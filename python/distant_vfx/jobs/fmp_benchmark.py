@@ -0,0 +1,154 @@
+import asyncio
+import time
+
+from ..filemaker import CloudServerWrapper
+from ..filemaker_async import AsyncCloudServerWrapper
+from ..filemaker_standin import FileMakerStandIn, bulk_create_script
+from ..retry import RetryPolicy
+
+BENCHMARK_DB = 'Benchmark'
+BENCHMARK_LAYOUT = 'Versions'
+BENCHMARK_BULK_CREATE_SCRIPT = 'Bulk Create'
+
+
+def main(num_records=500, max_workers=8, latency=0.05, jitter=0.0, bad_json_rate=0.0, error_rate=0.0):
+    """
+    Run FileMaker request patterns against a local FileMakerStandIn and print the time, throughput and Data API
+    request counts of each.
+    :param num_records: The number of records to create and look up in each pattern.
+    :param max_workers: The number of concurrent requests for the concurrent patterns.
+    See FileMakerStandIn for the other parameters.
+    """
+    with FileMakerStandIn(latency=latency, jitter=jitter, bad_json_rate=bad_json_rate,
+                          error_rate=error_rate) as standin:
+        names = ['bm{:04d}_comp_v001'.format(i) for i in range(num_records)]
+        for name in names:
+            standin.add_record(BENCHMARK_DB, 'Lookup', {'Filename': name})
+        records = [{'Filename': name, 'VFXID': name[:6]} for name in names]
+        standin.register_script(BENCHMARK_BULK_CREATE_SCRIPT, bulk_create_script)
+
+        print(f'Benchmarking against {standin.url} ({num_records} records, {max_workers} workers, {latency}s latency, '
+              f'{bad_json_rate:.0%} bad JSON, {error_rate:.0%} errors)')
+        print(f'{"pattern":<32}{"seconds":>10}{"records/s":>12}{"failed":>8}{"retries":>9}  requests')
+        benchmarks = [
+            ('create_record (serial)', lambda fmp: [fmp.create_record(record) for record in records]),
+            ('create_records (threads)', lambda fmp: fmp.create_records(records, max_workers=max_workers)),
+            ('bulk_create_via_script', lambda fmp: fmp.bulk_create_via_script(
+                BENCHMARK_LAYOUT, records, script_name=BENCHMARK_BULK_CREATE_SCRIPT)),
+            ('find (one per name)', lambda fmp: [fmp.find([{'Filename': '==' + name}], layout='Lookup')
+                                                 for name in names]),
+            ('find_many', lambda fmp: fmp.find_many('Filename', names, layout='Lookup')),
+            ('find_iter (pages of 100)', lambda fmp: list(fmp.find_iter([{'Filename': 'bm*'}], page_size=100,
+                                                                        layout='Lookup'))),
+        ]
+        for name, func in benchmarks:
+            _run_benchmark(standin, name, num_records,
+                           lambda policy, measurement: _run_sync(standin, policy, measurement, func))
+        _run_benchmark(standin, 'async create_records', num_records,
+                       lambda policy, measurement: _run_coroutine(_run_async(standin, policy, measurement, records,
+                                                                             max_workers)))
+
+
+def serve(port=8443, latency=0.0, jitter=0.0, bad_json_rate=0.0, error_rate=0.0):
+    """
+    Run a FileMakerStandIn in the foreground, for running jobs against it.
+    """
+    standin = FileMakerStandIn(port=port, latency=latency, jitter=jitter, bad_json_rate=bad_json_rate,
+                               error_rate=error_rate)
+    print('FileMaker stand-in listening. Point jobs at it with:')
+    print(f'    export FMP_URL={standin.url} FMP_SERVER_TYPE=server FMP_CA_BUNDLE={standin.cert_path}')
+    try:
+        standin.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f'Requests served: {dict(standin.stats)}')
+        standin.stop()
+
+
+def _run_benchmark(standin, name, num_records, run):
+    policy = RetryPolicy(base_delay=0.05)  # a fresh retry budget and circuit breaker for each pattern
+    measurement = _Measurement(standin, policy)
+    failed = 0
+    try:
+        results = run(policy, measurement)
+        failed = sum(1 for result in results if isinstance(result, tuple) and result[1] is not None)
+    except Exception as e:
+        print(f'{name}: failed with {e!r}')
+    if measurement.seconds is None:  # failed before the pattern started, e.g. at login
+        return
+    seconds = measurement.seconds
+    stats = measurement.stats
+    requests = ', '.join(f'{key} {value}' for key, value in sorted(stats.items()) if key != 'requests')
+    print(f'{name:<32}{seconds:>10.2f}{num_records / seconds:>12.1f}{failed:>8}{measurement.retries:>9}  '
+          f'{stats["requests"]} ({requests})')
+
+
+class _Measurement:
+    # Times a pattern and counts its requests and retries, leaving out the login and logout around it
+
+    def __init__(self, standin, policy):
+        self.standin = standin
+        self.policy = policy
+        self.seconds = None
+        self.stats = None
+        self.retries = 0
+
+    def __enter__(self):
+        self.standin.reset_stats()
+        self._retries = self.policy.stats['retries']
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.seconds = time.perf_counter() - self._start
+        self.stats = self.standin.reset_stats()
+        self.retries = self.policy.stats['retries'] - self._retries
+
+
+def _run_sync(standin, policy, measurement, func):
+    fmp = CloudServerWrapper(**_connection_kwargs(standin, policy))
+    fmp.login()
+    try:
+        with measurement:
+            return func(fmp)
+    finally:
+        try:
+            fmp.logout()
+        except Exception as e:  # the pattern has already been measured
+            print(f'Logout failed with {e!r}')
+
+
+async def _run_async(standin, policy, measurement, records, max_workers):
+    fmp = AsyncCloudServerWrapper(max_concurrency=max_workers, **_connection_kwargs(standin, policy))
+    try:
+        await fmp.login()
+        with measurement:
+            return await fmp.create_records(records)
+    finally:
+        try:
+            await fmp.__aexit__(None, None, None)  # log out and close the connection pool
+        except Exception as e:
+            print(f'Logout failed with {e!r}')
+
+
+def _run_coroutine(coroutine):
+    # asyncio.run needs Python 3.7
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def _connection_kwargs(standin, policy):
+    return dict(url=standin.url,
+                user='benchmark',
+                password='benchmark',
+                database=BENCHMARK_DB,
+                layout=BENCHMARK_LAYOUT,
+                server_type='server',
+                verify_ssl=standin.cert_path,
+                token_cache=False,
+                query_cache=False,
+                retry_policy=policy)
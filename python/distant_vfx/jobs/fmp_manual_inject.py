@@ -3,20 +3,19 @@ import sys
 import traceback
 
 from ..filemaker import CloudServerWrapper
+from ..frames import analyze_sequence
 from ..sequences import ImageSequence
-from ..utilities import make_basename_map_from_file_path_list, parse_files_from_basename_map, dict_items_to_str
+from ..utilities import dict_items_to_str, iter_files_and_sequences
 from ..constants import FMP_URL, FMP_USERNAME, FMP_PASSWORD, FMP_ADMIN_DB, FMP_VERSIONS_LAYOUT, \
-    FMP_TRANSFER_LOG_LAYOUT, FMP_TRANSFER_DATA_LAYOUT, FMP_PROCESS_TRANSFER_DATA_SCRIPT
+    FMP_TRANSFER_LOG_LAYOUT, FMP_TRANSFER_DATA_LAYOUT, FMP_PROCESS_TRANSFER_DATA_SCRIPT, FMP_BULK_CREATE_SCRIPT
+
+INJECT_BATCH_SIZE = 1000  # items scanned, looked up and created at a time
 
 
 def main(package_path):
-    all_files = _scan_package_files(package_path)
-    basename_map = make_basename_map_from_file_path_list(all_files)
-    unique_paths = parse_files_from_basename_map(basename_map)
+    _check_not_shotgun_package(package_path)
     package_name = _get_package_name(package_path)
-    versions_list = _build_version_dicts(unique_paths, package_name)
     transfer_log = _build_transfer_log(package_path, package_name)
-    transfer_data_list = _build_transfer_data(unique_paths)
 
     with CloudServerWrapper(url=FMP_URL,
                             user=FMP_USERNAME,
@@ -26,42 +25,23 @@ def main(package_path):
                             ) as fmp:
         fmp.login()
 
-        for version in versions_list:
-            try:
-                version_name = version.get('Filename')
-                version_records = None
-                if version_name is not None:
-                    try:
-                        version_records = fmp.find([{'Filename': version_name}])
-                    except:
-                        if fmp.last_error == 401:
-                            pass
-                if not version_records:
-                    record_id = fmp.create_record(version)
-            except:
-                traceback.print_exc()
-
-        fmp.layout = FMP_TRANSFER_LOG_LAYOUT
         try:
-            transfer_log_id = fmp.create_record(transfer_log)
+            transfer_log_id, transfer_log_fields = fmp.create_record_and_fetch(transfer_log, ['PrimaryKey'],
+                                                                              layout=FMP_TRANSFER_LOG_LAYOUT)
+            transfer_log_primary_key = transfer_log_fields['PrimaryKey']
         except:
             traceback.print_exc()
-            transfer_log_id = ''
-
-        if transfer_log_id:
-            try:
-                transfer_log_primary_key = fmp.get_record(transfer_log_id).PrimaryKey
-            except:
-                traceback.print_exc()
-                transfer_log_primary_key = ''
-
-        fmp.layout = FMP_TRANSFER_DATA_LAYOUT
-        for transfer_data in transfer_data_list:
-            transfer_data['Foriegnkey'] = transfer_log_primary_key
-            try:
-                transfer_data_id = fmp.create_record(transfer_data)
-            except:
-                traceback.print_exc()
+            transfer_log_primary_key = ''
+
+        # Scan the package lazily, creating the versions and transfer data of each batch of items as it comes
+        for unique_paths in _iter_batches(_scan_package_items(package_path), INJECT_BATCH_SIZE):
+            versions_list = _build_version_dicts(unique_paths, package_name)
+            _create_new_versions(fmp, versions_list)
+
+            transfer_data_list = _build_transfer_data(unique_paths)
+            for transfer_data in transfer_data_list:
+                transfer_data['Foriegnkey'] = transfer_log_primary_key
+            _create_records(fmp, transfer_data_list, layout=FMP_TRANSFER_DATA_LAYOUT)
 
         # Run script to process transfer data
         res = _run_process_transfer_data_records_script(fmp, transfer_log_primary_key)
@@ -69,28 +49,89 @@ def main(package_path):
         print(f'Data injection complete for package: {package_path}')
 
 
+def _create_new_versions(fmp, versions_list):
+    # Look up the versions in a few batched finds, then create the ones that do not exist yet
+    version_names = [version.get('Filename') for version in versions_list]
+    try:
+        version_records = fmp.find_many('Filename', version_names)
+    except:
+        traceback.print_exc()
+        version_records = {}
+    new_versions = {}  # several files (e.g. a mov and an exr sequence) can share a version
+    for version in versions_list:
+        version_name = version.get('Filename')
+        if not version_records.get(version_name) and version_name not in new_versions:
+            new_versions[version_name] = version
+    _create_records(fmp, list(new_versions.values()))
+
+
+def _create_records(fmp, records, layout=None):
+    # Create the records many per request if the bulk create script is installed, otherwise concurrently
+    if FMP_BULK_CREATE_SCRIPT:
+        try:
+            fmp.bulk_create_via_script(layout, records)
+        except Exception as e:
+            num_created = len(getattr(e, 'created_primary_keys', []))
+            print(f'Error creating records ({num_created} of {len(records)} created): {e}')
+        return
+    results = fmp.create_records(records, layout=layout)
+    for record, (record_id, error) in zip(records, results):
+        if error is not None:
+            print(f'Error creating record (data: {record}): {error}')
+
+
 def _run_process_transfer_data_records_script(fmp, transfer_log_key):
     script_res = None
     try:
         script_res = fmp.perform_script(
             name=FMP_PROCESS_TRANSFER_DATA_SCRIPT,
-            param=transfer_log_key
+            param=transfer_log_key,
+            layout=FMP_TRANSFER_DATA_LAYOUT
         )
     except:
         traceback.print_exc()
     return script_res
 
 
-def _scan_package_files(package_path):
+def _check_not_shotgun_package(package_path):
+    # Walk the package once before any records are created, so a Shotgun package is not half injected
     for root, dirs, files in os.walk(package_path):
         for file in files:
             if os.path.splitext(file)[1] == '.csv':
                 sys.exit('Please ingest this package using Shotgun.')
-            elif file.startswith('.'):
-                continue
-            else:
-                path = os.path.join(root, file)
-                yield path
+
+
+def _scan_package_items(package_path):
+    # Stream the package's paths through the sequence detector, yielding files and sequences as they are found
+    for item in iter_files_and_sequences(_iter_package_files(package_path)):
+        if isinstance(item, ImageSequence):
+            _check_sequence_frames(item)
+        yield item
+
+
+def _iter_package_files(package_path):
+    for root, dirs, files in os.walk(package_path):
+        for file in files:
+            if not file.startswith('.'):
+                yield os.path.join(root, file)
+
+
+def _iter_batches(items, batch_size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _check_sequence_frames(sequence):
+    analysis = analyze_sequence(sequence)
+    if analysis.missing_count:
+        print('Warning: {} is missing {} frames (has {})'.format(sequence.path, analysis.missing_count,
+                                                               analysis.get_range_string()))
 
 
 def _build_version_dicts(unique_files, package_name):
@@ -149,17 +190,18 @@ def _build_transfer_data(unique_paths):
 
 
 @dict_items_to_str
-def _build_one_transfer_data_dict(filepath):
-    if isinstance(filepath, ImageSequence):
-        filename = filepath.name
-        filepath = filepath.path
+def _build_one_transfer_data_dict(file):
+    if isinstance(file, ImageSequence):
+        filename = file.name
+        filepath = file.path
     else:
-        filename = os.path.basename(filepath)
-    start_frame, end_frame = _get_start_and_end_frame(filepath)
+        filename = os.path.basename(file)
+        filepath = file
+    start_frame, end_frame = _get_start_and_end_frame(file)
     transfer_data = {
         'Filename': filename,
         'Path': filepath,
-        'VersionLink': _get_version_name_from_path(filepath),
+        'VersionLink': _get_version_name_from_path(file),
         'Frame Start': start_frame,
         'Frame End': end_frame
     }
@@ -0,0 +1,58 @@
+import time
+
+import yagmail
+
+from ..outbox import Outbox, OutboxFlusher
+from ..constants import FMP_URL, FMP_USERNAME, FMP_PASSWORD, FMP_OUTBOX_PATH, EMAIL_USERNAME, EMAIL_PASSWORD
+
+
+def main(outbox_path=None, max_workers=4, follow=False, interval=5.0, retry_failed=False, status=False):
+    """
+    Send the FileMaker writes queued in the outbox.
+    :param outbox_path: The outbox database, FMP_OUTBOX_PATH by default.
+    :param max_workers: The number of entities flushed concurrently.
+    :param follow: Keep running, flushing every interval seconds, instead of exiting once nothing is due.
+    :param interval: The number of seconds between flushes when following.
+    :param retry_failed: Queue the writes that were given up on to be tried again first.
+    :param status: Only print the number of writes in each state.
+    """
+    outbox_path = outbox_path or FMP_OUTBOX_PATH
+    if not outbox_path:
+        print('No outbox path given and FMP_OUTBOX_PATH is not set. Exiting.')
+        return
+
+    outbox = Outbox(outbox_path)
+    if status:
+        print(f'Outbox {outbox_path}: {outbox.counts()}')
+        return
+    if retry_failed:
+        print(f'Queued {outbox.retry_failed()} failed writes to be retried.')
+
+    try:
+        with outbox.lock():
+            with OutboxFlusher(outbox, max_workers=max_workers, send_email=_send_email, url=FMP_URL,
+                               user=FMP_USERNAME, password=FMP_PASSWORD) as flusher:
+                while True:
+                    flushed = flusher.flush()
+                    if flushed:
+                        print(f'Flushed {flushed} writes. Outbox: {outbox.counts()}')
+                    outbox.prune()
+                    if not follow:
+                        break
+                    time.sleep(interval)
+    except BlockingIOError:
+        print(f'Another flusher is running for {outbox_path}. Exiting.')
+    except KeyboardInterrupt:
+        pass
+
+
+def _send_email(recipients, subject, content):
+    yag = yagmail.SMTP(
+        user=EMAIL_USERNAME,
+        password=EMAIL_PASSWORD
+    )
+    yag.send(
+        to=recipients,
+        subject=subject,
+        contents=content
+    )
@@ -1,4 +1,3 @@
-import traceback
 from copy import deepcopy
 from ..filemaker import CloudServerWrapper
 from ..parsers import ExcelNotesParser
@@ -45,12 +44,12 @@ def main(xlsx_path):
                             layout=FMP_NOTES_LAYOUT
                             ) as fmp:
         fmp.login()
-        for record in fmp_records:
-            try:
-                record_id = fmp.create_record(record)
+        results = fmp.create_records(fmp_records)
+        for record, (record_id, error) in zip(fmp_records, results):
+            if error is None:
                 print(f'Note record created (data: {record})')
-            except:
-                traceback.print_exc()
+            else:
+                print(f'Error creating note record (data: {record}): {error}')
 
 
 @dict_items_to_str
@@ -8,7 +8,8 @@ import traceback
 from . import edl_lowercase_loc
 from ..filemaker import CloudServerWrapper
 from ..constants import FMP_URL, FMP_USERNAME, FMP_PASSWORD, FMP_EDIT_DB, FMP_CUTHISTORY_LAYOUT, \
-    FMP_CUTHISTORYSHOTS_LAYOUT, FMP_ADMIN_DB, FMP_IMAGES_LAYOUT, FMP_PROCESS_IMAGE_SCRIPT, LEGAL_THUMB_EXTENSIONS
+    FMP_CUTHISTORYSHOTS_LAYOUT, FMP_ADMIN_DB, FMP_IMAGES_LAYOUT, FMP_PROCESS_IMAGE_SCRIPT, LEGAL_THUMB_EXTENSIONS, \
+    FMP_BULK_CREATE_SCRIPT
 
 
 class smpteTC:  # Class for dealing SMPTE Timecode
@@ -180,12 +181,18 @@ def _inject_reel(edl_dict, reel_dict):
                             ) as fmp:
         fmp.login()
 
-        # Import event records
-        for line in edl_dict:
+        # Import event records, many per request if the bulk create script is installed
+        if FMP_BULK_CREATE_SCRIPT:
             try:
-                record_id = fmp.create_record(line)
-            except:
-                traceback.print_exc()
+                fmp.bulk_create_via_script(FMP_CUTHISTORYSHOTS_LAYOUT, edl_dict)
+            except Exception as e:
+                num_created = len(getattr(e, 'created_primary_keys', []))
+                print(f'Error creating event records ({num_created} of {len(edl_dict)} created): {e}')
+        else:
+            results = fmp.create_records(edl_dict)
+            for line, (record_id, error) in zip(edl_dict, results):
+                if error is not None:
+                    print('Error creating event record {}: {}'.format(line, error))
 
         # Import reel record
         fmp.layout = FMP_CUTHISTORY_LAYOUT
@@ -223,18 +230,15 @@ def _inject_stills(root_path):
             try:
                 filename, filepath = still[0], still[1]
                 record_data = {'Filename': filename}
-                record_id = fmp.create_record(record_data)
-                file = open(filepath, 'rb')
-                image_did_upload = fmp.upload_container(record_id, field_name='Image', file_=file)
-                file.close()
+                with open(filepath, 'rb') as file:
+                    record_id, image_fields = fmp.create_record_and_fetch(record_data, ['PrimaryKey'])
+                    image_did_upload = fmp.upload_container(record_id, field_name='Image', file_=file)
             except:
                 traceback.print_exc()
 
             if image_did_upload:
                 try:
-                    image_record = fmp.get_record(record_id)
-                    primary_key = image_record.PrimaryKey
-                    script_result = fmp.perform_script(FMP_PROCESS_IMAGE_SCRIPT, param=primary_key)
+                    script_result = fmp.perform_script(FMP_PROCESS_IMAGE_SCRIPT, param=image_fields['PrimaryKey'])
                 except:
                     traceback.print_exc()
 
@@ -1,10 +1,10 @@
 import os
-import subprocess
 from . import new_package
 from ..constants import TO_EDT_MAILBOX_PATH
+from ..transfer import TransferEngine
 
 
-def main(scan_dir, output_dir=TO_EDT_MAILBOX_PATH, new_delivery=True):
+def main(scan_dir, output_dir=TO_EDT_MAILBOX_PATH, new_delivery=True, max_workers=8):
 
     # Get all dnx files in pkg
     dnx_files = _find_dnx_files(scan_dir)
@@ -21,22 +21,19 @@ def main(scan_dir, output_dir=TO_EDT_MAILBOX_PATH, new_delivery=True):
         print(f'Creating new package: {output_dir}')
 
     print('Copying files...')
-    for dnx in dnx_files:
-        _copy_dnx(dnx, output_dir)
-
-
-def _copy_dnx(dnx_path, output_dir):
-    try:
-        cmd = ['cp', dnx_path, output_dir]
-        process = subprocess.Popen(cmd,
-                                   stdout=subprocess.PIPE,
-                                   stderr=subprocess.PIPE,
-                                   universal_newlines=True,
-                                   shell=False)
-        _, _ = process.communicate()
-        print(f'Copied dnx file: {dnx_path}')
-    except:
-        print(f'Error copying dnx file: {dnx_path}')
+    _copy_dnx_files(dnx_files, output_dir, max_workers)
+
+
+def _copy_dnx_files(dnx_paths, output_dir, max_workers):
+    engine = TransferEngine(max_workers=max_workers)
+    stats = engine.transfer([(dnx, output_dir) for dnx in dnx_paths])
+    failed = {path for path, _ in stats.errors}
+    for dnx in dnx_paths:
+        if dnx in failed:
+            print(f'Error copying dnx file: {dnx}')
+        else:
+            print(f'Copied dnx file: {dnx}')
+    print(stats)
 
 
 def _find_dnx_files(root_path):
@@ -0,0 +1,171 @@
+import json
+import os
+
+from .sequences import ImageSequence
+
+
+class ChunkJournal:
+    """
+    An append-only JSON lines journal for a chunk job. The first line records the plan (destination, source paths,
+    options and the items in each bin); later lines record each package directory as it is created and each item as
+    it finishes copying, with the digests of its files if the job hashes them. For streaming jobs the plan starts
+    empty and each bin is recorded as it is sealed, with the top-level paths it completes, so an interrupted scan can
+    be continued. Every line is flushed and synced to disk as it is written, so a killed run leaves a journal that can
+    be resumed from the last completed item.
+    """
+
+    def __init__(self, journal_path):
+        self.journal_path = journal_path
+        self.plan = None
+        self.plan_complete = False
+        self.package_paths = {}  # {bin index: package path}
+        self.completed = set()  # {(bin index, item index)}
+        self.checksums = {}  # {destination path: hex digest}
+        self.planned_paths = set()  # top-level paths whose items are all in recorded bins (streaming jobs)
+        self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @classmethod
+    def create(cls, journal_path, dest_dir, root_paths, bins, plan_complete=True, **options):
+        """
+        Start a new journal.
+        :param journal_path: The path of the journal file to create.
+        :param dest_dir: The directory in which new packages are created.
+        :param root_paths: The paths whose contents were chunked.
+        :param bins: A list of lists of items (paths or ImageSequences), as returned by Chunker.chunk.
+        :param plan_complete: False if more bins will be added with record_bin (streaming jobs).
+        :param options: Any other job options to restore on resume (e.g. should_move=True).
+        :return: A ChunkJournal instance.
+        """
+        journal = cls(journal_path)
+        journal.plan = {
+            'dest_dir': dest_dir,
+            'root_paths': list(root_paths),
+            'options': options,
+            'bins': [[cls._serialize_item(item) for item in bin_items] for bin_items in bins],
+            'complete': plan_complete
+        }
+        journal.plan_complete = plan_complete
+        journal._append({'event': 'plan', 'plan': journal.plan})
+        return journal
+
+    @classmethod
+    def load(cls, journal_path):
+        """
+        Read an existing journal so the job can be resumed. A partially written last line (from a run killed
+        mid-write) is ignored.
+        :param journal_path: The path of the journal file.
+        :return: A ChunkJournal instance.
+        """
+        journal = cls(journal_path)
+        with open(journal_path, 'r') as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                event = record.get('event')
+                if event == 'plan':
+                    journal.plan = record['plan']
+                    journal.plan_complete = journal.plan.get('complete', True)
+                elif event == 'bin':
+                    journal.plan['bins'].append(record['items'])
+                    journal.planned_paths.update(record.get('planned', []))
+                elif event == 'plan_complete':
+                    journal.plan_complete = True
+                elif event == 'package':
+                    journal.package_paths[record['bin']] = record['path']
+                elif event == 'item':
+                    journal.completed.add((record['bin'], record['item']))
+                    journal.checksums.update(record.get('checksums', {}))
+        if journal.plan is None:
+            raise ValueError('No chunk plan found in journal: {}'.format(journal_path))
+        return journal
+
+    @property
+    def bins(self):
+        return [self.get_bin(index) for index in range(len(self.plan['bins']))]
+
+    def get_bin(self, bin_index):
+        return [self._deserialize_item(item) for item in self.plan['bins'][bin_index]]
+
+    def record_bin(self, bin_items, planned_paths=None):
+        """
+        Add a bin to the plan.
+        :param bin_items: A list of items (paths or ImageSequences).
+        :param planned_paths: Optional list of the top-level paths whose items are all planned once this bin is.
+        :return: The index of the new bin.
+        """
+        items = [self._serialize_item(item) for item in bin_items]
+        self.plan['bins'].append(items)
+        record = {'event': 'bin', 'items': items}
+        if planned_paths:
+            self.planned_paths.update(planned_paths)
+            record['planned'] = list(planned_paths)
+        self._append(record)
+        return len(self.plan['bins']) - 1
+
+    def has_item(self, item):
+        """
+        :return: True if the item (a path or ImageSequence) is in a recorded bin.
+        """
+        serialized = self._serialize_item(item)
+        return any(serialized in bin_items for bin_items in self.plan['bins'])
+
+    def record_plan_complete(self):
+        self.plan_complete = True
+        self._append({'event': 'plan_complete'})
+
+    def record_package(self, bin_index, package_path):
+        self.package_paths[bin_index] = package_path
+        self._append({'event': 'package', 'bin': bin_index, 'path': package_path})
+
+    def record_item(self, bin_index, item_index, checksums=None):
+        """
+        :param checksums: Optional dict formatted as {destination path: hex digest} of the item's files.
+        """
+        self.completed.add((bin_index, item_index))
+        record = {'event': 'item', 'bin': bin_index, 'item': item_index}
+        if checksums:
+            self.checksums.update(checksums)
+            record['checksums'] = checksums
+        self._append(record)
+
+    def is_complete(self, bin_index, item_index):
+        return (bin_index, item_index) in self.completed
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _append(self, record):
+        if self._file is None:
+            self._file = open(self.journal_path, 'a')
+        self._file.write(json.dumps(record) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    @staticmethod
+    def _serialize_item(item):
+        if isinstance(item, ImageSequence):
+            return {
+                'parent_path': item.parent_path,
+                'prefix': item.prefix,
+                'extension': item.extension,
+                'padding': item.padding,
+                'frames': item.get_range_string()
+            }
+        return str(item)
+
+    @staticmethod
+    def _deserialize_item(item):
+        if isinstance(item, dict):
+            return ImageSequence.from_range_string(item['frames'], item['parent_path'], item['prefix'],
+                                                   item['extension'], item['padding'])
+        return item
@@ -0,0 +1,148 @@
+import atexit
+import json
+import os
+import threading
+import time
+from collections import Counter
+
+METRICS_FORMATS = ('jsonl', 'prometheus')
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class RequestMetrics:
+    """
+    Thread safe counters for FileMaker requests, kept per (method, database, layout): the number of calls, a latency
+    histogram, the number of retries, bytes uploaded and a count of each error code. A call is counted once, with its
+    latency including any retries. The counters are cumulative and can be dumped as JSON lines (appended, one line per
+    method/database/layout) or in the Prometheus text format (overwritten, e.g. for the node exporter's textfile
+    collector).
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """
+        :param buckets: The upper bounds in seconds of the latency histogram buckets.
+        """
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def record(self, method, database, layout, seconds, retries=0, error_code=None):
+        """
+        :param error_code: The FileMaker error code, or the kind of failure (e.g. 'bad_json'), if the call failed.
+        """
+        with self._lock:
+            series = self._get_series(method, database, layout)
+            series['count'] += 1
+            series['latency_sum'] += seconds
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series['latency_buckets'][i] += 1
+            series['retries'] += retries
+            if error_code is not None:
+                series['errors'][str(error_code)] += 1
+
+    def record_upload(self, method, database, layout, num_bytes):
+        with self._lock:
+            self._get_series(method, database, layout)['bytes_uploaded'] += num_bytes
+
+    def to_json_lines(self):
+        now = time.time()
+        lines = []
+        with self._lock:
+            for (method, database, layout), series in sorted(self._series.items()):
+                lines.append(json.dumps({
+                    'time': now,
+                    'pid': os.getpid(),
+                    'method': method,
+                    'database': database,
+                    'layout': layout,
+                    'count': series['count'],
+                    'retries': series['retries'],
+                    'bytes_uploaded': series['bytes_uploaded'],
+                    'errors': dict(series['errors']),
+                    'latency_sum': series['latency_sum'],
+                    'latency_buckets': {str(bound): count for bound, count in zip(self.buckets,
+                                                                                  series['latency_buckets'])},
+                }))
+        return ''.join(line + '\n' for line in lines)
+
+    def to_prometheus(self):
+        metrics = {
+            'fmp_requests_total': ('counter', 'FileMaker Data API calls.', []),
+            'fmp_request_duration_seconds': ('histogram', 'FileMaker Data API call latency, including retries.', []),
+            'fmp_request_retries_total': ('counter', 'FileMaker Data API request retries.', []),
+            'fmp_request_errors_total': ('counter', 'Failed FileMaker Data API calls by error code.', []),
+            'fmp_uploaded_bytes_total': ('counter', 'Bytes uploaded to FileMaker container fields.', []),
+        }
+        with self._lock:
+            for (method, database, layout), series in sorted(self._series.items()):
+                labels = 'method="{}",database="{}",layout="{}"'.format(_escape_label(method),
+                                                                        _escape_label(database),
+                                                                        _escape_label(layout))
+                metrics['fmp_requests_total'][2].append('{{{}}} {}'.format(labels, series['count']))
+                samples = metrics['fmp_request_duration_seconds'][2]
+                for bound, count in zip(self.buckets, series['latency_buckets']):
+                    samples.append('_bucket{{{},le="{}"}} {}'.format(labels, bound, count))
+                samples.append('_bucket{{{},le="+Inf"}} {}'.format(labels, series['count']))
+                samples.append('_sum{{{}}} {}'.format(labels, series['latency_sum']))
+                samples.append('_count{{{}}} {}'.format(labels, series['count']))
+                metrics['fmp_request_retries_total'][2].append('{{{}}} {}'.format(labels, series['retries']))
+                for code, count in sorted(series['errors'].items()):
+                    metrics['fmp_request_errors_total'][2].append('{{{},code="{}"}} {}'.format(
+                        labels, _escape_label(code), count))
+                metrics['fmp_uploaded_bytes_total'][2].append('{{{}}} {}'.format(labels, series['bytes_uploaded']))
+
+        lines = []
+        for name, (metric_type, help_text, samples) in metrics.items():
+            lines.append('# HELP {} {}'.format(name, help_text))
+            lines.append('# TYPE {} {}'.format(name, metric_type))
+            lines.extend(name + sample for sample in samples)
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, path, metrics_format='jsonl'):
+        """
+        :param path: The file to write to. JSON lines are appended; Prometheus text replaces the file atomically.
+        :param metrics_format: One of METRICS_FORMATS.
+        """
+        if metrics_format == 'prometheus':
+            temp_path = '{}.{}.tmp'.format(path, os.getpid())
+            with open(temp_path, 'w') as file:
+                file.write(self.to_prometheus())
+            os.replace(temp_path, path)
+        else:
+            with open(path, 'a') as file:
+                file.write(self.to_json_lines())
+
+    def dump_periodically(self, path, metrics_format='jsonl', interval=None):
+        """
+        Dump the metrics when the process exits and, if interval is given, every interval seconds on a background
+        thread.
+        """
+        atexit.register(self.dump, path, metrics_format)
+        if interval:
+            self._schedule_dump(path, metrics_format, interval)
+
+    def _schedule_dump(self, path, metrics_format, interval):
+        def dump():
+            try:
+                self.dump(path, metrics_format)
+            except OSError as e:
+                print(f'Could not write FileMaker metrics to {path}: {e}')
+            self._schedule_dump(path, metrics_format, interval)
+
+        self._timer = threading.Timer(interval, dump)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _get_series(self, method, database, layout):
+        key = (method, database or '', layout or '')
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = {'count': 0, 'latency_sum': 0.0, 'latency_buckets': [0] * len(self.buckets),
+                                          'retries': 0, 'bytes_uploaded': 0, 'errors': Counter()}
+        return series
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
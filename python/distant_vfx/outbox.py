@@ -0,0 +1,402 @@
+import fcntl
+import json
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing, contextmanager
+
+from fmrest.exceptions import FileMakerError
+
+from .filemaker import CloudServerWrapper, _escape_find_value
+
+_REF_KEY = '$outbox_ref'
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    entity TEXT NOT NULL,
+    ref TEXT,
+    action TEXT NOT NULL,
+    database_name TEXT NOT NULL,
+    layout TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS outbox_status_entity ON outbox (status, entity, id);
+'''
+
+
+def ref(name, key):
+    """
+    A placeholder for a value that is only known once an earlier write of the same entity has been flushed, e.g.
+    ref('transfer_log', 'PrimaryKey') for the primary key of the record created by the write queued with
+    ref='transfer_log'. Placeholders can be used anywhere in a write's record, parameter or path.
+    """
+    return {_REF_KEY: [name, key]}
+
+
+class Outbox:
+    """
+    A durable, local queue of FileMaker writes in a SQLite database, so that callers (e.g. the Shotgun event plugins)
+    can queue their writes in milliseconds and leave it to a separate flusher (OutboxFlusher) to send them when
+    FileMaker is available.
+
+    Writes are queued per entity (e.g. a version name), in batches that are committed atomically. The writes of an
+    entity are flushed in the order they were queued, and a write that fails holds back the later writes of its entity
+    until it succeeds, so a write can depend on the result of an earlier one through ref(). A failing write is retried
+    with exponential backoff, and after max_attempts it and the writes queued behind it are marked failed.
+
+    Usage:
+        outbox = Outbox(FMP_OUTBOX_PATH)
+        with outbox.batch(version_name, FMP_ADMIN_DB) as batch:
+            batch.create(FMP_TRANSFER_LOG_LAYOUT, transfer_log, find=[transfer_log], fields=['PrimaryKey'],
+                         ref='transfer_log')
+            batch.create(FMP_TRANSFER_DATA_LAYOUT, dict(transfer_data, Foriegnkey=ref('transfer_log', 'PrimaryKey')),
+                         key_fields=['PublishedFileID', 'Foriegnkey'])
+            batch.email(EMAIL_RECIPIENTS.split(','), subject, contents)
+    """
+
+    def __init__(self, path, max_attempts=10, base_delay=5.0, max_delay=600.0):
+        """
+        :param path: The path of the SQLite database (created if it does not exist).
+        :param max_attempts: The number of times a write is tried before it is marked failed.
+        :param base_delay: The delay in seconds before a failed write is first retried, doubled for each attempt.
+        :param max_delay: The maximum delay in seconds between attempts.
+        """
+        self.path = path
+        self.lock_path = path + '.lock'
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        with closing(self._connect()) as connection:
+            connection.execute('PRAGMA journal_mode=WAL')  # let writers queue while the flusher reads
+            connection.executescript(_SCHEMA)
+
+    @contextmanager
+    def batch(self, entity, database):
+        """
+        Queue writes for an entity, committed together when the block exits without an exception.
+        :param entity: The key the writes are ordered by, e.g. a version name.
+        :param database: The FileMaker database the writes are sent to.
+        """
+        batch = _OutboxBatch(entity, database)
+        yield batch
+        now = time.time()
+        with closing(self._connect()) as connection, connection:
+            connection.executemany(
+                'INSERT INTO outbox (entity, ref, action, database_name, layout, payload, created_at, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                [(entity, ref_name, action, database, layout, json.dumps(payload), now, now)
+                 for ref_name, action, layout, payload in batch.writes])
+
+    @contextmanager
+    def lock(self):
+        """
+        Hold the flusher lock, so that only one flusher drains the outbox at a time. Raises BlockingIOError if another
+        process holds it.
+        """
+        with open(self.lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def ready_entities(self, limit=100):
+        """
+        :return: The entities whose oldest pending write is due, oldest first.
+        """
+        with closing(self._connect()) as connection:
+            rows = connection.execute(
+                'SELECT outbox.entity FROM outbox JOIN '
+                '(SELECT entity, MIN(id) AS head_id FROM outbox WHERE status = ? GROUP BY entity) AS heads '
+                'ON outbox.id = heads.head_id WHERE outbox.next_attempt_at <= ? ORDER BY outbox.id LIMIT ?',
+                ('pending', time.time(), limit)).fetchall()
+        return [row['entity'] for row in rows]
+
+    def pending_writes(self, entity):
+        """
+        :return: The pending writes of an entity in order, as dicts with their payloads decoded.
+        """
+        with closing(self._connect()) as connection:
+            rows = connection.execute('SELECT * FROM outbox WHERE entity = ? AND status = ? ORDER BY id',
+                                      (entity, 'pending')).fetchall()
+        return [dict(row, payload=json.loads(row['payload'])) for row in rows]
+
+    def results(self, entity, before_id):
+        """
+        :return: A dict formatted as {ref: result} of the flushed writes of an entity queued before before_id. A ref
+                 used more than once maps to the latest result.
+        """
+        with closing(self._connect()) as connection:
+            rows = connection.execute(
+                'SELECT ref, result FROM outbox WHERE entity = ? AND status = ? AND ref IS NOT NULL AND id < ? '
+                'ORDER BY id', (entity, 'done', before_id)).fetchall()
+        return {row['ref']: json.loads(row['result']) for row in rows}
+
+    def mark_done(self, write_id, result):
+        with closing(self._connect()) as connection, connection:
+            connection.execute('UPDATE outbox SET status = ?, result = ?, error = NULL, updated_at = ? WHERE id = ?',
+                               ('done', json.dumps(result), time.time(), write_id))
+
+    def mark_attempt_failed(self, write, error):
+        """
+        Record a failed attempt, scheduling a retry or, after max_attempts, marking the write and the later pending
+        writes of its entity failed.
+        :return: True if the write will be retried.
+        """
+        attempts = write['attempts'] + 1
+        now = time.time()
+        with closing(self._connect()) as connection, connection:
+            if attempts < self.max_attempts:
+                delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+                connection.execute('UPDATE outbox SET attempts = ?, next_attempt_at = ?, error = ?, updated_at = ? '
+                                   'WHERE id = ?', (attempts, now + delay, error, now, write['id']))
+                return True
+            connection.execute('UPDATE outbox SET status = ?, attempts = ?, error = ?, updated_at = ? WHERE id = ?',
+                               ('failed', attempts, error, now, write['id']))
+            connection.execute('UPDATE outbox SET status = ?, error = ?, updated_at = ? '
+                               'WHERE entity = ? AND status = ? AND id > ?',
+                               ('failed', 'Held back by failed outbox write {}'.format(write['id']), now,
+                                write['entity'], 'pending', write['id']))
+            return False
+
+    def retry_failed(self):
+        """
+        Queue the failed writes to be tried again.
+        :return: The number of writes queued.
+        """
+        with closing(self._connect()) as connection, connection:
+            cursor = connection.execute('UPDATE outbox SET status = ?, attempts = 0, next_attempt_at = 0, '
+                                        'updated_at = ? WHERE status = ?', ('pending', time.time(), 'failed'))
+            return cursor.rowcount
+
+    def prune(self, max_age=7 * 24 * 3600):
+        """
+        Delete the flushed writes of entities with nothing pending that were last updated more than max_age seconds
+        ago.
+        :return: The number of writes deleted.
+        """
+        with closing(self._connect()) as connection, connection:
+            cursor = connection.execute(
+                'DELETE FROM outbox WHERE status = ? AND updated_at < ? '
+                'AND entity NOT IN (SELECT entity FROM outbox WHERE status = ?)',
+                ('done', time.time() - max_age, 'pending'))
+            return cursor.rowcount
+
+    def counts(self):
+        """
+        :return: A dict formatted as {status: number of writes}.
+        """
+        with closing(self._connect()) as connection:
+            rows = connection.execute('SELECT status, COUNT(*) AS count FROM outbox GROUP BY status').fetchall()
+        return {row['status']: row['count'] for row in rows}
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.row_factory = sqlite3.Row
+        return connection
+
+
+class _OutboxBatch:
+    # Collects the writes of an Outbox.batch block
+
+    def __init__(self, entity, database):
+        self.entity = entity
+        self.database = database
+        self.writes = []
+
+    def create(self, layout, record, fields=None, find=None, key_fields=None, missing_if=None, when=None, ref=None):
+        """
+        :param record: A field data dict.
+        :param fields: Optional list of field names of the new record to read back into the result.
+        :param find: Optional query. If it matches a record, no record is created and the result is the first match.
+        :param key_fields: Optional list of field names of record that identify it. Used as an exact match find
+                           query, built when the write is flushed, so values given as ref() can be part of the key.
+        :param missing_if: Optional dict formatted as {field name: value}. A matched record with any of these values is
+                           treated as missing, so a record is created.
+        :param when: Optional ref(). The write is skipped if its value is falsy.
+        :param ref: Optional name for later writes of the entity to refer to the result by. The result has the
+                    record_id, whether the record was created and the values of fields.
+        """
+        self._add(ref, 'create', layout, {'record': record, 'fields': fields or [], 'find': find,
+                                          'key_fields': key_fields, 'missing_if': missing_if}, when)
+
+    def upload(self, layout, record_id, field_name, path, when=None, ref=None):
+        """
+        Upload a file, read when the write is flushed, to a container field.
+        """
+        self._add(ref, 'upload', layout, {'record_id': record_id, 'field_name': field_name, 'path': path}, when)
+
+    def script(self, layout, name, param=None, when=None, ref=None):
+        self._add(ref, 'script', layout, {'name': name, 'param': param}, when)
+
+    def email(self, recipients, subject, contents, when=None, ref=None):
+        """
+        Send an email once the earlier writes of the entity have been flushed. Needs an OutboxFlusher with send_email.
+        """
+        self._add(ref, 'email', '', {'recipients': recipients, 'subject': subject, 'contents': contents}, when)
+
+    def _add(self, ref_name, action, layout, payload, when):
+        if when is not None:
+            payload['when'] = when
+        self.writes.append((ref_name, action, layout, payload))
+
+
+class OutboxFlusher:
+    """
+    Sends the writes queued in an Outbox to FileMaker. Entities are flushed concurrently, each on one thread and in
+    order, through one shared CloudServerWrapper per database.
+    """
+
+    def __init__(self, outbox, max_workers=4, batch_size=100, send_email=None, **wrapper_kwargs):
+        """
+        :param outbox: An Outbox.
+        :param max_workers: The number of entities flushed concurrently.
+        :param batch_size: The maximum number of entities flushed in each pass.
+        :param send_email: Optional callable taking recipients, subject and contents, used for email writes.
+        :param wrapper_kwargs: The url, user and password, and any other CloudServerWrapper parameters.
+        """
+        self.outbox = outbox
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+        self.send_email = send_email
+        self.wrapper_kwargs = wrapper_kwargs
+        self.stats = {'flushed': 0, 'retrying': 0, 'failed': 0}
+        self._wrappers = {}
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        for fmp in self._wrappers.values():
+            fmp.logout()
+        self._wrappers.clear()
+
+    def flush(self):
+        """
+        Flush the writes that are due, until there are none left.
+        :return: The number of writes flushed.
+        """
+        flushed = 0
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while True:
+                entities = self.outbox.ready_entities(limit=self.batch_size)
+                num_flushed = sum(executor.map(self.flush_entity, entities))
+                flushed += num_flushed
+                if not num_flushed:  # nothing due, or every due entity failed again
+                    return flushed
+
+    def flush_entity(self, entity):
+        """
+        Flush the pending writes of an entity in order, stopping at the first that fails or is not yet due.
+        :return: The number of writes flushed.
+        """
+        writes = self.outbox.pending_writes(entity)
+        if not writes:
+            return 0
+        results = self.outbox.results(entity, writes[0]['id'])
+        flushed = 0
+        for write in writes:
+            if write['next_attempt_at'] > time.time():
+                break
+            try:
+                result = self._perform(write, results)
+            except Exception as e:
+                error = f'{type(e).__name__}: {e}'
+                will_retry = self.outbox.mark_attempt_failed(write, error)
+                self._count('retrying' if will_retry else 'failed')
+                print(f'Outbox write {write["id"]} ({write["action"]} on {write["layout"]} for {entity}) failed '
+                      f'on attempt {write["attempts"] + 1}{"" if will_retry else ", giving up"}: {error}')
+                break
+            self.outbox.mark_done(write['id'], result)
+            if write['ref']:
+                results[write['ref']] = result
+            self._count('flushed')
+            flushed += 1
+        return flushed
+
+    def _perform(self, write, results):
+        payload = _resolve(write['payload'], results)
+        if 'when' in payload and not payload['when']:
+            return None  # skipped, and so are later writes that depend on its result
+        if write['action'] == 'email':
+            if self.send_email is None:
+                raise ValueError('Outbox email write flushed without a send_email function')
+            self.send_email(payload['recipients'], payload['subject'], payload['contents'])
+            return {'sent': True}
+        fmp = self._get_wrapper(write['database_name'], write['layout'])
+        layout, action = write['layout'], write['action']
+        if action == 'create':
+            return self._create(fmp, layout, payload)
+        if action == 'upload':
+            with open(payload['path'], 'rb') as file:
+                fmp.upload_container(payload['record_id'], field_name=payload['field_name'], file_=file,
+                                     layout=layout)
+            return {'record_id': payload['record_id']}
+        if action == 'script':
+            return {'result': fmp.perform_script(payload['name'], param=payload['param'], layout=layout)}
+        raise ValueError(f'Unknown outbox action: {action}')
+
+    @staticmethod
+    def _create(fmp, layout, payload):
+        fields = payload['fields']
+        query = payload['find']
+        if payload.get('key_fields'):
+            query = [{field: '==' + _escape_find_value(payload['record'][field]) for field in payload['key_fields']}]
+        if query:
+            try:
+                records = fmp.find(query, limit=1, layout=layout)
+            except FileMakerError:
+                if fmp.last_error != 401:  # no records match the request
+                    raise
+                records = []
+            for record in records:
+                missing_if = payload['missing_if'] or {}
+                if not any(record[field] == value for field, value in missing_if.items()):
+                    return dict({field: record[field] for field in fields}, record_id=record.record_id,
+                                created=False)
+        if fields:
+            record_id, values = fmp.create_record_and_fetch(payload['record'], fields, layout=layout)
+        else:
+            record_id, values = fmp.create_record(payload['record'], layout=layout), {}
+        return dict(values, record_id=record_id, created=True)
+
+    def _get_wrapper(self, database, layout):
+        with self._lock:
+            fmp = self._wrappers.get(database)
+            if fmp is None:
+                fmp = CloudServerWrapper(database=database, layout=layout, query_cache=False, **self.wrapper_kwargs)
+                fmp.login()
+                self._wrappers[database] = fmp
+            return fmp
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+
+def _resolve(value, results):
+    # Replace ref() placeholders with the results of earlier writes. A ref to a skipped write resolves to None
+    if isinstance(value, dict):
+        if set(value) == {_REF_KEY}:
+            name, key = value[_REF_KEY]
+            if name not in results:
+                raise KeyError(f'No flushed outbox write with ref {name!r}')
+            result = results[name]
+            return None if result is None else result[key]
+        return {k: _resolve(v, results) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_resolve(v, results) for v in value]
+    return value
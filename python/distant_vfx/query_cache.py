@@ -0,0 +1,68 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+class QueryCache:
+    """
+    An in-memory, thread safe cache of FileMaker find results, keyed by (database, layout, query, sort, limit, offset).
+    Entries expire ttl seconds after they are stored, and the least recently used entries are evicted once there are
+    more than max_entries. Meant to be shared by all connections in a process, with writes invalidating the cached
+    results of the layout written to.
+    """
+
+    def __init__(self, ttl=60.0, max_entries=1024):
+        """
+        :param ttl: The number of seconds a result is cached for.
+        :param max_entries: The maximum number of cached results.
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(database, layout, query, sort=None, limit=None, offset=None):
+        # Queries are lists of dicts, so serialize them into a hashable key
+        return (database, layout, json.dumps(query, sort_keys=True, default=str),
+                json.dumps(sort, sort_keys=True, default=str), limit, offset)
+
+    def get(self, key):
+        """
+        :param key: A key from make_key.
+        :return: The cached value, or None if there is no value or it has expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                if entry is not None:
+                    del self._entries[key]
+                self.stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def invalidate(self, database, layout=None):
+        """
+        Remove the cached results for a layout, or for every layout in the database if layout is None.
+        """
+        with self._lock:
+            keys = [key for key in self._entries if key[0] == database and (layout is None or key[1] == layout)]
+            for key in keys:
+                del self._entries[key]
+            self.stats['invalidations'] += len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,106 @@
+import random
+import threading
+import time
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of sending a request while a RetryPolicy's circuit breaker is open.
+    """
+    pass
+
+
+class RetryPolicy:
+    """
+    Decides when and how long to wait before retrying a failed request. Delays use exponential backoff with full
+    jitter (a random delay between 0 and base_delay * 2 ** attempt, capped at max_delay), so processes that fail
+    together do not retry together. Retries are drawn from a budget that refills at budget_refill retries per second,
+    so a struggling server is not flooded with retries. After failure_threshold consecutive failed requests the
+    circuit breaker opens and requests fail fast with CircuitOpenError for cool_down seconds, after which a single
+    trial request is let through to test the server. A policy is thread safe and is meant to be shared by all
+    connections to a server and database in a process.
+    """
+
+    def __init__(self, tries=3, base_delay=0.5, max_delay=8.0, budget=20, budget_refill=1.0, failure_threshold=5,
+                 cool_down=30.0):
+        """
+        :param tries: The maximum number of attempts per request.
+        :param base_delay: The maximum delay in seconds before the first retry. Doubles with each further retry.
+        :param max_delay: The cap in seconds on the maximum delay.
+        :param budget: The maximum number of retries available at once.
+        :param budget_refill: The number of retries added back to the budget per second.
+        :param failure_threshold: The number of consecutive failures after which the circuit breaker opens.
+        :param cool_down: The number of seconds the circuit breaker stays open.
+        """
+        self.tries = tries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget
+        self.budget_refill = budget_refill
+        self.failure_threshold = failure_threshold
+        self.cool_down = cool_down
+        self.stats = {'requests': 0, 'retries': 0, 'failures': 0, 'budget_exhausted': 0, 'rejected': 0}
+        self._lock = threading.Lock()
+        self._tokens = float(budget)
+        self._refilled_at = time.monotonic()
+        self._consecutive_failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+
+    def before_request(self):
+        """
+        Call before each attempt.
+        :raises CircuitOpenError: If the circuit breaker is open.
+        """
+        with self._lock:
+            if self._opened_at is not None:
+                if time.monotonic() - self._opened_at < self.cool_down or self._trial_in_flight:
+                    self.stats['rejected'] += 1
+                    raise CircuitOpenError('FileMaker requests suspended after {} consecutive failures'.format(
+                        self._consecutive_failures))
+                # Half open: let one trial request through
+                self._trial_in_flight = True
+            self.stats['requests'] += 1
+
+    def record_success(self):
+        with self._lock:
+            self._consecutive_failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def release_trial(self):
+        """
+        Call when an attempt ends without telling whether the server is healthy (e.g. it raised an unexpected
+        exception), so a half open circuit breaker lets another trial request through.
+        """
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.stats['failures'] += 1
+            self._consecutive_failures += 1
+            if self._trial_in_flight or self._consecutive_failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+    def get_retry_delay(self, attempt):
+        """
+        Take a retry from the budget after a failed attempt.
+        :param attempt: The number of the failed attempt, starting at 0.
+        :return: The number of seconds to wait before retrying, or None if the request should not be retried.
+        """
+        if attempt + 1 >= self.tries:
+            return None
+        with self._lock:
+            if self._opened_at is not None:
+                return None
+            now = time.monotonic()
+            self._tokens = min(self.budget, self._tokens + (now - self._refilled_at) * self.budget_refill)
+            self._refilled_at = now
+            if self._tokens < 1:
+                self.stats['budget_exhausted'] += 1
+                return None
+            self._tokens -= 1
+            self.stats['retries'] += 1
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
@@ -24,10 +24,9 @@ class Screening:
         print('Searching for files, please wait...')
         records = self._get_records_from_filemaker()
 
-        if not records:
-            self._handle_no_records(records)
-
+        has_records = False
         for version_record in records:
+            has_records = True
             version_name = self._get_version_name_from_record(version_record)
             path = self._get_filepath_from_record(version_record)
 
@@ -47,6 +46,9 @@ class Screening:
             self.cut_order_map[path] = cut_order
             self.file_paths.append(path)
 
+        if not has_records:
+            self._handle_no_records(records)
+
         # Sort files by cut order, then alphabetically
         self._sort_file_paths()
 
@@ -76,15 +78,8 @@ class Screening:
                                 ) as fmp:
             fmp.login()
 
-            records = None
-            try:
-                records = fmp.find([self.query], limit=500)
-            except:
-                if fmp.last_error == 401:
-                    pass
-                else:
-                    raise
-            return records
+            # Page through the screening as records are consumed
+            yield from fmp.find_iter([self.query], page_size=500)
 
     @staticmethod
     def _get_cut_order_from_record(record):
@@ -233,7 +228,7 @@ class FastFindMovie(Screening):
                                 ) as fmp:
             fmp.login()
 
-            records = None
+            records = []
             try:
                 records = fmp.find([self.query],
                                    limit=self.num_versions,
@@ -1,46 +1,161 @@
 import os
+import re
+from array import array
 
 
 class ImageSequence:
+    """
+    A numbered image sequence in a single directory (e.g. sh010_comp_v001.1001.exr to sh010_comp_v001.1100.exr). Only
+    the shared prefix, padding and extension are kept, with the frame numbers in an int array, so sequences of
+    hundreds of thousands of frames stay small. Frame filenames are rebuilt on demand.
+    """
+
+    __slots__ = ('parent_path', 'prefix', 'extension', 'padding', '_numbers', '_start', '_end', '_sorted')
 
     def __init__(self, frames, parent_path):
+        """
+        :param frames: A list of frame filenames, formatted as prefix.frame.extension (in any order).
+        :param parent_path: The directory containing the frames.
+        """
         self.parent_path = parent_path
-        self.frames = frames
-        self._split = frames[0].split('.')
-        self._sorted = False
+        split = frames[0].split('.')
+        self.prefix = '.'.join(split[:-2])
+        self.extension = split[-1]
+        self.padding = len(split[-2])
+        self._set_numbers(array('i', [int(frame.split('.')[-2]) for frame in frames]))
+
+    @classmethod
+    def from_frame_numbers(cls, frame_numbers, parent_path, prefix, extension, padding):
+        """
+        Build a sequence from frame numbers that have already been parsed.
+        :param frame_numbers: An iterable of int frame numbers.
+        :param parent_path: The directory containing the frames.
+        :param prefix: The filename before the frame number (e.g. 'sh010_comp_v001').
+        :param extension: The filename extension, without the dot.
+        :param padding: The minimum number of digits in a frame number.
+        :return: An ImageSequence instance.
+        """
+        sequence = cls.__new__(cls)
+        sequence.parent_path = parent_path
+        sequence.prefix = prefix
+        sequence.extension = extension
+        sequence.padding = padding
+        sequence._set_numbers(array('i', frame_numbers))
+        return sequence
+
+    @classmethod
+    def from_range_string(cls, range_string, parent_path, prefix, extension, padding):
+        """
+        Build a sequence from a range string, as returned by get_range_string.
+        :param range_string: A string of comma separated frames and frame ranges, e.g. '1001-1050,1052-1100'.
+        :return: An ImageSequence instance (see from_frame_numbers for the other parameters).
+        """
+        frame_numbers = array('i')
+        for match in re.finditer(r'(-?\d+)(?:-(-?\d+))?', range_string):
+            first = int(match.group(1))
+            last = int(match.group(2)) if match.group(2) is not None else first
+            frame_numbers.extend(range(first, last + 1))
+        return cls.from_frame_numbers(frame_numbers, parent_path, prefix, extension, padding)
 
     def __repr__(self):
         return self.name
 
+    def __len__(self):
+        return len(self._numbers)
+
     @property
     def path(self):
         return os.path.join(self.parent_path, self.name)
 
     @property
     def name(self):
-        # frame_len = len(self._split[-2]) TODO: DELETE ME
-        return self.basename + '.[' + str(self.start) + '-' + str(self.end) + '].' + self.extension
+        return '{}.[{}-{}].{}'.format(self.prefix, self._pad(self.start), self._pad(self.end), self.extension)
 
     @property
     def basename(self):
-        return self._split[0]
-
-    @property
-    def extension(self):
-        return self._split[-1]
+        return self.prefix.split('.')[0]
 
     @property
     def start(self):
-        if not self._sorted:
-            self._sort_frames()
-        return self.frames[0]
+        return self._start
 
     @property
     def end(self):
+        return self._end
+
+    @property
+    def frame_numbers(self):
+        """
+        :return: The frame numbers as an array('i'), in ascending order.
+        """
         if not self._sorted:
-            self._sort_frames()
-        return self.frames[-1]
+            self._numbers = array('i', sorted(self._numbers))
+            self._sorted = True
+        return self._numbers
+
+    @property
+    def frames(self):
+        """
+        :return: A list of frame filenames, in frame order.
+        """
+        return [self.get_frame_name(number) for number in self.frame_numbers]
+
+    def get_frame_name(self, number):
+        return '{}.{}.{}'.format(self.prefix, self._pad(number), self.extension)
+
+    def get_ranges(self):
+        """
+        :return: A list of (first, last) tuples, one for each run of consecutive frames.
+        """
+        ranges = []
+        numbers = self.frame_numbers
+        first = last = numbers[0]
+        for number in numbers[1:]:
+            if number > last + 1:
+                ranges.append((first, last))
+                first = number
+            last = number
+        ranges.append((first, last))
+        return ranges
+
+    def get_gaps(self):
+        """
+        Find the gaps between the runs of consecutive frames, from the sorted frame numbers. Memory use depends on the
+        number of frames, not on the distance between start and end.
+        :return: A list of (first, last) tuples, one for each run of missing frame numbers.
+        """
+        ranges = self.get_ranges()
+        return [(last + 1, first - 1) for (_, last), (first, _) in zip(ranges, ranges[1:])]
+
+    def get_missing_frames(self):
+        """
+        :return: A list of the frame numbers missing between start and end.
+        """
+        return [number for first, last in self.get_gaps() for number in range(first, last + 1)]
+
+    def get_range_string(self):
+        """
+        :return: The frame ranges as a compact string, e.g. '1001-1050,1052-1100' ('1051' for a single frame).
+        """
+        return ','.join(str(first) if first == last else '{}-{}'.format(first, last)
+                        for first, last in self.get_ranges())
+
+    def _set_numbers(self, numbers):
+        # Find start and end, and whether the frames are already in order, in one pass
+        start = end = previous = numbers[0]
+        is_sorted = True
+        for number in numbers:
+            if number < previous:
+                is_sorted = False
+            if number < start:
+                start = number
+            elif number > end:
+                end = number
+            previous = number
+        self._numbers = numbers
+        self._start = start
+        self._end = end
+        self._sorted = is_sorted
 
-    def _sort_frames(self):
-        self.frames.sort(key=lambda x: int(x.split('.')[-2]))
-        self._sorted = True
+    def _pad(self, number):
+        return '{:0{}d}'.format(number, self.padding)
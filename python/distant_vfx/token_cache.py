@@ -0,0 +1,102 @@
+import fcntl
+import json
+import os
+import time
+import uuid
+from contextlib import contextmanager
+
+
+class TokenCache:
+    """
+    An on-disk cache of FileMaker Data API session tokens, shared between processes and keyed by (url, user,
+    database). The cache is a JSON file guarded by an flock on a sidecar lock file. Data API sessions expire after 15
+    minutes without a request, so a token is only handed out if it was last used less than max_idle seconds ago.
+    """
+
+    def __init__(self, cache_path, max_idle=840):
+        """
+        :param cache_path: The path of the JSON cache file (created if it does not exist).
+        :param max_idle: The number of seconds since a token was last used after which it is treated as expired.
+        """
+        self.cache_path = cache_path
+        self.lock_path = cache_path + '.lock'
+        self.max_idle = max_idle
+
+    @staticmethod
+    def make_key(url, user, database):
+        return '{}|{}|{}'.format(url, user, database)
+
+    @contextmanager
+    def lock(self):
+        """
+        Hold the cache lock exclusively, e.g. around a login so that only one process logs in for a given key.
+        """
+        with open(self.lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def get(self, key):
+        """
+        :param key: A key from make_key.
+        :return: The cached token, or None if there is no token or it has been idle too long.
+        """
+        entry = self._read().get(key)
+        if entry is None or time.time() - entry['last_used'] > self.max_idle:
+            return None
+        return entry['token']
+
+    def set(self, key, token):
+        """
+        Store a token (marking it as just used). Call while holding lock().
+        """
+        entries = self._read()
+        entries[key] = {'token': token, 'last_used': time.time()}
+        self._write(entries)
+
+    def touch(self, key, token):
+        """
+        Mark a token as just used, if it is still the cached token for the key.
+        """
+        with self.lock():
+            entries = self._read()
+            entry = entries.get(key)
+            if entry is not None and entry['token'] == token:
+                entry['last_used'] = time.time()
+                self._write(entries)
+
+    def invalidate(self, key, token):
+        """
+        Remove a token that the server rejected. A newer token stored by another process is left alone. Call while
+        holding lock().
+        """
+        entries = self._read()
+        entry = entries.get(key)
+        if entry is not None and entry['token'] == token:
+            del entries[key]
+            self._write(entries)
+
+    def _read(self):
+        try:
+            with open(self.cache_path, 'r') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def _write(self, entries):
+        # Write to a new temporary file, readable by the owner only from the start, and rename it into place, so
+        # readers never see a partial file
+        temp_path = '{}.{}.tmp'.format(self.cache_path, uuid.uuid4().hex)
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        try:
+            with os.fdopen(fd, 'w') as file:
+                json.dump(entries, file)
+            os.replace(temp_path, self.cache_path)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
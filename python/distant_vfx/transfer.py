@@ -0,0 +1,406 @@
+import errno
+import fcntl
+import hashlib
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from .sequences import ImageSequence
+
+# Errors meaning a zero-copy syscall is not supported for this pair of files (e.g. across filesystems on older
+# kernels, or on filesystems without support), in which case we fall back to the next copy method.
+_UNSUPPORTED_ERRNOS = (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP)
+
+# ioctl request number for cloning a whole file (linux/fs.h), supported by e.g. XFS, Btrfs and some NFS 4.2 servers.
+FICLONE = 0x40049409
+
+LINK_MODES = ('reflink', 'hardlink', 'auto')
+
+# hashlib algorithms with a fixed digest length (hexdigest() of the variable length shake algorithms needs a length)
+HASH_ALGORITHMS = ('md5', 'sha1', 'sha224', 'sha256', 'sha384', 'sha512', 'blake2b', 'blake2s')
+
+
+class TransferStats:
+
+    def __init__(self):
+        self.files = 0
+        self.bytes = 0  # bytes copied; linked and renamed files are counted separately
+        self.linked = 0  # files placed by reflink or hardlink rather than copied
+        self.linked_bytes = 0
+        self.renamed = 0  # files moved by renaming them into place
+        self.errors = []  # list of (path, exception) tuples
+        self.checksums = {}  # {destination path: hex digest}, only populated when hashing
+        self.start_time = time.time()
+        self.end_time = None
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return 'Transferred {} files ({} bytes copied, {} linked ({} bytes), {} renamed) in {:.1f}s at {:.1f} MB/s ' \
+               'with {} errors'.format(self.files, self.bytes, self.linked, self.linked_bytes, self.renamed,
+                                       self.elapsed, self.throughput / 1048576, len(self.errors))
+
+    @property
+    def elapsed(self):
+        end_time = self.end_time if self.end_time is not None else time.time()
+        return end_time - self.start_time
+
+    @property
+    def throughput(self):
+        """
+        :return: The average copy rate in bytes per second, not counting linked or renamed files.
+        """
+        elapsed = self.elapsed
+        return self.bytes / elapsed if elapsed > 0 else 0.0
+
+    def add_file(self, dest, num_bytes, checksum=None, linked=False, renamed=False):
+        with self._lock:
+            self.files += 1
+            if linked:
+                self.linked += 1
+                self.linked_bytes += num_bytes
+            elif renamed:
+                self.renamed += 1
+            else:
+                self.bytes += num_bytes
+            if checksum is not None:
+                self.checksums[dest] = checksum
+
+    def add_error(self, path, exception):
+        with self._lock:
+            self.errors.append((path, exception))
+
+
+class TransferEngine:
+
+    def __init__(self, max_workers=8, hash_algorithm=None, buffer_size=8388608, link_mode=None):
+        """
+        Copies files and directory trees in-process on a pool of worker threads.
+        :param max_workers: The number of files to copy concurrently.
+        :param hash_algorithm: Optional algorithm name from HASH_ALGORITHMS (e.g. 'md5'). If set, each file is hashed
+                               as it is copied, then the written copy is read back and hashed again. A file whose
+                               digests differ fails with an IOError, and the digests of verified files are recorded
+                               in TransferStats.checksums. If not set, files are copied with os.copy_file_range or
+                               os.sendfile where available so data does not pass through user space.
+        :param buffer_size: The read size (bytes) used when copying through user space.
+        :param link_mode: Optional placement mode for items whose source and destination are on the same device.
+                          'reflink' clones files (FICLONE), 'hardlink' hard links them, and 'auto' tries a reflink
+                          then a hard link. Files fall back to a real copy if linking fails or the devices differ.
+                          Linked files are not hashed. Only use hard links for files that will not be modified in
+                          place, since both paths share the same data.
+        """
+        if link_mode is not None and link_mode not in LINK_MODES:
+            raise ValueError('Invalid link mode: {} (must be one of {})'.format(link_mode, LINK_MODES))
+        if hash_algorithm is not None and hash_algorithm not in HASH_ALGORITHMS:
+            raise ValueError('Invalid hash algorithm: {} (must be one of {})'.format(hash_algorithm, HASH_ALGORITHMS))
+        self.max_workers = max_workers
+        self.hash_algorithm = hash_algorithm
+        self.buffer_size = buffer_size
+        self.link_mode = link_mode
+
+    def transfer(self, items, move=False, on_item_complete=None):
+        """
+        Copy (or move) a list of files and/or directories, like `cp -r src dest_dir` (or `mv src dest_dir`) per item.
+        :param items: A list of (source, destination directory) tuples. A source path ends up at
+                      destination directory/basename(source). A source ImageSequence has its frames placed directly in
+                      the destination directory.
+        :param move: If True, items are renamed into place where possible and otherwise copied then removed.
+        :param on_item_complete: Optional callback, called as on_item_complete(index, success, checksums) for each
+                                 entry in items once all of its files are done, where checksums is a dict formatted
+                                 as {destination path: hex digest} of the item's hashed files. Calls happen in item
+                                 order on the calling thread.
+        :return: A TransferStats instance for the whole job.
+        """
+        stats = TransferStats()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            jobs = []
+            for index, (src, dest_dir) in enumerate(items):
+                if isinstance(src, ImageSequence):
+                    src_path = src.parent_path
+                    try:
+                        os.makedirs(dest_dir, exist_ok=True)
+                    except OSError as e:
+                        stats.add_error(src_path, e)
+                        jobs.append((index, False, [], []))
+                        continue
+                    tasks = [(os.path.join(src.parent_path, frame), os.path.join(dest_dir, frame))
+                             for frame in src.frames]
+                    if move and self._is_same_device(src_path, dest_dir):
+                        renamed = [self._try_rename(task_src, task_dest, stats) for task_src, task_dest in tasks]
+                        jobs.append((index, all(renamed), [], []))
+                        continue
+                else:
+                    src_path = src
+                    dest = os.path.join(dest_dir, os.path.basename(os.path.normpath(src)))
+                    renamed = self._try_rename(src, dest, stats) if move else None
+                    if renamed is not None:
+                        jobs.append((index, renamed, [], []))
+                        continue
+                    try:
+                        tasks = self._plan_item(src, dest)
+                    except OSError as e:
+                        stats.add_error(src, e)
+                        jobs.append((index, False, [], []))
+                        continue
+                link = self.link_mode is not None and self._is_same_device(src_path, dest_dir)
+                futures = [executor.submit(self._copy_file_task, task_src, task_dest, stats, link)
+                           for task_src, task_dest in tasks]
+                jobs.append((index, src, tasks, futures))
+
+            for index, src, tasks, futures in jobs:
+                if isinstance(src, bool):  # renamed into place, or failed before copying
+                    item_ok = src
+                else:
+                    item_ok = all([future.result() for future in futures])
+                    if move and item_ok:
+                        self._remove(src, stats)
+                if on_item_complete is not None:
+                    checksums = {task_dest: stats.checksums[task_dest] for _, task_dest in tasks
+                                 if task_dest in stats.checksums}
+                    on_item_complete(index, item_ok, checksums)
+        stats.end_time = time.time()
+        return stats
+
+    @staticmethod
+    def _remove(item, stats):
+        if isinstance(item, ImageSequence):
+            paths = [os.path.join(item.parent_path, frame) for frame in item.frames]
+        else:
+            paths = [item]
+        for path in paths:
+            try:
+                if os.path.isdir(path) and not os.path.islink(path):
+                    shutil.rmtree(path)
+                else:
+                    os.remove(path)
+            except OSError as e:
+                stats.add_error(path, e)
+
+    @staticmethod
+    def _is_same_device(src, dest_dir):
+        try:
+            return os.stat(src).st_dev == os.stat(dest_dir).st_dev
+        except OSError:
+            return False
+
+    @staticmethod
+    def _try_rename(src, dest, stats):
+        # Returns True if renamed, False on error, or None if the item is on another device and must be copied.
+        try:
+            os.rename(src, dest)
+        except OSError as e:
+            if e.errno == errno.EXDEV:
+                return None
+            stats.add_error(src, e)
+            return False
+        stats.add_file(dest, 0, renamed=True)
+        return True
+
+    @staticmethod
+    def _plan_item(src, dest):
+        """
+        Create the destination directory tree for an item and list the files that need copying. Symlinks, whether
+        the item itself or inside a directory, are recreated as symlinks, as `cp -r` does.
+        :param src: The source file, directory or symlink.
+        :param dest: The destination path for the item.
+        :return: A list of (source file, destination file) tuples.
+        """
+        if os.path.islink(src):
+            if not os.path.lexists(dest):
+                os.symlink(os.readlink(src), dest)
+            return []
+        if not os.path.isdir(src):
+            return [(src, dest)]
+
+        tasks = []
+        stack = [(src, dest)]
+        while stack:
+            src_dir, dest_dir = stack.pop()
+            os.makedirs(dest_dir, exist_ok=True)
+            with os.scandir(src_dir) as entries:
+                for entry in entries:
+                    entry_dest = os.path.join(dest_dir, entry.name)
+                    if entry.is_symlink():
+                        if not os.path.lexists(entry_dest):
+                            os.symlink(os.readlink(entry.path), entry_dest)
+                    elif entry.is_dir():
+                        stack.append((entry.path, entry_dest))
+                    else:
+                        tasks.append((entry.path, entry_dest))
+        return tasks
+
+    def _copy_file_task(self, src, dest, stats, link=False):
+        try:
+            if _is_same_file(src, dest):
+                # Already linked into place, e.g. by an interrupted run. Writing to it would write to the source
+                stats.add_file(dest, os.stat(dest).st_size, linked=True)
+                return True
+            if link:
+                num_bytes = self.link_file(src, dest)
+                if num_bytes is not None:
+                    stats.add_file(dest, num_bytes, linked=True)
+                    return True
+            num_bytes, checksum = self.copy_file(src, dest)
+        except Exception as e:
+            stats.add_error(src, e)
+            return False
+        stats.add_file(dest, num_bytes, checksum)
+        return True
+
+    def link_file(self, src, dest):
+        """
+        Place a file by reflink and/or hard link, according to link_mode. The link is made under a temporary name and
+        renamed over any existing destination, which is never opened for writing (it may be a link of the source).
+        :param src: The source file path.
+        :param dest: The destination file path.
+        :return: The size of the file in bytes, or None if the file could not be linked (and should be copied).
+        """
+        if self.link_mode in ('reflink', 'auto'):
+            num_bytes = self._reflink(src, dest)
+            if num_bytes is not None:
+                return num_bytes
+        if self.link_mode in ('hardlink', 'auto'):
+            temp_path = _get_temp_path(dest)
+            try:
+                os.link(src, temp_path)
+            except OSError:
+                return None
+            _replace(temp_path, dest)
+            return os.stat(dest).st_size
+        return None
+
+    @staticmethod
+    def _reflink(src, dest):
+        temp_path = _get_temp_path(dest)
+        try:
+            with open(src, 'rb') as fsrc, open(temp_path, 'xb') as fdst:
+                try:
+                    fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+                except OSError:
+                    cloned = False
+                else:
+                    cloned = True
+            if not cloned:
+                os.remove(temp_path)
+                return None
+            shutil.copymode(src, temp_path)
+        except BaseException:
+            _remove_quietly(temp_path)
+            raise
+        _replace(temp_path, dest)
+        return os.stat(dest).st_size
+
+    def copy_file(self, src, dest):
+        """
+        Copy a single file, preserving its permission bits. The file is written under a temporary name and renamed
+        over any existing destination, which is never opened for writing (it may be a link of the source).
+        :param src: The source file path.
+        :param dest: The destination file path.
+        :return: A tuple of (bytes copied, hex digest or None).
+        """
+        checksum = None
+        temp_path = _get_temp_path(dest)
+        try:
+            with open(src, 'rb') as fsrc, open(temp_path, 'xb') as fdst:
+                size = os.fstat(fsrc.fileno()).st_size
+                if self.hash_algorithm:
+                    num_bytes, checksum = self._copy_with_hash(fsrc, fdst)
+                else:
+                    num_bytes = self._copy_fd(fsrc, fdst, size)
+            if num_bytes != size:
+                raise IOError('Copied {} of {} bytes: {}'.format(num_bytes, size, src))
+            if checksum is not None and self._hash_file(temp_path) != checksum:
+                raise IOError('Checksum mismatch after copying: {}'.format(src))
+            shutil.copymode(src, temp_path)
+        except BaseException:
+            _remove_quietly(temp_path)
+            raise
+        _replace(temp_path, dest)
+        return num_bytes, checksum
+
+    def _copy_with_hash(self, fsrc, fdst):
+        digest = hashlib.new(self.hash_algorithm)
+        buffer = bytearray(self.buffer_size)
+        view = memoryview(buffer)
+        num_bytes = 0
+        while True:
+            n = fsrc.readinto(buffer)
+            if not n:
+                break
+            digest.update(view[:n])
+            fdst.write(view[:n])
+            num_bytes += n
+        return num_bytes, digest.hexdigest()
+
+    def _hash_file(self, path):
+        digest = hashlib.new(self.hash_algorithm)
+        buffer = bytearray(self.buffer_size)
+        view = memoryview(buffer)
+        with open(path, 'rb') as file:
+            while True:
+                n = file.readinto(buffer)
+                if not n:
+                    break
+                digest.update(view[:n])
+        return digest.hexdigest()
+
+    def _copy_fd(self, fsrc, fdst, size):
+        src_fd, dst_fd = fsrc.fileno(), fdst.fileno()
+        if hasattr(os, 'copy_file_range'):
+            num_bytes = self._copy_zero_copy(
+                lambda offset, count: os.copy_file_range(src_fd, dst_fd, count, offset, offset), size)
+            if num_bytes is not None:
+                return num_bytes
+        if hasattr(os, 'sendfile'):
+            num_bytes = self._copy_zero_copy(lambda offset, count: os.sendfile(dst_fd, src_fd, offset, count), size)
+            if num_bytes is not None:
+                return num_bytes
+        shutil.copyfileobj(fsrc, fdst, self.buffer_size)
+        return fdst.tell()
+
+    @staticmethod
+    def _copy_zero_copy(copy_func, size):
+        # Returns None (before anything was written) if the syscall is not supported for these files.
+        num_bytes = 0
+        try:
+            while num_bytes < size:
+                n = copy_func(num_bytes, min(size - num_bytes, 1073741824))
+                if n == 0:
+                    break
+                num_bytes += n
+        except OSError as e:
+            if num_bytes == 0 and e.errno in _UNSUPPORTED_ERRNOS:
+                return None
+            raise
+        return num_bytes
+
+
+def _is_same_file(src, dest):
+    try:
+        return os.path.samefile(src, dest)
+    except OSError:  # dest does not exist yet
+        return False
+
+
+def _get_temp_path(dest):
+    # A unique name in the destination directory, so the finished file can be renamed into place
+    return os.path.join(os.path.dirname(dest), '.{}.{}.tmp'.format(os.path.basename(dest), uuid.uuid4().hex))
+
+
+def _replace(temp_path, dest):
+    try:
+        os.replace(temp_path, dest)
+    except BaseException:
+        _remove_quietly(temp_path)
+        raise
+    if os.path.lexists(temp_path):  # rename does nothing if both names are links of the same file
+        _remove_quietly(temp_path)
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
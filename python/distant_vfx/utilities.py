@@ -1,5 +1,5 @@
 import os
-from collections import defaultdict
+from array import array
 from functools import wraps
 
 from .sequences import ImageSequence
@@ -15,29 +15,60 @@ def dict_items_to_str(func):
     return wrapper
 
 
-def make_basename_map_from_file_path_list(file_path_list):
-    basename_map = defaultdict(lambda: defaultdict(list))
-    for path in file_path_list:
-        filename = os.path.basename(path)
+def iter_files_and_sequences(file_paths):
+    """
+    Group numbered frames (prefix.frame.ext, with a legal frame extension) into image sequences as paths stream in.
+    Frames are grouped by (directory, prefix, padding, extension), so frames that only share a basename, or that sit in
+    different directories, are not merged. Unpadded frame numbers that outgrow the padding (e.g. 999 to 1000) stay in
+    the same sequence. Other files are yielded straight away, and the sequences in a directory are yielded once the
+    paths move on to another directory, so only one directory's frame numbers are held in memory. Paths should be
+    grouped by directory, as os.walk and os.scandir produce them.
+    :param file_paths: An iterable of file paths.
+    :return: A generator of file paths and ImageSequence instances. A lone frame is yielded as a file path.
+    """
+    current_dir = None
+    groups = {}  # {(prefix, padding, extension): [array of frame numbers, whether any frame has a leading zero]}
+    for path in file_paths:
+        parent_dir, filename = os.path.split(path)
+        if parent_dir != current_dir:
+            yield from iter_sequences_from_frame_groups(current_dir, groups)
+            current_dir = parent_dir
+            groups = {}
+
         split = filename.split('.')
-        basename, extension = split[0], split[-1]
-        basename_map[basename][extension].append(path)
-    return basename_map
-
-
-def parse_files_from_basename_map(basename_map):
-    paths = []
-    for basename, ext_map in basename_map.items():
-        for ext, file_list in ext_map.items():
-            num_files = len(file_list)
-            ext_with_dot = ext + '.'
-            if num_files > 1 and ext_with_dot in LEGAL_FRAME_EXTENSIONS:
-                frame_filenames = [os.path.basename(path) for path in file_list]
-                parent_dir = os.path.dirname(file_list[0])
-                seq = ImageSequence(frame_filenames, parent_dir)
-                # path = os.path.join(parent_dir, seq.name)  # TODO: DELETE ME
-                # paths.append(seq.path)
-                paths.append(seq)
-            else:
-                paths += file_list
-    return paths
+        if len(split) < 3 or '.' + split[-1] not in LEGAL_FRAME_EXTENSIONS or not split[-2].isdigit():
+            yield path
+            continue
+        frame = split[-2]
+        group = groups.get(('.'.join(split[:-2]), len(frame), split[-1]))
+        if group is None:
+            group = groups[('.'.join(split[:-2]), len(frame), split[-1])] = [array('i'), False]
+        group[0].append(int(frame))
+        group[1] = group[1] or (len(frame) > 1 and frame[0] == '0')
+    yield from iter_sequences_from_frame_groups(current_dir, groups)
+
+
+def iter_sequences_from_frame_groups(parent_dir, groups):
+    """
+    Turn the frame groups of one directory into sequences. Frame numbers without a leading zero are valid at any
+    smaller padding, so they are folded into the group with the next smallest padding.
+    :param parent_dir: The directory containing the frames.
+    :param groups: A dict formatted as {(prefix, padding, extension): [array('i') of frame numbers, whether any frame
+                   has a leading zero]}
+    :return: A generator of ImageSequence instances, and file paths for lone frames.
+    """
+    merged = []  # list of [prefix, padding, extension, frame numbers]
+    for prefix, padding, extension in sorted(groups, key=lambda x: (x[0], x[2], x[1])):
+        numbers, is_padded = groups[(prefix, padding, extension)]
+        last = merged[-1] if merged else None
+        if last is not None and last[0] == prefix and last[2] == extension and not is_padded:
+            last[3].extend(numbers)
+        else:
+            merged.append([prefix, padding, extension, numbers])
+
+    for prefix, padding, extension, numbers in merged:
+        if len(numbers) > 1:
+            yield ImageSequence.from_frame_numbers(numbers, parent_dir, prefix, extension, padding)
+        else:
+            frame_name = '{}.{:0{}d}.{}'.format(prefix, numbers[0], padding, extension)
+            yield os.path.join(parent_dir, frame_name)
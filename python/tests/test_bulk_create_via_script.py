@@ -0,0 +1,73 @@
+import unittest
+from unittest import mock
+
+import requests
+from fmrest import Server
+from fmrest.exceptions import BadJSON
+
+from distant_vfx.filemaker import CloudServerWrapper
+from distant_vfx.filemaker_standin import FileMakerStandIn, bulk_create_script
+from distant_vfx.retry import RetryPolicy
+
+DATABASE = 'test_admin'
+LAYOUT = 'Transfer Data'
+SCRIPT = 'Bulk Create Records'
+
+
+class BulkCreateViaScriptTest(unittest.TestCase):
+
+    def setUp(self):
+        self.standin = FileMakerStandIn().start()
+        self.standin.register_script(SCRIPT, bulk_create_script)
+        self.fmp = CloudServerWrapper(url=self.standin.url, user='test', password='test', database=DATABASE,
+                                      layout=LAYOUT, server_type='server', verify_ssl=self.standin.cert_path,
+                                      token_cache=False, query_cache=False, retry_policy=RetryPolicy(base_delay=0.0))
+        self.fmp.login()
+        self.records = [{'PublishedFileID': str(i), 'Filename': 'dst010_comp_v001.{}.exr'.format(i)}
+                        for i in range(1001, 1021)]
+
+    def tearDown(self):
+        self.fmp.logout()
+        self.standin.stop()
+
+    def _lose_first_response(self):
+        # Run the script on FileMaker, but fail the first request as if its response was lost on the way back
+        perform_script = Server.perform_script
+        calls = []
+
+        def lose_response(server, *args, **kwargs):
+            result = perform_script(server, *args, **kwargs)
+            calls.append(result)
+            if len(calls) == 1:
+                response = requests.Response()
+                response.status_code = 502
+                raise BadJSON(ValueError('Expecting value'), response)
+            return result
+        return mock.patch.object(Server, 'perform_script', autospec=True, side_effect=lose_response)
+
+    def test_unkeyed_script_call_is_not_retried(self):
+        with self._lose_first_response(), self.assertRaises(BadJSON) as context:
+            self.fmp.bulk_create_via_script(LAYOUT, self.records, script_name=SCRIPT, max_param_size=1000)
+        self.assertEqual(context.exception.created_primary_keys, [])
+        self.assertEqual(context.exception.failed_records, self.records)
+        created = len(self.standin.get_records(DATABASE, LAYOUT))
+        self.assertTrue(0 < created < len(self.records))  # only the first chunk ran, once
+
+    def test_keyed_script_call_is_retried_without_duplicates(self):
+        with self._lose_first_response():
+            primary_keys = self.fmp.bulk_create_via_script(LAYOUT, self.records, key_field='PublishedFileID',
+                                                           script_name=SCRIPT, max_param_size=1000)
+        records = self.standin.get_records(DATABASE, LAYOUT)
+        self.assertEqual([record['PublishedFileID'] for record in records],
+                         [record['PublishedFileID'] for record in self.records])
+        self.assertEqual(primary_keys, [record['PrimaryKey'] for record in records])
+
+    def test_records_without_a_key_are_rejected(self):
+        with self.assertRaises(ValueError):
+            self.fmp.bulk_create_via_script(LAYOUT, self.records + [{'Filename': 'dst010_comp_v002.1001.exr'}],
+                                            key_field='PublishedFileID', script_name=SCRIPT)
+        self.assertEqual(self.standin.get_records(DATABASE, LAYOUT), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
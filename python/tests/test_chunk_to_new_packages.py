@@ -0,0 +1,145 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from distant_vfx.filesystem import TransferCostModel
+from distant_vfx.jobs import chunk_to_new_packages
+from distant_vfx.journal import ChunkJournal
+
+
+class _ChunkJobTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.source_root = os.path.join(self.temp_dir, 'incoming')
+        self.dest_dir = os.path.join(self.temp_dir, 'to_mrx')
+        self.journal_path = os.path.join(self.temp_dir, 'chunk.journal')
+        os.makedirs(self.dest_dir)
+        self.sources = {}
+        for shot in ('dst010', 'dst020', 'dst030'):
+            shot_dir = os.path.join(self.source_root, shot)
+            os.makedirs(shot_dir)
+            for frame in range(1001, 1004):
+                path = os.path.join(shot_dir, '{}.{}.exr'.format(shot, frame))
+                data = '{} frame {}'.format(shot, frame).encode() * 100
+                with open(path, 'wb') as file:
+                    file.write(data)
+                self.sources[path] = data
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+
+class ResumeHardlinkJobTest(_ChunkJobTestCase):
+
+    def test_resume_leaves_linked_sources_unchanged(self):
+        # Interrupt the job once its first item is recorded, after the other items' files were already linked
+        record_item = chunk_to_new_packages._record_item
+
+        def interrupt(journal, *args):
+            record_item(journal, *args)
+            if journal.completed:
+                raise KeyboardInterrupt
+
+        with mock.patch.object(chunk_to_new_packages, '_record_item', interrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                chunk_to_new_packages.main(self.dest_dir, [self.source_root], link_mode='hardlink',
+                                           journal_path=self.journal_path)
+
+        journal = ChunkJournal.load(self.journal_path)
+        num_items = sum(len(bin_items) for bin_items in journal.plan['bins'])
+        self.assertLess(len(journal.completed), num_items)
+
+        chunk_to_new_packages.resume(self.journal_path)
+
+        for path, data in self.sources.items():
+            with open(path, 'rb') as file:
+                self.assertEqual(file.read(), data, path)
+        journal = ChunkJournal.load(self.journal_path)
+        self.assertEqual(len(journal.completed), num_items)
+        package_path = journal.package_paths[0]
+        for path in self.sources:
+            dest = os.path.join(package_path, os.path.relpath(path, self.source_root))
+            self.assertTrue(os.path.samefile(path, dest), dest)
+
+
+class VerifyChunkJobTest(_ChunkJobTestCase):
+
+    def test_resumed_job_records_digests_of_every_file(self):
+        record_item = chunk_to_new_packages._record_item
+
+        def interrupt(journal, *args):
+            record_item(journal, *args)
+            if journal.completed:
+                raise KeyboardInterrupt
+
+        with mock.patch.object(chunk_to_new_packages, '_record_item', interrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                chunk_to_new_packages.main(self.dest_dir, [self.source_root], journal_path=self.journal_path,
+                                           hash_algorithm='md5')
+        chunk_to_new_packages.resume(self.journal_path)
+
+        journal = ChunkJournal.load(self.journal_path)
+        package_path = journal.package_paths[0]
+        expected = {os.path.join(package_path, os.path.relpath(path, self.source_root)): hashlib.md5(data).hexdigest()
+                    for path, data in self.sources.items()}
+        self.assertEqual(journal.checksums, expected)
+
+
+class SplitSequencesJobTest(_ChunkJobTestCase):
+
+    def test_symlinks_in_split_folders_are_packaged(self):
+        link_path = os.path.join(self.source_root, 'dst010', 'dst010_plate.exr')
+        os.symlink('dst010.1001.exr', link_path)
+        # A per-file cost far above the bin capacity splits every shot folder into its files
+        cost_model = TransferCostModel(bytes_per_second=1073741824, seconds_per_file=60)
+        chunk_to_new_packages.main(self.dest_dir, [self.source_root], journal_path=self.journal_path,
+                                   split_sequences=True, cost_model=cost_model)
+
+        journal = ChunkJournal.load(self.journal_path)
+        packaged_links = [os.path.join(dir_path, name) for package_path in journal.package_paths.values()
+                          for dir_path, _, filenames in os.walk(package_path) for name in filenames
+                          if os.path.islink(os.path.join(dir_path, name))]
+        self.assertEqual(len(packaged_links), 1)
+        self.assertEqual(os.readlink(packaged_links[0]), 'dst010.1001.exr')
+
+
+class ResumeStreamingJobTest(_ChunkJobTestCase):
+
+    def test_resume_continues_an_interrupted_scan(self):
+        # A per-file cost far above the bin capacity puts each shot in a bin of its own, sealed as soon as it is sized
+        cost_model = TransferCostModel(bytes_per_second=1073741824, seconds_per_file=60)
+        copy_chunk = chunk_to_new_packages._copy_chunk
+        calls = []
+
+        def interrupt(*args, **kwargs):
+            calls.append(args)
+            if len(calls) == 2:
+                raise KeyboardInterrupt
+            copy_chunk(*args, **kwargs)
+
+        with mock.patch.object(chunk_to_new_packages, '_copy_chunk', interrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                chunk_to_new_packages.main(self.dest_dir, [self.source_root], journal_path=self.journal_path,
+                                           streaming=True, cost_model=cost_model)
+        journal = ChunkJournal.load(self.journal_path)
+        self.assertFalse(journal.plan_complete)
+        self.assertEqual(len(journal.planned_paths), 2)
+
+        chunk_to_new_packages.resume(self.journal_path)
+
+        journal = ChunkJournal.load(self.journal_path)
+        self.assertTrue(journal.plan_complete)
+        self.assertEqual(len(journal.plan['bins']), 3)
+        copied = []
+        for package_path in journal.package_paths.values():
+            for dir_path, _, filenames in os.walk(package_path):
+                copied += [os.path.relpath(os.path.join(dir_path, name), package_path) for name in filenames]
+        self.assertEqual(sorted(copied), sorted(os.path.relpath(path, self.source_root) for path in self.sources))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import unittest
+from unittest import mock
+
+from distant_vfx import filemaker
+from distant_vfx.filemaker import CloudServerWrapper
+from distant_vfx.filemaker_standin import FileMakerStandIn, record_fields_script
+
+DATABASE = 'test_admin'
+LAYOUT = 'Images'
+SCRIPT = 'Record Fields'
+
+
+class CreateRecordAndFetchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.standin = FileMakerStandIn().start()
+        self.standin.register_script(SCRIPT, record_fields_script)
+        self.fmp = CloudServerWrapper(url=self.standin.url, user='test', password='test', database=DATABASE,
+                                      layout=LAYOUT, server_type='server', verify_ssl=self.standin.cert_path,
+                                      token_cache=False, query_cache=False)
+        self.fmp.login()
+
+    def tearDown(self):
+        self.fmp.logout()
+        self.standin.stop()
+
+    def test_fields_are_read_by_the_script(self):
+        with mock.patch.object(filemaker, 'FMP_RECORD_FIELDS_SCRIPT', SCRIPT):
+            record_id, values = self.fmp.create_record_and_fetch({'Filename': 'dst010.jpg'}, ['PrimaryKey'])
+        self.assertEqual(self.standin.stats['get'], 0)
+        self.assertEqual(values['PrimaryKey'], self.standin.get_records(DATABASE, LAYOUT)[0]['PrimaryKey'])
+
+    def test_missing_script_result_falls_back_to_get_record(self):
+        with mock.patch.object(filemaker, 'FMP_RECORD_FIELDS_SCRIPT', SCRIPT), \
+                mock.patch.object(CloudServerWrapper, 'last_script_result', new_callable=mock.PropertyMock,
+                                  return_value={}):
+            record_id, values = self.fmp.create_record_and_fetch({'Filename': 'dst010.jpg'}, ['PrimaryKey'])
+        self.assertEqual(self.standin.stats['get'], 1)
+        self.assertEqual(values['PrimaryKey'], self.standin.get_records(DATABASE, LAYOUT)[0]['PrimaryKey'])
+
+
+if __name__ == '__main__':
+    unittest.main()
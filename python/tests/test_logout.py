@@ -0,0 +1,43 @@
+import unittest
+from unittest import mock
+
+import requests
+from fmrest import Server
+from fmrest.exceptions import BadJSON
+
+from distant_vfx.filemaker import CloudServerWrapper
+from distant_vfx.filemaker_standin import FileMakerStandIn
+from distant_vfx.retry import RetryPolicy
+
+
+class LogoutTest(unittest.TestCase):
+
+    def setUp(self):
+        self.standin = FileMakerStandIn().start()
+        self.fmp = CloudServerWrapper(url=self.standin.url, user='test', password='test', database='test_admin',
+                                      layout='Versions', server_type='server', verify_ssl=self.standin.cert_path,
+                                      token_cache=False, query_cache=False, retry_policy=RetryPolicy(base_delay=0.0))
+        self.fmp.login()
+
+    def tearDown(self):
+        self.standin.stop()
+
+    def test_failed_logout_is_not_retried_with_a_cleared_token(self):
+        logout = Server.logout
+
+        def lose_response(server):
+            logout(server)  # clears the token before sending the request
+            response = requests.Response()
+            response.status_code = 502
+            raise BadJSON(ValueError('Expecting value'), response)
+
+        with mock.patch.object(Server, 'logout', autospec=True, side_effect=lose_response) as server_logout:
+            with self.assertRaises(BadJSON):
+                self.fmp.logout()
+            self.assertTrue(self.fmp.logout())  # already logged out, so nothing is sent
+        self.assertEqual(server_logout.call_count, 1)
+        self.assertEqual(self.standin.stats['logout'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from distant_vfx.filemaker_standin import FileMakerStandIn
+from distant_vfx.outbox import Outbox, OutboxFlusher, ref
+
+DATABASE = 'test_admin'
+
+
+class OutboxFlusherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.outbox = Outbox(os.path.join(self.temp_dir, 'outbox.sqlite'), base_delay=0.0)
+        self.standin = FileMakerStandIn().start()
+        self.emails = []
+
+    def tearDown(self):
+        self.standin.stop()
+        shutil.rmtree(self.temp_dir)
+
+    def _flusher(self):
+        return OutboxFlusher(self.outbox, send_email=self._send_email, url=self.standin.url, user='test',
+                             password='test', server_type='server', verify_ssl=self.standin.cert_path,
+                             token_cache=False)
+
+    def _send_email(self, recipients, subject, contents):
+        # The report must only go out once the package's writes are in FileMaker
+        self.emails.append((recipients, subject, len(self.standin.get_records(DATABASE, 'Transfer Data'))))
+
+    def _queue_package(self):
+        with self.outbox.batch('dst_ih_20260101', DATABASE) as batch:
+            batch.create('Transfer Log', {'package': 'dst_ih_20260101'}, fields=['PrimaryKey'],
+                         find=[{'package': 'dst_ih_20260101'}], ref='transfer_log')
+            for published_file_id in ('101', '102'):
+                batch.create('Transfer Data', {'PublishedFileID': published_file_id,
+                                               'Foriegnkey': ref('transfer_log', 'PrimaryKey')},
+                             key_fields=['PublishedFileID', 'Foriegnkey'])
+            batch.email(['vfx@example.com'], 'Report', 'contents')
+
+    def test_email_sent_after_writes_are_flushed(self):
+        self._queue_package()
+        with self._flusher() as flusher:
+            self.assertEqual(flusher.flush(), 4)
+        self.assertEqual(self.emails, [(['vfx@example.com'], 'Report', 2)])
+        self.assertEqual(self.outbox.counts(), {'done': 4})
+
+    def test_retried_transfer_data_create_is_not_duplicated(self):
+        # A create that reached FileMaker but was not marked done, e.g. the flusher died before recording it
+        transfer_log_id = self.standin.add_record(DATABASE, 'Transfer Log', {'package': 'dst_ih_20260101'})
+        transfer_log_key = self.standin.get_records(DATABASE, 'Transfer Log')[transfer_log_id - 1]['PrimaryKey']
+        self.standin.add_record(DATABASE, 'Transfer Data', {'PublishedFileID': '101', 'Foriegnkey': transfer_log_key})
+        self._queue_package()
+        with self._flusher() as flusher:
+            flusher.flush()
+        records = self.standin.get_records(DATABASE, 'Transfer Data')
+        self.assertEqual(sorted(record['PublishedFileID'] for record in records), ['101', '102'])
+        self.assertEqual(len(self.emails), 1)
+
+    def test_email_write_without_send_email_is_retried(self):
+        self._queue_package()
+        with OutboxFlusher(self.outbox, url=self.standin.url, user='test', password='test', server_type='server',
+                           verify_ssl=self.standin.cert_path, token_cache=False) as flusher:
+            self.assertEqual(flusher.flush(), 3)
+        self.assertEqual(self.outbox.counts(), {'done': 3, 'pending': 1})
+        with self._flusher() as flusher:
+            self.assertEqual(flusher.flush(), 1)
+        self.assertEqual(len(self.emails), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,25 @@
+import unittest
+from unittest import mock
+
+from fmrest.exceptions import FileMakerError
+
+from distant_vfx import screening
+from distant_vfx.screening import FastFindMovie
+
+
+class FastFindMovieTest(unittest.TestCase):
+
+    def test_no_matching_versions_falls_back_to_rv_plate(self):
+        fmp = mock.MagicMock()
+        fmp.__enter__.return_value = fmp
+        fmp.find.side_effect = FileMakerError(401, 'No records match the request')
+        fmp.last_error = 401
+        with mock.patch.object(screening, 'CloudServerWrapper', return_value=fmp), \
+                mock.patch.object(screening.subprocess, 'Popen') as popen, self.assertRaises(SystemExit):
+            popen.return_value.communicate.return_value = ('', '')
+            FastFindMovie('dst010').run()
+        self.assertEqual(popen.call_args[0][0], ['rvPlate', 'dst010'])
+
+
+if __name__ == '__main__':
+    unittest.main()
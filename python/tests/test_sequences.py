@@ -0,0 +1,20 @@
+import unittest
+
+from distant_vfx.sequences import ImageSequence
+
+
+class ImageSequenceTest(unittest.TestCase):
+
+    def test_missing_frames_are_found_between_runs(self):
+        frame_numbers = [1005, 1001, 1002, 1008, 1002]
+        sequence = ImageSequence.from_frame_numbers(frame_numbers, '/plates', 'dst010_plate', 'exr', 4)
+        self.assertEqual(sequence.get_gaps(), [(1003, 1004), (1006, 1007)])
+        self.assertEqual(sequence.get_missing_frames(), [1003, 1004, 1006, 1007])
+
+    def test_stray_frame_gap_is_a_single_range(self):
+        sequence = ImageSequence.from_frame_numbers([1, 99999999], '/plates', 'dst010_plate', 'exr', 4)
+        self.assertEqual(sequence.get_gaps(), [(2, 99999998)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import json
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+from unittest import mock
+
+from distant_vfx import filemaker
+from distant_vfx.filemaker import CloudServerWrapper
+from distant_vfx.filemaker_standin import FileMakerStandIn
+from distant_vfx.token_cache import TokenCache
+
+
+class TokenCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.cache = TokenCache(os.path.join(self.temp_dir, 'tokens.json'))
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def _last_used(self, key):
+        with open(self.cache.cache_path) as file:
+            return json.load(file)[key]['last_used']
+
+    def test_cache_file_is_private_and_written_in_one_step(self):
+        with self.cache.lock():
+            self.cache.set('key', 'token')
+        self.assertEqual(stat.S_IMODE(os.stat(self.cache.cache_path).st_mode), 0o600)
+        self.assertEqual(sorted(os.listdir(self.temp_dir)), ['tokens.json', 'tokens.json.lock'])
+
+    def test_token_is_touched_while_in_use(self):
+        with FileMakerStandIn() as standin:
+            fmp = CloudServerWrapper(url=standin.url, user='test', password='test', database='test_admin',
+                                     layout='Versions', token_cache=self.cache, query_cache=False,
+                                     server_type='server', verify_ssl=standin.cert_path)
+            fmp.login()
+            key = fmp._token_key
+            logged_in_at = self._last_used(key)
+            with mock.patch.object(filemaker, '_TOKEN_TOUCH_INTERVAL', 0):
+                fmp.create_record({'Filename': 'dst010_comp_v001'})
+            self.assertGreater(self._last_used(key), logged_in_at)
+            fmp._server.logout()  # close the shared session
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from distant_vfx.transfer import TransferEngine
+
+
+class TransferEngineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.src_dir = os.path.join(self.temp_dir, 'src')
+        self.dest_dir = os.path.join(self.temp_dir, 'dest')
+        os.makedirs(os.path.join(self.src_dir, 'dst010'))
+        os.makedirs(self.dest_dir)
+        self.src_path = os.path.join(self.src_dir, 'dst010', 'dst010_comp_v001.mov')
+        with open(self.src_path, 'wb') as file:
+            file.write(b'mov' * 1000)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_copy_with_a_different_digest_fails(self):
+        engine = TransferEngine(hash_algorithm='sha256')
+        with mock.patch.object(TransferEngine, '_hash_file', return_value='0' * 64):
+            stats = engine.transfer([(self.src_path, self.dest_dir)])
+        self.assertEqual(len(stats.errors), 1)
+        self.assertEqual(os.listdir(self.dest_dir), [])
+
+        stats = engine.transfer([(self.src_path, self.dest_dir)])
+        self.assertEqual(stats.errors, [])
+        self.assertEqual(list(stats.checksums), [os.path.join(self.dest_dir, 'dst010_comp_v001.mov')])
+
+    def test_variable_length_algorithms_are_rejected(self):
+        with self.assertRaises(ValueError):
+            TransferEngine(hash_algorithm='shake_128')
+
+    def test_symlinked_item_is_recreated_as_a_symlink(self):
+        link_path = os.path.join(self.temp_dir, 'dst010_link')
+        os.symlink(os.path.join(self.src_dir, 'dst010'), link_path)
+        stats = TransferEngine().transfer([(link_path, self.dest_dir)])
+        dest = os.path.join(self.dest_dir, 'dst010_link')
+        self.assertTrue(os.path.islink(dest))
+        self.assertEqual(os.readlink(dest), os.readlink(link_path))
+        self.assertEqual((stats.files, stats.errors), (0, []))
+
+
+if __name__ == '__main__':
+    unittest.main()
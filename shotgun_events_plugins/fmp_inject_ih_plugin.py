@@ -5,12 +5,13 @@ from pprint import pformat
 
 import yagmail
 from python.distant_vfx.filemaker import CloudServerWrapper
+from python.distant_vfx.outbox import Outbox, ref
 from python.distant_vfx.utilities import dict_items_to_str
 from python.distant_vfx.video import VideoProcessor
 from python.distant_vfx.constants import SG_INJECT_IH_NAME, SG_INJECT_IH_KEY, FMP_URL, FMP_USERNAME, FMP_PASSWORD, \
     FMP_ADMIN_DB, FMP_VERSIONS_LAYOUT, FMP_TRANSFER_LOG_LAYOUT, FMP_TRANSFER_DATA_LAYOUT, FMP_IMAGES_LAYOUT, \
     EMAIL_USERNAME, EMAIL_PASSWORD, EMAIL_RECIPIENTS, FMP_PROCESS_IMAGE_SCRIPT, THUMBS_BASE_PATH, \
-    FMP_UNFLAG_OMITS_SCRIPT, FMP_PROCESS_TRANSFER_DATA_SCRIPT
+    FMP_UNFLAG_OMITS_SCRIPT, FMP_PROCESS_TRANSFER_DATA_SCRIPT, FMP_OUTBOX_PATH
 
 
 def registerCallbacks(reg):
@@ -62,6 +63,16 @@ def inject(sg, logger, event, args):
     except Exception:
         logger.error(f'Error generating thumbnail for version: {version_name}', exc_info=True)
 
+    # Queue the writes for the outbox flusher instead of waiting on FileMaker, if the outbox is enabled
+    if FMP_OUTBOX_PATH:
+        try:
+            _enqueue_inject(fmp_version, fmp_transfer_log, fmp_transfer_data_dicts, fmp_thumb_data,
+                            _get_mov_path(version_data))
+            logger.info(f'Queued FileMaker writes for event {event.get("id")}')
+        except Exception:
+            logger.error(f'Error queueing FileMaker writes for version: {version_name}', exc_info=True)
+        return
+
     # Inject data to filemaker
     with CloudServerWrapper(url=FMP_URL,
                             user=FMP_USERNAME,
@@ -93,11 +104,9 @@ def inject(sg, logger, event, args):
             transfer_primary_key = transfer_log_records[0].PrimaryKey
         else:
             # If not, create a new transfer log record and get primary key
-            transfer_log_id = _inject_transfer_log(fmp, fmp_transfer_log, logger)
-            if transfer_log_id is None:  # record creation failed
+            transfer_primary_key = _inject_transfer_log(fmp, fmp_transfer_log, logger)
+            if transfer_primary_key is None:  # record creation failed
                 report_transfer_log = False
-            else:
-                transfer_primary_key = _get_transfer_log_primary_key(fmp, transfer_log_id, fmp_transfer_log, logger)
 
         # Inject transfer data records if they exist
         if fmp_transfer_data_dicts:
@@ -115,23 +124,14 @@ def inject(sg, logger, event, args):
         if not image_record or image_record.Width == '?':
 
             # Inject thumb if available
-            img_record_id = None
+            img_primary_key, img_did_upload = None, False
             if thumb_path is not None:
-                img_record_id = _inject_image(fmp, fmp_thumb_data, logger, _get_mov_path(version_data))
-
-            # Check to make sure it injected correctly, if not try again
-            if img_record_id is not None:
-                new_img = fmp.get_record(img_record_id)
-                if new_img.Width == '?':
-                    img_record_id = _inject_image(fmp, fmp_thumb_data, logger, _get_mov_path(version_data))
-
-            # Run process img script
-            if img_record_id is not None and img_record_id != -1:
-                img_primary_key = _get_image_primary_key(fmp, img_record_id, logger)
-                if img_primary_key is not None:
-                    script_res = _run_process_image_script(fmp, img_primary_key, logger)
-            elif img_record_id == -1:
-                pass
+                img_primary_key, img_did_upload = _inject_image(fmp, fmp_thumb_data, logger,
+                                                                _get_mov_path(version_data))
+
+            # Run process img script once the image has uploaded
+            if img_did_upload:
+                script_res = _run_process_image_script(fmp, img_primary_key, logger)
             else:
                 report_img = False
 
@@ -149,6 +149,36 @@ def inject(sg, logger, event, args):
         _send_success_email(version_report, transfer_log_report, transfer_data_report, img_report)
 
 
+def _enqueue_inject(fmp_version, fmp_transfer_log, fmp_transfer_data_dicts, fmp_thumb_data, sg_path_to_movie):
+    # The same writes as inject, queued in the outbox. They are ordered per package, so versions of a package find or
+    # create its transfer log one at a time
+    with Outbox(FMP_OUTBOX_PATH).batch(fmp_transfer_log['package'], FMP_ADMIN_DB) as batch:
+        batch.create(FMP_VERSIONS_LAYOUT, fmp_version, find=[{'Filename': fmp_version['Filename']}])
+        batch.create(FMP_TRANSFER_LOG_LAYOUT, fmp_transfer_log, fields=['PrimaryKey'], find=[fmp_transfer_log],
+                     ref='transfer_log')
+        transfer_primary_key = ref('transfer_log', 'PrimaryKey')
+        if fmp_transfer_data_dicts:
+            for data_dict in fmp_transfer_data_dicts:
+                batch.create(FMP_TRANSFER_DATA_LAYOUT, dict(data_dict, Foriegnkey=transfer_primary_key),
+                             key_fields=['PublishedFileID', 'Foriegnkey'])
+            batch.script(FMP_TRANSFER_DATA_LAYOUT, FMP_PROCESS_TRANSFER_DATA_SCRIPT, param=transfer_primary_key)
+        if fmp_thumb_data is not None:
+            if os.path.exists(fmp_thumb_data.get('Path')):
+                batch.create(FMP_IMAGES_LAYOUT, fmp_thumb_data, fields=['PrimaryKey'], find=[fmp_thumb_data],
+                             missing_if={'Width': '?'}, ref='image')
+                img_was_created = ref('image', 'created')
+                batch.upload(FMP_IMAGES_LAYOUT, ref('image', 'record_id'), 'Image', fmp_thumb_data.get('Path'),
+                             when=img_was_created)
+                batch.script(FMP_IMAGES_LAYOUT, FMP_PROCESS_IMAGE_SCRIPT, param=ref('image', 'PrimaryKey'),
+                             when=img_was_created)
+            else:
+                _update_thumbs_json('/mnt/Plugins/python3.6/config/thumbs.json', sg_path_to_movie)
+        batch.script(FMP_IMAGES_LAYOUT, FMP_UNFLAG_OMITS_SCRIPT)
+        # Report once the writes above have been flushed
+        subject, content = _build_success_email(fmp_version, fmp_transfer_log, fmp_transfer_data_dicts, fmp_thumb_data)
+        batch.email(EMAIL_RECIPIENTS.split(','), subject, content)
+
+
 def _update_thumbs_json(json_file, sg_path_to_movie):
     import json
     try:
@@ -162,7 +192,7 @@ def _update_thumbs_json(json_file, sg_path_to_movie):
         json.dump(data, file)
 
 
-def _send_success_email(version_data, fmp_transfer_log, fmp_transfer_data_dicts, thumb_data):
+def _build_success_email(version_data, fmp_transfer_log, fmp_transfer_data_dicts, thumb_data):
     subject = f'[DISTANT_API] Successful In House data injection at {datetime.datetime.now()}'
     content = 'Shotgun data successfully injected into FileMaker. Please see below for details.\n\n' \
               '<hr>' \
@@ -171,6 +201,11 @@ def _send_success_email(version_data, fmp_transfer_log, fmp_transfer_data_dicts,
               f'<h3>TRANSFER FILES DATA</h3>\n{pformat(fmp_transfer_data_dicts)}\n\n' \
               f'<h3>IMAGE DATA</h3>\n{pformat(thumb_data)}\n\n' \
               f'<hr>'
+    return subject, content
+
+
+def _send_success_email(version_data, fmp_transfer_log, fmp_transfer_data_dicts, thumb_data):
+    subject, content = _build_success_email(version_data, fmp_transfer_log, fmp_transfer_data_dicts, thumb_data)
     yag = yagmail.SMTP(
         user=EMAIL_USERNAME,
         password=EMAIL_PASSWORD
@@ -218,28 +253,19 @@ def _run_process_image_script(fmp, img_primary_key, logger):
     return script_res
 
 
-def _get_image_primary_key(fmp, img_record_id, logger):
-    img_primary_key = None
-    try:
-        img_record = fmp.get_record(img_record_id)
-        img_primary_key = img_record.PrimaryKey
-    except:
-        logger.error(f'Error running process image script for image {img_primary_key}', exc_info=True)
-    return img_primary_key
-
-
 def _inject_image(fmp, fmp_thumb_data, logger, sg_path_to_movie):
-    img_record_id = None
+    # Create the image record and read back its primary key in one request, then upload the thumbnail
+    img_primary_key, img_did_upload = None, False
     try:
-        thumb_file = open(fmp_thumb_data.get('Path'), 'rb')
-        img_record_id = fmp.create_record(fmp_thumb_data)
-        img_did_upload = fmp.upload_container(img_record_id, field_name='Image', file_=thumb_file)
-        thumb_file.close()
+        with open(fmp_thumb_data.get('Path'), 'rb') as thumb_file:
+            img_record_id, img_fields = fmp.create_record_and_fetch(fmp_thumb_data, ['PrimaryKey'])
+            img_primary_key = img_fields['PrimaryKey']
+            img_did_upload = fmp.upload_container(img_record_id, field_name='Image', file_=thumb_file)
     except FileNotFoundError:
         _update_thumbs_json('/mnt/Plugins/python3.6/config/thumbs.json', sg_path_to_movie)
     except:
         logger.error(f'Error injecting thumbnail record: {fmp_thumb_data}', exc_info=True)
-    return img_record_id
+    return img_primary_key, img_did_upload
 
 
 def _check_image_record_exists(fmp, fmp_thumb_data):
@@ -264,25 +290,16 @@ def _inject_transfer_data(fmp, fmp_transfer_data_dicts, transfer_primary_key, lo
     return filename_record_ids
 
 
-def _get_transfer_log_primary_key(fmp, transfer_record_id, fmp_transfer_log, logger):
+def _inject_transfer_log(fmp, fmp_transfer_log, logger):
     transfer_primary_key = None
     try:
-        transfer_record_data = fmp.get_record(transfer_record_id)
-        transfer_primary_key = transfer_record_data.PrimaryKey
+        transfer_record_id, transfer_fields = fmp.create_record_and_fetch(fmp_transfer_log, ['PrimaryKey'])
+        transfer_primary_key = transfer_fields['PrimaryKey']
     except:
         logger.error(f'Error creating transfer log record: {fmp_transfer_log}', exc_info=True)
     return transfer_primary_key
 
 
-def _inject_transfer_log(fmp, fmp_transfer_log, logger):
-    transfer_record_id = None
-    try:
-        transfer_record_id = fmp.create_record(fmp_transfer_log)
-    except:
-        logger.error(f'Error creating transfer log record: {fmp_transfer_log}', exc_info=True)
-    return transfer_record_id
-
-
 def _find_transfer_log(fmp, fmp_transfer_log, logger):
     records = None
     try: